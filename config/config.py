@@ -13,6 +13,9 @@ class Config:
     DB_HOST = os.getenv("DB_HOST", "db") 
     DB_PORT = os.getenv("DB_PORT", "5432")
     DB_NAME = os.getenv("DB_NAME", "petunia_db") 
+    # "postgres" in produzione, "duckdb" per ricerca/backtest senza container
+    DB_BACKEND = os.getenv("DB_BACKEND", "postgres")
+    RESEARCH_DB_PATH = Path(os.getenv("RESEARCH_DB_PATH", "data/research.duckdb"))
 
     # 2. GOOGLE CLOUD
     # Il percorso è fisso perché Docker lo monterà sempre qui
@@ -21,9 +24,32 @@ class Config:
     # IDs Sheets
     UNIVERSE_SHEET_ID = os.getenv("UNIVERSE_SHEET_ID")
     REPORT_SHEET_ID = os.getenv("REPORT_SHEET_ID")
+    # Copia locale dell'Universe: riletta dallo Sheet solo se il file è stato modificato
+    UNIVERSE_CACHE_PATH = Path(os.getenv("UNIVERSE_CACHE_PATH", "data/cache/universe.json"))
     GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
     
     # 3. APP
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+    # 4. CACHE LOCALE
+    # Copia colonnare (Arrow IPC) della tabella ohlc, letta in memory-map dai backtest
+    OHLC_CACHE_PATH = Path(os.getenv("OHLC_CACHE_PATH", "data/cache/ohlc.arrow"))
+
+    # 5. DOWNLOAD DATI DI MERCATO
+    # Sorgente OHLCV: "yahoo" (rete) o "local" (file registrati in LOCAL_MARKET_DATA_DIR)
+    MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "yahoo")
+    LOCAL_MARKET_DATA_DIR = Path(os.getenv("LOCAL_MARKET_DATA_DIR", "data/market"))
+    # Cache su disco dei download grezzi (opt-in: utile a rerun, test e ricerca, non ai run
+    # giornalieri). TTL (secondi) per gli intervalli recenti; ogni voce, anche di storico
+    # consolidato, viene eliminata dopo DOWNLOAD_CACHE_MAX_AGE_DAYS giorni
+    DOWNLOAD_CACHE_ENABLED = os.getenv("DOWNLOAD_CACHE_ENABLED", "false").lower() == "true"
+    DOWNLOAD_CACHE_DIR = Path(os.getenv("DOWNLOAD_CACHE_DIR", "data/cache/downloads"))
+    DOWNLOAD_CACHE_TTL = int(os.getenv("DOWNLOAD_CACHE_TTL", "3600"))
+    DOWNLOAD_CACHE_MAX_AGE_DAYS = int(os.getenv("DOWNLOAD_CACHE_MAX_AGE_DAYS", "30"))
+    # Ticker per richiesta e tentativi per i ticker falliti.
+    # Le richieste in parallelo dipendono dal provider (MarketDataProvider.max_workers):
+    # Yahoo ne esegue una alla volta, yf.download non è rientrante.
+    FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "50"))
+    FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "2"))
+
 config = Config()
\ No newline at end of file
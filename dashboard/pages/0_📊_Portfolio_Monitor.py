@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from dashboard.utils import load_portfolio_data
+from dashboard.utils import load_portfolio_data, load_trades_page, load_equity_history, load_portfolio_state
 
 st.set_page_config(page_title="Portfolio Monitor", page_icon="📈", layout="wide")
 
@@ -11,7 +11,6 @@ st.title("📈 Portfolio Monitor")
 data = load_portfolio_data()
 df_port = data.get('portfolio', pd.DataFrame())
 df_cash = data.get('cash', pd.DataFrame())
-df_trades = data.get('trades', pd.DataFrame())
 
 # Gestione caso vuoto
 cash_val = float(df_cash.iloc[0]['cash']) if not df_cash.empty else 0.0
@@ -74,13 +73,74 @@ with c_table:
 
 st.markdown("---")
 
-# 4. Storico Operazioni (Trade History)
+# 4. Equity Curve & Drawdown (dallo storico giornaliero, nessun replay dei trade)
+st.subheader("📈 Equity Curve")
+df_equity = load_equity_history()
+
+if not df_equity.empty:
+    df_equity['drawdown'] = df_equity['equity'] / df_equity['equity'].cummax() - 1
+
+    c_eq, c_dd = st.columns([2, 1])
+    with c_eq:
+        fig_eq = px.line(df_equity, x='date', y=['equity', 'cash', 'invested'])
+        fig_eq.update_layout(margin=dict(t=0, b=0, l=0, r=0), legend_title_text="")
+        st.plotly_chart(fig_eq, use_container_width=True)
+    with c_dd:
+        fig_dd = px.area(df_equity, x='date', y='drawdown')
+        fig_dd.update_layout(margin=dict(t=0, b=0, l=0, r=0), yaxis_tickformat=".1%")
+        st.plotly_chart(fig_dd, use_container_width=True)
+        st.metric("Max Drawdown", f"{df_equity['drawdown'].min():.2%}")
+else:
+    st.info("Storico equity non ancora disponibile (viene scritto dal daily run).")
+
+st.markdown("---")
+
+# 5. Portafoglio a una data passata (snapshot + coda del log eventi, nessun replay completo)
+st.subheader("🕰️ Portfolio as of")
+as_of_day = st.date_input("Date", value=pd.Timestamp.today().date() - pd.Timedelta(days=30))
+state = load_portfolio_state((pd.Timestamp(as_of_day) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)).to_pydatetime())
+
+if state is None:
+    st.info("Nessuno snapshot del portafoglio a quella data: lo storico eventi parte più tardi.")
+else:
+    df_state = pd.DataFrame(
+        [{"ticker": t, **p} for t, p in state["positions"].items()],
+        columns=["ticker", "size", "stop_loss", "profit_take"],
+    )
+    df_state["close"] = df_state["ticker"].map(state["closes"])
+    df_state["value"] = df_state["size"] * df_state["close"]
+
+    s1, s2, s3 = st.columns(3)
+    s1.metric("Equity", f"€ {state['cash'] + df_state['value'].sum():,.2f}")
+    s2.metric("Cash", f"€ {state['cash']:,.2f}")
+    s3.metric("Positions", len(df_state))
+    if not df_state.empty:
+        st.dataframe(df_state, use_container_width=True, hide_index=True)
+
+st.markdown("---")
+
+# 6. Storico Operazioni (Trade History)
 st.subheader("📜 Trade History")
+
+PAGE_SIZE = 50
+f1, f2, _ = st.columns([1, 1, 2])
+f_ticker = f1.text_input("Ticker", value="").strip().upper() or None
+f_action = f2.selectbox("Action", ["ALL", "BUY", "SELL"])
+f_action = None if f_action == "ALL" else f_action
+
+# Pila dei cursori keyset: l'ultimo elemento è l'inizio della pagina corrente.
+# Se cambiano i filtri si riparte dalla prima pagina.
+filters = (f_ticker, f_action)
+if st.session_state.get("trades_filters") != filters:
+    st.session_state["trades_filters"] = filters
+    st.session_state["trades_cursors"] = [None]
+cursors = st.session_state["trades_cursors"]
+
+df_trades, next_cursor = load_trades_page(PAGE_SIZE, cursors[-1], f_ticker, f_action)
+
 if not df_trades.empty:
-    # Ordiniamo per data decrescente
     df_trades['date'] = pd.to_datetime(df_trades['date'])
-    df_trades = df_trades.sort_values('date', ascending=False)
-    
+
     # Coloriamo le azioni (BUY=Verde, SELL=Rosso)
     def color_action(val):
         color = '#d4edda' if val == 'BUY' else '#f8d7da' # Colori pastello verde/rosso
@@ -92,5 +152,14 @@ if not df_trades.empty:
         use_container_width=True,
         hide_index=True
     )
+
+    p_prev, p_info, p_next = st.columns([1, 2, 1])
+    if p_prev.button("⬅️ Newer", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    p_info.caption(f"Page {len(cursors)}")
+    if p_next.button("Older ➡️", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
 else:
-    st.write("Nessuna operazione registrata nello storico.")
\ No newline at end of file
+    st.write("Nessuna operazione registrata nello storico.")
@@ -1,26 +1,108 @@
 # dashboard/utils.py
+import threading
+import time
+from datetime import timedelta
 import streamlit as st
-import pandas as pd
-from src.database_manager import DatabaseManager
+from src.database_manager import DatabaseManager, NOTIFY_OHLC, NOTIFY_PORTFOLIO
 from src.portfolio_manager import PortfolioManager
+from src.logger import get_logger
+
+logger = get_logger("Dashboard")
+
+# Le cache vengono invalidate dalle notifiche del DB (vedi start_cache_invalidation):
+# il TTL è solo una rete di sicurezza se il listener resta scollegato.
+CACHE_SAFETY_TTL = 3600
 
 @st.cache_resource
 def get_db():
     """Restituisce una istanza del DB Manager (cacheata)."""
     return DatabaseManager()
 
+@st.cache_data(ttl=CACHE_SAFETY_TTL)
 def load_portfolio_data():
-    """Carica i dati senza cache (devono essere freschi)."""
+    """Posizioni e cassa. Lo storico trades si legge a pagine (load_trades_page)."""
     db = get_db()
-    return db.load_portfolio()
+    return db.load_portfolio(include_trades=False)
 
-@st.cache_data(ttl=60) # Cache valida per 60 secondi
+@st.cache_data(ttl=CACHE_SAFETY_TTL)
+def load_equity_history(start_date=None):
+    """Storico giornaliero dell'equity (una riga per giorno, scritta dal daily run)."""
+    db = get_db()
+    return db.get_equity_history(start_date=start_date)
+
+@st.cache_data(ttl=CACHE_SAFETY_TTL)
+def load_portfolio_state(as_of):
+    """
+    Cassa e posizioni a una data passata (snapshot + coda del log eventi),
+    valorizzate all'ultimo close disponibile fino a quella data.
+    None se la data precede il primo snapshot.
+    """
+    db = get_db()
+    try:
+        state = db.get_portfolio_state(as_of=as_of)
+    except ValueError:
+        return None
+    tickers = list(state["positions"])
+    closes = {}
+    for bar in db.get_ohlc(tickers, (as_of - timedelta(days=10)).date().isoformat(), as_of.date().isoformat()):
+        closes[bar["ticker"]] = float(bar["close"])  # righe in ordine di data: resta l'ultima
+    state["closes"] = closes
+    return state
+
+@st.cache_data(ttl=CACHE_SAFETY_TTL)
+def load_trades_page(limit: int = 50, cursor=None, ticker=None, action=None):
+    """Una pagina dello storico trades (vedi DatabaseManager.get_trades_page)."""
+    db = get_db()
+    return db.get_trades_page(limit=limit, cursor=cursor, ticker=ticker, action=action)
+
+@st.cache_data(ttl=CACHE_SAFETY_TTL)
 def load_ohlc_summary():
-    """Conta quanti dati abbiamo per ticker."""
+    """Copertura dati per ticker (tabella pre-aggregata, una riga per ticker)."""
     db = get_db()
-    # Query leggera per contare le righe
-    query = "SELECT ticker, COUNT(*) as count, MAX(date) as last_date FROM ohlc GROUP BY ticker"
-    rows = db.query(query)
-    if not rows:
-        return pd.DataFrame()
-    return pd.DataFrame(rows)
\ No newline at end of file
+    return db.get_ohlc_summary()
+
+@st.cache_data(ttl=CACHE_SAFETY_TTL)
+def load_portfolio_summary():
+    """KPI del portafoglio (cassa, investito, equity, posizioni) aggregati dal DB."""
+    db = get_db()
+    return db.get_portfolio_summary()
+
+
+# ----------------------
+# Invalidazione cache (LISTEN/NOTIFY)
+# ----------------------
+# Quali cache svuotare per ogni topic notificato da DatabaseManager
+INVALIDATES = {
+    NOTIFY_PORTFOLIO: [load_portfolio_data, load_portfolio_summary, load_trades_page, load_equity_history,
+                       load_portfolio_state],
+    NOTIFY_OHLC: [load_ohlc_summary],
+}
+
+def _listen_forever(retry_seconds: int = 5):
+    """Ascolta le notifiche del DB e svuota le cache interessate. Si riconnette in caso di errore."""
+    db = get_db()
+    if not db.supports_notify:
+        # Backend senza NOTIFY (DB di ricerca): restano le cache a TTL
+        logger.info("Notifiche DB non disponibili: invalidazione delle cache solo a TTL.")
+        return
+    while True:
+        try:
+            for topic in db.listen():
+                for loader in INVALIDATES.get(topic, []):
+                    loader.clear()
+                logger.info(f"Cache invalidata per '{topic}'.")
+        except Exception as e:
+            logger.warning(f"Listener notifiche DB interrotto ({e}). Nuovo tentativo tra {retry_seconds}s.")
+            time.sleep(retry_seconds)
+
+@st.cache_resource
+def start_cache_invalidation():
+    """Avvia (una sola volta per processo) il thread che ascolta le notifiche del DB."""
+    if not get_db().supports_notify:
+        # Il DB di ricerca è in sola lettura: nessuna scrittura da notificare (solo TTL)
+        return None
+    thread = threading.Thread(target=_listen_forever, name="db-cache-invalidation", daemon=True)
+    thread.start()
+    return thread
+
+start_cache_invalidation()
@@ -1,7 +1,6 @@
 # dashboard/Home.py
 import streamlit as st
-import pandas as pd
-from dashboard.utils import load_portfolio_data, load_ohlc_summary
+from dashboard.utils import load_portfolio_summary, load_ohlc_summary
 from src.settings_manager import SettingsManager
 
 st.set_page_config(page_title="Petunia Dashboard", page_icon="🌸", layout="wide")
@@ -25,17 +24,15 @@ except Exception as e:
 st.markdown("---")
 
 # 1. KPI Portafoglio
-data = load_portfolio_data()
-df_cash = data.get('cash', pd.DataFrame())
-df_port = data.get('portfolio', pd.DataFrame())
+summary = load_portfolio_summary()
 
 col1, col2, col3, col4 = st.columns(4)
 
-# Calcolo Totali
-cash = float(df_cash.iloc[0]['cash']) if not df_cash.empty else 0.0
-invested = (df_port['price'] * df_port['size']).sum() if not df_port.empty else 0.0
-total_equity = cash + invested
-active_tickers = len(df_port) if not df_port.empty else 0
+# Totali già aggregati dal DB
+cash = summary["cash"]
+invested = summary["invested"]
+total_equity = summary["equity"]
+active_tickers = summary["positions"]
 
 col1.metric("Total Equity", f"€ {total_equity:,.2f}")
 col2.metric("Cash Available", f"€ {cash:,.2f}")
@@ -79,6 +76,8 @@ with c1:
 with c2:
     st.info("ℹ️ **Quick Actions**")
     if st.button("🔄 Refresh Data View"):
+        # Le cache si aggiornano da sole alle scritture: qui forziamo la rilettura
+        st.cache_data.clear()
         st.rerun()
     
     st.markdown("Per operazioni di scrittura o log, vai al **Control Panel**.")
\ No newline at end of file
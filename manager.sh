@@ -39,7 +39,8 @@ case "$1" in
 
     init)
         echo -e "${GREEN}Inizializzazione Tabelle DB...${NC}"
-        docker compose run --rm app python -m services.init_db
+        # Argomento opzionale: anni di storico per i ticker nuovi (es. ./manager.sh init 5)
+        docker compose run --rm app python -m services.init_db $2
         ;;
 
     daily)
@@ -66,6 +67,11 @@ case "$1" in
         docker compose run --rm app python -m services.backtest $ARGS
         ;;
 
+    research-sync)
+        echo -e "${GREEN}Sync DB di ricerca (Postgres -> DuckDB)...${NC}"
+        docker compose run --rm app python -m services.sync_research_db
+        ;;
+
     test)
         echo -e "${GREEN}Running Tests (Pytest inside Docker)...${NC}"
         docker compose run --rm app pytest tests/ -v
@@ -95,7 +101,7 @@ case "$1" in
         echo "--------------------------------------------------------"
         echo " 🛠️  SETUP:"
         echo "   setup      -> Build images & create folders"
-        echo "   init       -> Create DB schema (Warning: resets data)"
+        echo "   init [yrs] -> Create DB schema and bootstrap history (resumable)"
         echo ""
         echo " 🚀 RUNTIME:"
         echo "   start      -> Start DB & Dashboard (background)"
@@ -107,6 +113,7 @@ case "$1" in
         echo "   daily      -> Run Data Fetch & Portfolio Update"
         echo "   weekly     -> Run Strategy Analysis (Friday)"
         echo "   backtest   -> Run Simulation (Args: ALL, EMA, RSI)"
+        echo "   research-sync -> Export DB to local DuckDB file (research mode)"
         echo ""
         echo " 💻 DEV:"
         echo "   test       -> Run Pytest Suite"
@@ -11,8 +11,9 @@ from typing import Dict, List, Optional
 
 # Core Imports
 from src.database_manager import DatabaseManager
-from src.portfolio_manager import PortfolioManager
-from src.risk_manager import RiskManager
+from src.ohlc_cache import OhlcCache
+from src.portfolio_manager import PortfolioManager, FeeModel, ORDER_FILLED
+from src.risk_manager import RiskManager, position_exit_orders
 from src.settings_manager import SettingsManager
 from src.logger import get_logger
 from src.strategies import get_strategy, STRATEGY_MAP
@@ -77,11 +78,10 @@ def _execute_single_strategy(strategy_name: str,
     try:
         settings = SettingsManager()
         fees_conf = settings.get_fees_config()
-        fee_fixed = fees_conf.get("fixed_euro", 0.0)
-        fee_pct = fees_conf.get("percentage", 0.0)
-        logger.info(f"💰 Cost Structure: €{fee_fixed} + {fee_pct*100}% per trade.")
+        fee_model = FeeModel.from_config(fees_conf)
+        logger.info(f"💰 Cost Structure: €{fee_model.fixed} + {fee_model.percentage*100}% per trade.")
     except:
-        fee_fixed, fee_pct = 0.0, 0.0
+        fees_conf, fee_model = {}, FeeModel()
 
     # 2. Setup Managers
     try:
@@ -112,6 +112,17 @@ def _execute_single_strategy(strategy_name: str,
     start_date = datetime.now() - timedelta(days=days_history)
     sim_dates = [d for d in all_dates if pd.to_datetime(d) >= pd.Timestamp(start_date)]
     
+    # Barre di ogni giorno indicizzate per ticker, calcolate una volta sola (niente maschere per ticker nel loop)
+    all_bars = pd.concat(
+        {t: df[['date', 'open', 'high', 'low', 'close']] for t, df in data_map.items()},
+        names=['ticker']
+    ).reset_index(level='ticker')
+    all_bars['date'] = pd.to_datetime(all_bars['date'])
+    all_bars = all_bars.drop_duplicates(['ticker', 'date']).astype(
+        {'open': float, 'high': float, 'low': float, 'close': float})
+    bars_by_date = {d: g.set_index('ticker') for d, g in all_bars.groupby('date')}
+    no_bars = all_bars.iloc[:0].set_index('ticker')
+
     equity_curve = []
     trades_count = 0
     total_fees_paid = 0.0
@@ -124,44 +135,28 @@ def _execute_single_strategy(strategy_name: str,
         current_date = pd.Timestamp(current_date)
         is_friday = current_date.dayofweek == 4  # 0=Mon, 4=Fri
 
-        # Recuperiamo i dati di oggi (Open, High, Low, Close)
-        todays_prices = {}
-        for ticker, df in data_map.items():
-            row = df[pd.to_datetime(df['date']) == current_date]
-            if not row.empty:
-                todays_prices[ticker] = {
-                    'open': float(row.iloc[0]['open']),
-                    'high': float(row.iloc[0]['high']),
-                    'low': float(row.iloc[0]['low']),
-                    'close': float(row.iloc[0]['close'])
-                }
+        # Barre di oggi (Open, High, Low, Close) per ticker
+        todays_bars = bars_by_date.get(current_date, no_bars)
 
         # Aggiorniamo il valore del portfolio con i prezzi di chiusura di oggi (Mark-to-Market)
-        current_closes = {t: data['close'] for t, data in todays_prices.items()}
-        pm.update_market_prices(current_closes)
+        pm.update_market_prices(todays_bars['close'].to_dict())
 
         # ---------------------------------------------------------------------
         # FASE A: ESECUZIONE ORDINI PENDENTI (Lunedì mattina / Next Open)
         # ---------------------------------------------------------------------
         # Se ci sono ordini nella "busta" (decisi venerdì scorso), li eseguiamo all'OPEN di oggi
         if pending_entry_orders:
-            for order in pending_entry_orders:
-                ticker = order['ticker']
-                
-                # Se il titolo è quotato oggi
-                if ticker in todays_prices:
-                    # SIMULAZIONE SLIPPAGE/GAP: Eseguiamo al prezzo di APERTURA reale
-                    execution_price = todays_prices[ticker]['open']
-                    order['price'] = execution_price 
-                    
-                    # Tentativo di esecuzione (il PM controlla se ho cash sufficiente)
-                    if pm.execute_order(order):
-                        # Calcolo fee
-                        trade_val = execution_price * order['quantity']
-                        commission = fee_fixed + (trade_val * fee_pct)
-                        pm.update_cash(float(pm.df_cash.iloc[0]['cash']) - commission)
-                        total_fees_paid += commission
-                        if order['action'] == 'BUY': trades_count += 1
+            # SIMULAZIONE SLIPPAGE/GAP: Eseguiamo al prezzo di APERTURA reale (solo titoli quotati oggi)
+            opens = todays_bars['open']
+            to_execute = [
+                {**order, 'price': float(opens[order['ticker']])}
+                for order in pending_entry_orders if order['ticker'] in opens.index
+            ]
+            # Esecuzione in blocco (il PM controlla se ho cash sufficiente, commissioni incluse)
+            for res in pm.execute_orders(to_execute, fee_model):
+                if res['status'] == ORDER_FILLED:
+                    total_fees_paid += res['commission']
+                    if res['action'] == 'BUY': trades_count += 1
                         
             # Svuotiamo la lista ordini pendenti una volta provati tutti
             pending_entry_orders = []
@@ -171,39 +166,14 @@ def _execute_single_strategy(strategy_name: str,
         # ---------------------------------------------------------------------
         # Controlliamo se i massimi/minimi DI OGGI hanno toccato gli stop delle posizioni aperte.
         
-        # --- FIX PUNTO 2 e 3: Trasformazione dati per RiskManager & Gap Risk ---
-        # Creiamo un dizionario pulito {ticker: {stop_loss, take_profit, quantity}}
-        positions_for_risk = {}
-        if not pm.df_portfolio.empty:
-            # Creiamo una copia per non modificare l'originale
-            temp_df = pm.df_portfolio.copy()
-            
-            # Rinominiamo colonne per matchare le aspettative del RiskManager
-            # size -> quantity, profit_take -> take_profit
-            temp_df = temp_df.rename(columns={"size": "quantity", "profit_take": "take_profit"})
-            
-            # Assicuriamoci che ticker sia l'indice per creare un dizionario di dizionari
-            if 'ticker' in temp_df.columns:
-                temp_df = temp_df.set_index('ticker')
-            
-            # Esportiamo solo le colonne che servono
-            # orient='index' crea: {'AAPL': {'stop_loss': 100, ...}, 'TSLA': ...}
-            positions_for_risk = temp_df[['stop_loss', 'take_profit', 'quantity']].to_dict(orient='index')
-
-        # Passiamo 'todays_prices' COMPLETO (Open, High, Low) per gestire il Gap Risk
-        exit_orders = rm.check_intraday_stops(
-            positions_for_risk, 
-            todays_prices 
-        )
+        # Motore stop vettoriale: array delle posizioni + barre di oggi COMPLETE (Open, High, Low)
+        # per gestire il Gap Risk
+        exit_orders = position_exit_orders(*pm.get_position_arrays(), todays_bars)
         
-        for order in exit_orders:
-            # Eseguiamo l'uscita
-            if pm.execute_order(order):
-                # Fee su uscita
-                trade_val = order['price'] * order['quantity']
-                commission = fee_fixed + (trade_val * fee_pct)
-                pm.update_cash(float(pm.df_cash.iloc[0]['cash']) - commission)
-                total_fees_paid += commission
+        # Uscite in blocco, con fee
+        for res in pm.execute_orders(exit_orders, fee_model):
+            if res['status'] == ORDER_FILLED:
+                total_fees_paid += res['commission']
 
 
         # ---------------------------------------------------------------------
@@ -218,20 +188,15 @@ def _execute_single_strategy(strategy_name: str,
                 # --- FIX PUNTO 1: Estrazione Conteggi per Evaluate ---
                 # Il RiskManager vuole sapere quante azioni abbiamo per ogni ticker {ticker: size}
                 # Lo estraiamo qui senza sporcare il PortfolioManager
-                current_pos_counts = {}
-                if not pm.df_portfolio.empty:
-                    # Filtriamo solo le posizioni aperte (> 0)
-                    mask = pm.df_portfolio["size"] > 0
-                    active_pos = pm.df_portfolio[mask]
-                    # Creiamo il dizionario
-                    current_pos_counts = dict(zip(active_pos["ticker"], active_pos["size"]))
+                current_pos_counts = pm.get_position_sizes()
 
                 # Calcolo size e stop
                 new_orders = rm.evaluate(
                     daily_signals, 
                     pm.get_total_equity(), 
-                    float(pm.df_cash.iloc[0]['cash']), 
-                    current_pos_counts # <--- Passiamo il dizionario calcolato
+                    pm.cash, 
+                    current_pos_counts, # <--- Passiamo il dizionario calcolato
+                    fee_model=fee_model
                 )
                 
                 # Mettiamo gli ordini in coda per la prossima apertura (Lunedì)
@@ -300,7 +265,17 @@ def run_backtest_session(mode: str = "DEFAULT",
 
     days = years * 365
     logger.info(f"📥 Fetching Data ({days} days)...")
-    data_map = db.get_ohlc_all_tickers(days=days + 200)
+    if db.backend == "duckdb":
+        # Modalità ricerca: il DB embedded è già locale e colonnare
+        data_map = db.get_ohlc_all_tickers(days=days + 200)
+    else:
+        # Lo storico viene letto dalla cache locale (memory-map), allineata al DB in modo incrementale
+        cache = OhlcCache()
+        try:
+            cache.sync(db)
+        except Exception as e:
+            logger.warning(f"⚠️ Sync cache OHLC fallito, uso la copia locale esistente: {e}")
+        data_map = cache.get_ohlc_all_tickers(days=days + 200)
     
     if not data_map:
         logger.error("No Data.")
@@ -1,101 +1,142 @@
+import asyncio
+from datetime import date
 import pandas as pd
+from typing import List, Tuple
 from src.database_manager import DatabaseManager
-from src.portfolio_manager import PortfolioManager
-from src.yfinance_manager import YFinanceManager
-from src.drive_manager import DriveManager
+from src.async_database_manager import AsyncDatabaseManager
+from src.portfolio_manager import PortfolioManager, ORDER_FILLED
+from src.providers import MarketDataProvider, get_provider
+from src.drive_manager import DriveManager, is_new_sheet_order, unmatched_orders
+from src.order_mirror import SheetsOrderMirror
+from src.risk_manager import position_exit_orders
+from src.fetch_planner import plan_fetches
 from src.logger import get_logger
 
 logger = get_logger("DailyRun")
 
+# --- FUNZIONE 0: Ordini nuovi dallo Sheet ---
+def sync_sheet_orders(db: DatabaseManager, sheet_orders: List[dict]) -> List[dict]:
+    """
+    Importa nella tabella pending_orders gli ordini inseriti a mano sul tab 'Orders'
+    (righe senza id). Restituisce gli ordini importati con l'id assegnato dal DB:
+    il mirror li riscrive subito sullo Sheet con l'id, così il run successivo non li reimporta.
+
+    Il flusso è solo in ingresso: cancellare sullo Sheet una riga con id NON annulla
+    l'ordine (la riga ricompare alla copia successiva). Gli ordini si annullano sul DB
+    (DatabaseManager.cancel_pending_orders): una lettura dello Sheet parziale o fallita
+    non deve poter cancellare il book.
+    """
+    new_orders = [o for o in sheet_orders if is_new_sheet_order(o)]
+    if not new_orders:
+        return []
+
+    # Transizione: lo Sheet importato da init_db prima della colonna 'id' non ha gli id.
+    # Le righe identiche a un ordine già PENDING non si reimportano.
+    to_add = unmatched_orders(new_orders, db.get_pending_orders())
+    ids = db.add_pending_orders(to_add)
+    if to_add:
+        logger.info(f"📥 Importati {len(to_add)} ordini nuovi dal tab 'Orders'.")
+    return [{**o, "id": i} for o, i in zip(to_add, ids)]
+
+# --- FUNZIONE 0b: Riconciliazione con il log eventi ---
+def reconcile_event_log(db: DatabaseManager, pm: PortfolioManager) -> bool:
+    """
+    Confronta posizioni e cassa caricate (tabelle portfolio / portfolio_cash) con lo stato
+    ricostruito dal log eventi (snapshot + coda). False se divergono.
+    """
+    try:
+        logged = db.get_portfolio_state()
+    except ValueError as e:
+        logger.info(f"Riconciliazione saltata: {e}")
+        return True
+
+    current = pm.get_state()
+    logged_sizes = {t: p["size"] for t, p in logged["positions"].items()}
+    current_sizes = {t: p["size"] for t, p in current["positions"].items()}
+    diff = {t: (current_sizes.get(t, 0), logged_sizes.get(t, 0))
+            for t in current_sizes.keys() | logged_sizes.keys()
+            if current_sizes.get(t, 0) != logged_sizes.get(t, 0)}
+    cash_gap = current["cash"] - float(logged["cash"])
+
+    if diff or abs(cash_gap) > 0.01:
+        logger.warning(f"⚠️ Portafoglio diverso dal log eventi: size (tabelle, log) {diff}, differenza cassa {cash_gap:.2f}")
+        return False
+    return True
+
 # --- FUNZIONE 1: Aggiornamento Dati Mercato ---
-def update_market_data(db: DatabaseManager, yf: YFinanceManager, dm: DriveManager, pm: PortfolioManager) -> dict:
+def update_market_data(db: DatabaseManager, provider: MarketDataProvider, dm: DriveManager, pm: PortfolioManager, pending_orders: List[dict]) -> dict:
     logger.info("📡 Step 1: Aggiornamento Dati Mercato")
     
     # 1. Raccolta Ticker
     universe_tkr = dm.get_universe_tickers()
-    portfolio_tkr = pm.df_portfolio["ticker"].tolist()
+    portfolio_tkr = list(pm.positions)
     
-    # Recuperiamo i pendenti dal CLOUD
-    pending_orders = dm.get_pending_orders()
     pending_tkr = [o["ticker"] for o in pending_orders]
     
     all_tickers = list(set(universe_tkr + portfolio_tkr + pending_tkr))
     
-    # 2. Fetch & Store
-    logger.info(f"Scarico OHLCV per {len(all_tickers)} ticker...")
-    new_data = yf.fetch_ohlc(all_tickers, days=5) 
-    
-    if not new_data:
+    # 2. Fetch & Store (incrementale: ogni ticker riparte dalla sua ultima candela salvata,
+    # i ticker nuovi dell'Universe ricevono lo storico completo)
+    plan = plan_fetches(all_tickers, db.get_ohlc_high_water_marks(all_tickers), end_date=date.today())
+    logger.info(f"Scarico OHLCV per {len(all_tickers)} ticker in {len(plan)} download...")
+
+    # Ingest a blocchi: ogni chunk scaricato viene scritto subito sul DB
+    today_market = {}
+    changed_tickers = set()
+    for chunk in provider.iter_plan_frames(plan):
+        counts = db.copy_ohlc(chunk)
+        changed_tickers.update(counts["tickers"])
+
+        # 3. Snapshot Odierno
+        # Ultima candela per ticker (il backfill dei ticker nuovi porta anche righe vecchie)
+        latest = chunk.sort_values("date").groupby("ticker").tail(1)
+        for bar in latest.itertuples(index=False):
+            t_date = bar.date.date()
+            if bar.ticker in today_market and today_market[bar.ticker]["date"] > t_date:
+                continue
+            today_market[bar.ticker] = {
+                "date": t_date,
+                "open": float(bar.open),
+                "high": float(bar.high),
+                "low": float(bar.low),
+                "close": float(bar.close),
+                "volume": int(bar.volume)
+            }
+
+    failed = provider.failed_tickers()
+    if failed:
+        logger.warning(f"⚠️ Download falliti per {len(failed)} ticker: {failed}")
+
+    if not today_market:
         logger.warning("Nessun dato scaricato.")
         return {}
 
-    db.upsert_ohlc(new_data)
-    
-    # 3. Snapshot Odierno
-    today_market = {}
-    for row in new_data:
-        t_ticker, t_date, t_open, t_high, t_low, t_close, t_volume = row
-        today_market[t_ticker] = {
-            "date": t_date,
-            "open": float(t_open),
-            "high": float(t_high),
-            "low": float(t_low),
-            "close": float(t_close),
-            "volume": int(t_volume)
-        }
+    # Summary incrementale: solo i ticker con righe nuove o modificate
+    db.refresh_ohlc_summary(sorted(changed_tickers))
     return today_market
 
 # --- FUNZIONE 2: Shadow Logic ---
-def process_shadow_execution(pm: PortfolioManager, today_market: dict, dm: DriveManager):
+def process_shadow_execution(pm: PortfolioManager, today_market: dict, pending_orders: List[dict]) -> List[dict]:
+    """Restituisce gli ordini pendenti eseguiti: [{"id", "price"}]."""
     logger.info("🕵️ Step 2: Shadow Execution Logic")
     
     # A. Mark-to-Market
     current_prices = {t: d["close"] for t, d in today_market.items()}
     pm.update_market_prices(current_prices)
 
-    # B. Uscite (SL/TP)
-    for _, pos in pm.df_portfolio.copy().iterrows():
-        ticker = pos["ticker"]
-        if ticker not in today_market: continue
-        
-        mkt = today_market[ticker]
-        sl = pos["stop_loss"]
-        tp = pos["profit_take"]
-        size = pos["size"]
-        
-        executed_exit = False
-        exit_price = 0.0
-        reason = ""
-
-        if pd.notna(sl) and mkt["low"] <= sl:
-            exit_price = min(mkt["open"], sl) 
-            executed_exit = True
-            reason = "STOP LOSS"
-        elif pd.notna(tp) and mkt["high"] >= tp:
-            exit_price = max(mkt["open"], tp)
-            executed_exit = True
-            reason = "TAKE PROFIT"
-            
-        if executed_exit:
-            logger.info(f"💥 {reason} TRIGGERED su {ticker}. Vendo {size} @ {exit_price:.2f}")
-            pm.execute_order({
-                "ticker": ticker, "action": "SELL", 
-                "quantity": size, "price": exit_price, "reason": reason
-            })
-
-    # C. Entrate (Ordini Pendenti da Drive)
-    pending_orders = dm.get_pending_orders()
-    if not pending_orders: return
-
-    remaining_orders = []
-    executed_count = 0
-    
+    # B. Uscite (SL/TP): stesso motore vettoriale del backtest (gap incluso)
+    exit_orders = position_exit_orders(*pm.get_position_arrays(), pd.DataFrame.from_dict(today_market, orient='index'))
+    for order in exit_orders:
+        logger.info(f"💥 {order['reason']} TRIGGERED su {order['ticker']}. Vendo {order['quantity']} @ {order['price']:.2f}")
+    pm.execute_orders(exit_orders)
+
+    # C. Entrate (Ordini Pendenti dal DB)
+    triggered = []
     for order in pending_orders:
         ticker = order["ticker"]
         limit_price = float(order["price"])
         
         if ticker not in today_market:
-            remaining_orders.append(order)
             continue
             
         mkt = today_market[ticker]
@@ -103,42 +144,78 @@ def process_shadow_execution(pm: PortfolioManager, today_market: dict, dm: Drive
         # Logica BUY LIMIT
         if order["action"] == "BUY" and mkt["low"] <= limit_price:
             exec_price = min(mkt["open"], limit_price)
-            logger.info(f"⚡ ORDER FILLED {ticker}: Limit {limit_price} -> Exec @ {exec_price:.2f}")
-            
-            order["price"] = exec_price
-            pm.execute_order(order)
-            executed_count += 1
+            logger.info(f"⚡ LIMIT TOCCATO {ticker}: Limit {limit_price} -> Exec @ {exec_price:.2f}")
+            triggered.append({**order, "price": exec_price})
+
+    # Ordini già eseguiti dal broker (limit toccato): si registrano senza controllo di cassa,
+    # come prima del book su DB. Restano pendenti solo quelli non validi.
+    filled = []
+    for order, res in zip(triggered, pm.execute_orders(triggered, check_cash=False)):
+        if res["status"] == ORDER_FILLED:
+            filled.append({"id": order["id"], "price": res["price"]})
         else:
-            remaining_orders.append(order)
-    
-    # D. Aggiornamento Cloud
-    # Se abbiamo eseguito qualcosa, carichiamo su Drive solo quelli RIMASTI
-    if executed_count > 0:
-        dm.save_pending_orders(remaining_orders)
-        logger.info(f"Ordini Drive aggiornati: {executed_count} eseguiti, {len(remaining_orders)} rimanenti.")
+            logger.warning(f"⛔ Ordine {order['id']} su {order['ticker']} non eseguito: {res['reason']}")
+
+    if filled:
+        logger.info(f"Ordini pendenti: {len(filled)} eseguiti, {len(pending_orders) - len(filled)} rimanenti.")
+    return filled
+
+# --- FUNZIONE 0c: Input del run (DB + Sheet in parallelo) ---
+async def load_run_inputs(dm: DriveManager) -> Tuple[dict, List[dict]]:
+    """
+    Caricamento del portafoglio (pipeline asincrona) e lettura del tab 'Orders'
+    in parallelo. Lo storico trades non serve al run giornaliero: solo posizioni e cassa.
+    """
+    async with AsyncDatabaseManager() as adb:
+        portfolio, sheet_orders = await asyncio.gather(
+            adb.load_portfolio(include_trades=False),
+            asyncio.to_thread(dm.get_pending_orders),
+        )
+    return portfolio, sheet_orders
 
 def main():
     logger.info("🌅 Inizio Daily Run System...")
     try:
         db = DatabaseManager()
         pm = PortfolioManager()
-        yf = YFinanceManager()
+        provider = get_provider()
         dm = DriveManager()
     except Exception as e:
         logger.critical(f"Errore init managers: {e}")
         return
 
-    pm.load_from_db(db.load_portfolio())
-    logger.info(f"Equity Iniziale: {pm.get_total_equity():.2f}")
+    # Copia per revisione sul tab 'Orders': il thread parte subito e scrive mentre il run
+    # prosegue (DriveManager proprio, autenticato in background)
+    mirror = SheetsOrderMirror(DriveManager)
+    try:
+        portfolio, sheet_orders = asyncio.run(load_run_inputs(dm))
+        pm.load_from_db(portfolio)
+        logger.info(f"Equity Iniziale: {pm.get_total_equity():.2f}")
+        reconcile_event_log(db, pm)
 
-    today_market = update_market_data(db, yf, dm, pm)
-    
-    if today_market:
-        process_shadow_execution(pm, today_market, dm)
-        db.save_portfolio(pm.get_snapshot())
-        logger.info(f"✅ Daily Run terminata. Equity Finale: {pm.get_total_equity():.2f}")
-    else:
-        logger.error("❌ Daily Run interrotta: No Data.")
+        # Ordini nuovi inseriti sullo Sheet -> DB; da qui in poi il DB è la fonte di verità
+        imported = sync_sheet_orders(db, sheet_orders)
+
+        pending_orders = db.get_pending_orders()
+        if imported:
+            # Id del DB sullo Sheet subito, durante il download dei dati
+            mirror.publish(pending_orders, imported)
+
+        today_market = update_market_data(db, provider, dm, pm, pending_orders)
+
+        if today_market:
+            filled = process_shadow_execution(pm, today_market, pending_orders)
+            # Snapshot + riga giornaliera dello storico equity + ordini eseguiti, nella stessa transazione
+            db.save_portfolio({**pm.get_snapshot(), "equity": pm.get_equity_record(), "filled_orders": filled})
+            if filled:
+                # Ordini eseguiti rimossi dalla copia (le righe importate oggi non tornano senza id)
+                mirror.publish(db.get_pending_orders(), imported)
+            logger.info(f"✅ Daily Run terminata. Equity Finale: {pm.get_total_equity():.2f}")
+        else:
+            logger.error("❌ Daily Run interrotta: No Data.")
+    finally:
+        # Attesa solo per l'ultima scrittura ancora in corso (con timeout)
+        mirror.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
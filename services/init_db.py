@@ -1,10 +1,17 @@
 import sys
+from collections import Counter
+from datetime import date
 from src.database_manager import DatabaseManager
 from src.drive_manager import DriveManager
-from src.yfinance_manager import YFinanceManager
+from src.providers import get_provider
+from src.fetch_planner import plan_fetches
+from src.download_scheduler import NO_DATA_ERROR
 from src.logger import get_logger
 
-def main():
+# Nome del job nella tabella dei checkpoint
+BOOTSTRAP_JOB = "bootstrap"
+
+def main(years: int = 1):
     logger = get_logger("InitDB")
     logger.info("🛠️  AVVIO INIZIALIZZAZIONE SISTEMA...")
     
@@ -27,21 +34,95 @@ def main():
 
         logger.info(f"✅ Trovati {len(tickers)} ticker: {tickers}")
 
+        # Migrazione una tantum: gli ordini del tab 'Orders' passano nella tabella pending_orders
+        imported = db.import_pending_orders(drive.get_pending_orders())
+        if imported:
+            logger.info(f"📥 Importati {imported} ordini pendenti dallo Sheet.")
+            # Il tab riceve gli id del DB: il daily run non li reimporta come ordini nuovi
+            drive.save_pending_orders(db.get_pending_orders())
+
         # 3. DOWNLOAD STORICO (BOOTSTRAP DATI)
-        logger.info("--- FASE 3: Download Storico (1 Anno) ---")
-        yf_man = YFinanceManager()
-        
-        # Scarichiamo 1 anno (365 giorni)
-        historical_data = yf_man.fetch_history(tickers, years=1)
-        
-        if not historical_data:
-            logger.warning("⚠️  Nessun dato storico ricevuto da Yahoo Finance.")
+        # Rieseguibile: scarica solo ciò che manca (ticker nuovi: `years` anni, gli altri
+        # dall'ultima candela salvata) e riempie i buchi trovati nello storico.
+        logger.info(f"--- FASE 3: Download Storico ({years} anni, incrementale) ---")
+        provider = get_provider()
+
+        # Ripresa di un bootstrap interrotto: i ticker già completati non si riscaricano.
+        # Valgono solo i checkpoint di oggi (stesso end_date): un run ripreso un altro giorno
+        # deve comunque portare tutti i ticker alla data corrente.
+        end_date = date.today()
+        done = {
+            t for t, c in db.get_ingest_checkpoints(BOOTSTRAP_JOB).items()
+            if c["status"] == "done" and c["updated_at"].date() == end_date
+        }
+        todo = [t for t in tickers if t not in done]
+        if done:
+            logger.info(f"♻️  Ripresa bootstrap: {len(done)} ticker già completati, {len(todo)} da scaricare.")
+
+        holes = db.find_ohlc_gaps(todo)
+        plan = plan_fetches(
+            todo,
+            db.get_ohlc_high_water_marks(todo),
+            end_date=end_date,
+            history_days=365 * years,
+            holes=holes
+        )
+        if not plan:
+            logger.info("✅ Storico già completo, nessun download necessario.")
+            db.clear_ingest_checkpoints(BOOTSTRAP_JOB)
+            # Il summary si ricostruisce comunque: può mancare o essere parziale
+            # (daily_run aggiorna solo i ticker modificati)
+            db.refresh_ohlc_summary()
+            return
+
+        # 4. SALVATAGGIO NEL DB (pipeline fetch -> normalize -> COPY a chunk)
+        # In memoria restano solo i chunk in corso. Un ticker può comparire in più voci del
+        # piano (aggiornamento + buchi): è completato, e diventa un checkpoint nella stessa
+        # transazione dei dati, solo quando tutte le sue voci sono arrivate.
+        remaining = Counter(t for batch in plan for t in batch["tickers"])
+        rows = Counter()
+        saved = 0
+        completed = len(done)
+        for chunk in provider.iter_plan_frames(plan):
+            chunk_rows = chunk["ticker"].value_counts()
+            rows.update(chunk_rows.to_dict())
+            remaining.subtract(chunk_rows.index)
+            finished = {t: rows[t] for t in chunk_rows.index if remaining[t] == 0}
+            counts = db.copy_ohlc(chunk, checkpoint_job=BOOTSTRAP_JOB, completed=finished)
+            saved += counts["inserted"] + counts["updated"]
+            completed += len(finished)
+            logger.info(f"💾 Avanzamento: {completed}/{len(tickers)} ticker salvati.")
+
+        # Run concluso: i "done" servono solo a riprenderlo se interrotto, il prossimo init
+        # deve riconsiderare tutti i ticker (dati nuovi, buchi). Restano solo i "failed" di
+        # questo run, per diagnosi (non escludono nulla: vengono comunque riprovati).
+        db.clear_ingest_checkpoints(BOOTSTRAP_JOB)
+        failed = provider.failed_tickers()
+        if holes:
+            # Buchi rimasti identici dopo una risposta senza righe (non un errore di rete):
+            # chiusure di mercato o giorni senza scambi, da non richiedere più
+            errored = {t for t in failed if provider.last_status[t]["error"] != NO_DATA_ERROR}
+            still_open = {
+                (g["ticker"], g["start"], g["end"])
+                for g in db.find_ohlc_gaps(sorted({h["ticker"] for h in holes}))
+            }
+            db.mark_ohlc_gaps_checked([
+                h for h in holes
+                if (h["ticker"], h["start"], h["end"]) in still_open and h["ticker"] not in errored
+            ])
+
+        if failed:
+            db.save_ingest_checkpoints(BOOTSTRAP_JOB, {
+                t: {"status": "failed", "rows": rows[t], "error": provider.last_status[t]["error"]} for t in failed
+            })
+            logger.warning(f"⚠️  Download falliti per {len(failed)} ticker: {failed}. Rieseguire init per riprovare.")
+
+        db.refresh_ohlc_summary()
+        if not saved:
+            logger.warning("⚠️  Nessun dato nuovo ricevuto dal provider.")
             return
 
-        # 4. SALVATAGGIO NEL DB
-        logger.info(f"💾 Salvataggio di {len(historical_data)} righe nel database...")
-        db.upsert_ohlc(historical_data)
-        logger.info("✅ Storico salvato correttamente.")
+        logger.info(f"✅ Storico salvato correttamente ({saved} righe nuove/aggiornate).")
 
         logger.info("🚀 INIZIALIZZAZIONE COMPLETATA CON SUCCESSO.")
 
@@ -50,4 +131,5 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Anni di storico per i ticker nuovi (default: 1)
+    main(years=int(sys.argv[1]) if len(sys.argv) > 1 else 1)
\ No newline at end of file
@@ -0,0 +1,30 @@
+import sys
+from src.database_manager import DatabaseManager
+from src.duckdb_backend import connect_duckdb, sync_from_postgres
+from src.logger import get_logger
+from config.config import config
+
+def main():
+    logger = get_logger("SyncResearchDB")
+    logger.info(f"🔬 Sync DB di ricerca: Postgres -> {config.RESEARCH_DB_PATH}")
+
+    try:
+        pg_db = DatabaseManager(backend="postgres")
+        config.RESEARCH_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        research = connect_duckdb(config.RESEARCH_DB_PATH, read_only=False)
+    except Exception as e:
+        logger.error(f"❌ Errore apertura connessioni: {e}")
+        sys.exit(1)
+
+    try:
+        synced = sync_from_postgres(pg_db, research)
+        logger.info(f"✅ Sync completato: {synced} righe OHLC aggiornate.")
+    except Exception as e:
+        logger.error(f"❌ Errore durante il sync: {e}")
+        sys.exit(1)
+    finally:
+        research.close()
+        pg_db.close()
+
+if __name__ == "__main__":
+    main()
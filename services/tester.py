@@ -1,6 +1,6 @@
 # scripts/test_yfinance.py
 from datetime import datetime, timedelta
-from src.yfinance_manager import YFinanceManager
+from src.providers import get_provider
 from src.database_manager import DatabaseManager
 from src.drive_manager import DriveManager
 
@@ -10,10 +10,10 @@ def main():
     tickers = drive.get_universe_tickers()
     print(f"Paniere recuperato: {tickers}")
 
-    # 2️⃣ Fetch dati OHLCV
-    yf_manager = YFinanceManager()
-    data = yf_manager.fetch_history(tickers, years=3, threads=True)
-    print(f"Totale record ottenuti da YFinance: {len(data)}")
+    # 2️⃣ Fetch dati OHLCV (provider da config.MARKET_DATA_PROVIDER)
+    provider = get_provider()
+    data = provider.fetch_history(tickers, years=3)
+    print(f"Totale record ottenuti da {provider.__class__.__name__}: {len(data)}")
 
     # 3️⃣ Inserimento batch nel DB
     db = DatabaseManager()
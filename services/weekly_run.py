@@ -1,7 +1,7 @@
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 from src.database_manager import DatabaseManager
-from src.portfolio_manager import PortfolioManager
+from src.portfolio_manager import PortfolioManager, FeeModel, ORDER_FILLED
 from src.risk_manager import RiskManager
 from src.settings_manager import SettingsManager
 from src.strategies import get_strategy
@@ -25,8 +25,7 @@ def main():
         
         # --- NOVITÀ: Caricamento Commissioni ---
         fees_conf = settings.get_fees_config()
-        fee_fixed = fees_conf.get("fixed_euro", 0.0)
-        fee_pct = fees_conf.get("percentage", 0.0)
+        fee_model = FeeModel.from_config(fees_conf)
         
         # Risk Manager inizializzato coi parametri JSON
         rm = RiskManager(
@@ -35,23 +34,26 @@ def main():
         )
         
         logger.info(f"⚙️ Config: {active_strat_name} | Risk: {risk_params['risk_per_trade']*100}%")
-        logger.info(f"💰 Struttura Costi: €{fee_fixed} fisso + {fee_pct*100}% variabile")
+        logger.info(f"💰 Struttura Costi: €{fee_model.fixed} fisso + {fee_model.percentage*100}% variabile")
         
     except Exception as e:
         logger.critical(f"❌ Errore Configurazione: {e}")
         return
 
+    # Stato attuale (posizioni e cassa) dal DB: gli ordini partono dal portafoglio reale
+    # e il salvataggio finale non sovrascrive il portafoglio con uno stato vuoto
+    pm.load_from_db(db.load_portfolio(include_trades=False))
+    logger.info(f"💼 Portafoglio caricato: {len(pm.positions)} posizioni, cassa €{pm.cash:.2f}")
+
     # 2. Fetch Dati (Serve storico sufficiente per gli indicatori!)
-    logger.info("📥 Caricamento dati storici dal DB...")
-    data_map = db.get_ohlc_all_tickers(days=365)
-    
-    if not data_map:
-        logger.warning("⚠️ Nessun dato sufficiente per l'analisi.")
-        return
+    # Lo storico arriva in streaming (cursore server-side), un ticker alla volta:
+    # in memoria restano solo i segnali, non l'intero anno di OHLC
+    logger.info("📥 Caricamento dati storici dal DB (streaming)...")
+    cutoff_date = (datetime.now() - timedelta(days=365)).date()
 
     # 3. Calcolo Segnali (VETTORIALE)
     strategy = get_strategy(active_strat_name, **strat_params)
-    all_signals = strategy.compute(data_map)
+    all_signals = strategy.compute(db.iter_ohlc_by_ticker(start_date=cutoff_date))
     
     if all_signals.empty:
         logger.info("💤 Nessun segnale generato dalla strategia.")
@@ -81,32 +83,23 @@ def main():
     orders = rm.evaluate(
         latest_signals, 
         pm.get_total_equity(), 
-        float(pm.df_cash.iloc[0]['cash']), 
-        dict(zip(pm.df_portfolio['ticker'], pm.df_portfolio['size']))
+        pm.cash, 
+        {t: p.size for t, p in pm.positions.items()},
+        fee_model=fee_model  # stesse commissioni dell'esecuzione: la size tiene conto delle fee
     )
     
     # 6. Invio Ordini & Applicazione Commissioni
     if not orders:
         logger.info("✅ Nessun ordine da eseguire oggi.")
     else:
-        for order in orders:
-            logger.info(f"🔔 ESECUZIONE: {order['action']} {order['quantity']} {order['ticker']}")
-            
-            # A. Eseguiamo l'ordine (aggiorna size portfolio e scala costo azioni dal cash)
-            pm.execute_order(order)
-            
-            # B. Calcoliamo e sottraiamo le commissioni EXTRA
-            trade_val = order['price'] * order['quantity']
-            commission = fee_fixed + (trade_val * fee_pct)
-            
-            # Leggiamo il cash aggiornato post-trade
-            current_cash = float(pm.df_cash.iloc[0]['cash'])
-            new_cash = current_cash - commission
-            
-            # Aggiorniamo la cassa
-            pm.update_cash(new_cash)
-            
-            logger.info(f"💸 Fee applicata: €{commission:.2f} (Cash residuo: €{new_cash:.2f})")
+        # Esecuzione in blocco: posizioni, cassa (commissioni incluse) e storico in un passaggio
+        for res in pm.execute_orders(orders, fee_model):
+            if res["status"] == ORDER_FILLED:
+                logger.info(f"🔔 ESECUZIONE: {res['action']} {res['quantity']} {res['ticker']} "
+                            f"(💸 fee €{res['commission']:.2f})")
+            else:
+                logger.warning(f"⛔ Ordine rifiutato: {res['action']} {res['quantity']} {res['ticker']} ({res['reason']})")
+        logger.info(f"Cash residuo: €{pm.cash:.2f}")
             
         # Salviamo lo stato del portafoglio aggiornato su DB
         db.save_portfolio(pm.get_snapshot())
@@ -0,0 +1,188 @@
+# src/async_database_manager.py
+import itertools
+from datetime import datetime, timedelta
+import psycopg
+from psycopg.rows import dict_row
+import pandas as pd
+
+from config.config import config
+from src.logger import get_logger
+from src.database_manager import (
+    SQL_UPSERT_OHLC, OHLC_UPSERT_CHUNK, SQL_OHLC_SINCE_DATE,
+    SQL_LOAD_PORTFOLIO, SQL_LOAD_CASH, SQL_LOAD_TRADES,
+    SQL_NOTIFY, NOTIFY_CHANNEL, NOTIFY_OHLC,
+    ohlc_rows_to_frame, ohlc_upsert_params, ohlc_upsert_counts, portfolio_save_statements,
+)
+
+
+class AsyncDatabaseManager:
+    """
+    Variante asincrona di DatabaseManager (psycopg.AsyncConnection).
+    Stesse query e stessi formati di input/output, ma i servizi possono
+    sovrapporre il lavoro sul DB alle chiamate di rete (Sheets, Yahoo).
+
+    Usata da services/daily_run.py: il caricamento del portafoglio (pipeline)
+    procede insieme alla lettura del tab 'Orders'.
+
+    Uso:
+        async with AsyncDatabaseManager() as db:
+            snapshot = await db.load_portfolio()
+    """
+
+    def __init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+        self.conn = None
+        # Nomi univoci per i cursori server-side (streaming)
+        self._stream_ids = itertools.count()
+
+    async def connect(self):
+        """Crea la connessione asincrona usando le variabili d'ambiente (via config)."""
+        try:
+            self.conn = await psycopg.AsyncConnection.connect(
+                host=config.DB_HOST,
+                port=int(config.DB_PORT),
+                dbname=config.DB_NAME,
+                user=config.DB_USER,
+                password=config.DB_PASSWORD,
+                row_factory=dict_row
+            )
+            self.logger.info("Connessione asincrona al DB PostgreSQL stabilita.")
+        except Exception as e:
+            self.logger.error(f"Errore durante la connessione asincrona al DB: {e}")
+            raise
+        return self
+
+    async def close(self):
+        """Chiude la connessione"""
+        if self.conn:
+            await self.conn.close()
+            self.logger.info("Connessione asincrona al DB chiusa.")
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # ----------------------
+    # OHLC
+    # ----------------------
+    async def upsert_ohlc(self, data: list[tuple]) -> dict:
+        """Vedi DatabaseManager.upsert_ohlc."""
+        if not data:
+            self.logger.info("Nessun dato da inserire.")
+            return ohlc_upsert_counts([], 0)
+
+        columns = ohlc_upsert_params(data)
+        total = len(columns[0])
+        results = []
+        try:
+            async with self.conn.cursor() as cur:
+                for start in range(0, total, OHLC_UPSERT_CHUNK):
+                    await cur.execute(SQL_UPSERT_OHLC, tuple(col[start:start + OHLC_UPSERT_CHUNK] for col in columns))
+                    results.extend(await cur.fetchall())
+                if results:
+                    await cur.execute(SQL_NOTIFY, (NOTIFY_CHANNEL, NOTIFY_OHLC))
+            await self.conn.commit()
+            counts = ohlc_upsert_counts(results, total)
+            self.logger.info(
+                f"[DB] Upsert OHLC: {counts['inserted']} inseriti, {counts['updated']} aggiornati, "
+                f"{counts['unchanged']} invariati."
+            )
+            return counts
+        except Exception as e:
+            await self.conn.rollback()
+            self.logger.error(f"[DB] Errore durante upsert batch OHLC: {e}")
+            raise
+
+    async def iter_ohlc_by_ticker(self, start_date, batch_size: int = 50_000):
+        """
+        Vedi DatabaseManager.iter_ohlc_by_ticker (generatore asincrono).
+        Cursore server-side letto a blocchi: in memoria resta solo lo storico
+        del ticker corrente, mai l'intero result set.
+        """
+        pending = []
+        pending_ticker = None
+
+        async with self.conn.cursor(name=f"ohlc_stream_{next(self._stream_ids)}") as cur:
+            await cur.execute(SQL_OHLC_SINCE_DATE, (start_date,))
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for ticker, df in ohlc_rows_to_frame(rows).groupby('ticker', sort=False):
+                    if pending_ticker is not None and ticker != pending_ticker:
+                        yield pending_ticker, pd.concat(pending, ignore_index=True)
+                        pending = []
+                    pending_ticker = ticker
+                    pending.append(df)
+
+        if pending_ticker is not None:
+            yield pending_ticker, pd.concat(pending, ignore_index=True)
+
+    async def get_ohlc_all_tickers(self, days: int = 365, batch_size: int = 50_000) -> dict:
+        """Vedi DatabaseManager.get_ohlc_all_tickers (un ticker alla volta, senza concat globale)."""
+        cutoff_date = (datetime.now() - timedelta(days=days)).date()
+
+        data_map = {
+            ticker: df
+            async for ticker, df in self.iter_ohlc_by_ticker(cutoff_date, batch_size=batch_size)
+        }
+        if not data_map:
+            self.logger.warning(f"Nessun dato OHLC trovato negli ultimi {days} giorni.")
+            return {}
+
+        self.logger.info(f"Caricati dati storici per {len(data_map)} ticker.")
+        return data_map
+
+    # -----------------------
+    # Wrapper Portfolio
+    # -----------------------
+    async def load_portfolio(self, include_trades: bool = True) -> dict:
+        """
+        Vedi DatabaseManager.load_portfolio.
+        Le SELECT partono insieme in pipeline mode: un solo round trip
+        invece di query sequenziali.
+        """
+        self.logger.info("[DB] Caricamento completo del portafoglio (pipeline)...")
+        queries = [SQL_LOAD_PORTFOLIO, SQL_LOAD_CASH]
+        if include_trades:
+            queries.append(SQL_LOAD_TRADES)
+
+        async with self.conn.pipeline():
+            cursors = [self.conn.cursor() for _ in queries]
+            for cur, sql in zip(cursors, queries):
+                await cur.execute(sql)
+
+            results = []
+            for cur in cursors:
+                rows = await cur.fetchall()
+                results.append(pd.DataFrame(rows) if rows else pd.DataFrame())
+                await cur.close()
+
+        return {
+            "portfolio": results[0],
+            "cash": results[1],
+            "trades": results[2] if include_trades else pd.DataFrame()
+        }
+
+    async def save_portfolio(self, snapshot_dict: dict):
+        """Vedi DatabaseManager.save_portfolio (transazione unica, pipeline mode)."""
+        self.logger.info("[DB] Salvataggio completo del portafoglio...")
+        statements = portfolio_save_statements(snapshot_dict)
+
+        try:
+            async with self.conn.pipeline():
+                async with self.conn.cursor() as cur:
+                    for sql, params, many in statements:
+                        if many:
+                            await cur.executemany(sql, params)
+                        else:
+                            await cur.execute(sql, params)
+            await self.conn.commit()
+        except Exception as e:
+            await self.conn.rollback()
+            self.logger.error(f"[DB] Errore salvataggio portafoglio, rollback: {e}")
+            raise
+
+        self.logger.info(f"[DB] Portafoglio salvato (transazione unica, {len(statements)} statement).")
@@ -2,43 +2,378 @@
 from datetime import datetime, timedelta
 from typing import List, Optional
 # src/database_manager.py
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, date
+from typing import Dict, Iterator, List, Optional, Tuple
+import itertools
 import psycopg
 from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
 import pandas as pd
 # RIMOSSO: from services.get_db_secret import get_db_credentials
 from config.config import config  # <--- USIAMO QUESTO
 from src.logger import get_logger
+from src.portfolio_events import replay
+
+# ----------------------
+# SQL condiviso (usato anche da AsyncDatabaseManager)
+# ----------------------
+# Upsert OHLC in un solo statement (array + unnest).
+# Le righe identiche a quelle già salvate NON vengono riscritte (niente tuple morte
+# né WAL per il refetch degli ultimi giorni); RETURNING distingue insert e update.
+_SQL_OHLC_ON_CONFLICT = """
+    ON CONFLICT (ticker, date) DO UPDATE
+    SET open = EXCLUDED.open,
+        high = EXCLUDED.high,
+        low = EXCLUDED.low,
+        close = EXCLUDED.close,
+        volume = EXCLUDED.volume
+    WHERE (ohlc.open, ohlc.high, ohlc.low, ohlc.close, ohlc.volume)
+          IS DISTINCT FROM
+          (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)
+    RETURNING ticker, (xmax = 0) AS inserted;
+"""
+
+SQL_UPSERT_OHLC = """
+    INSERT INTO ohlc(ticker, date, open, high, low, close, volume)
+    SELECT * FROM unnest(%s::text[], %s::date[], %s::numeric[], %s::numeric[],
+                         %s::numeric[], %s::numeric[], %s::bigint[])
+""" + _SQL_OHLC_ON_CONFLICT
+
+# Variante COPY: i buffer colonnari finiscono in una tabella temporanea
+# (COPY non supporta ON CONFLICT) e da lì vengono uniti a ohlc con la stessa logica.
+SQL_CREATE_OHLC_STAGE = """
+    CREATE TEMP TABLE IF NOT EXISTS ohlc_stage
+    (LIKE ohlc INCLUDING DEFAULTS) ON COMMIT DROP;
+"""
+SQL_COPY_OHLC_STAGE = "COPY ohlc_stage (ticker, date, open, high, low, close, volume) FROM STDIN (FORMAT csv)"
+SQL_MERGE_OHLC_STAGE = """
+    INSERT INTO ohlc(ticker, date, open, high, low, close, volume)
+    SELECT ticker, date, open, high, low, close, volume FROM ohlc_stage
+""" + _SQL_OHLC_ON_CONFLICT
+
+# Righe per statement di upsert (limita la dimensione degli array inviati)
+OHLC_UPSERT_CHUNK = 50_000
+
+SQL_OHLC_SINCE_DATE = """
+    SELECT ticker, date, open, high, low, close, volume 
+    FROM ohlc 
+    WHERE date >= %s
+    ORDER BY ticker, date ASC;
+"""
+
+SQL_LOAD_PORTFOLIO = "SELECT * FROM portfolio ORDER BY ticker ASC;"
+SQL_LOAD_CASH = "SELECT * FROM portfolio_cash ORDER BY updated_at DESC;"
+SQL_LOAD_TRADES = "SELECT * FROM portfolio_trades ORDER BY date ASC;"
+
+SQL_UPSERT_PORTFOLIO = """
+    INSERT INTO portfolio(ticker, stop_loss, profit_take, size, price, updated_at)
+    VALUES (%(ticker)s, %(stop_loss)s, %(profit_take)s, %(size)s, %(price)s, %(updated_at)s)
+    ON CONFLICT (ticker) DO UPDATE 
+    SET stop_loss = EXCLUDED.stop_loss,
+        profit_take = EXCLUDED.profit_take,
+        size = EXCLUDED.size,
+        price = EXCLUDED.price,
+        updated_at = EXCLUDED.updated_at;
+"""
+
+# Le posizioni chiuse spariscono dallo snapshot in memoria: le eliminiamo anche dal DB
+SQL_DELETE_CLOSED_POSITIONS = "DELETE FROM portfolio WHERE size = 0 OR NOT (ticker = ANY(%s::text[]));"
+
+# DELETE e non TRUNCATE: nessun lock esclusivo sulla tabella mentre la dashboard legge
+SQL_DELETE_CASH = "DELETE FROM portfolio_cash;"
+
+SQL_INSERT_CASH = """
+    INSERT INTO portfolio_cash(cash, currency, updated_at)
+    VALUES (%(cash)s, %(currency)s, %(updated_at)s);
+"""
+
+# Un solo statement per tutti i trade nuovi (array + unnest).
+# trade_key è l'identificativo generato da PortfolioManager alla creazione del trade:
+# risalvare gli stessi trade non li duplica, due fill identici restano due righe.
+# Senza trade_key (chiamanti legacy) si ricade sulla chiave naturale giorno|ticker|azione|size|prezzo.
+SQL_INSERT_TRADES = """
+    INSERT INTO portfolio_trades(ticker, size, price, action, date, trade_key)
+    SELECT t.ticker, t.size, t.price, t.action, t.date,
+           COALESCE(t.trade_key, concat_ws('|', t.date::date, t.ticker, t.action, t.size, t.price))
+    FROM unnest(%s::text[], %s::int[], %s::numeric[], %s::text[], %s::timestamp[], %s::text[])
+        AS t(ticker, size, price, action, date, trade_key)
+    ON CONFLICT (trade_key) DO NOTHING;
+"""
+
+# Una riga per giorno: rieseguire il daily run nello stesso giorno la sovrascrive
+SQL_UPSERT_EQUITY = """
+    INSERT INTO portfolio_equity_history(date, cash, invested, equity, positions, updated_at)
+    VALUES (%(date)s, %(cash)s, %(invested)s, %(equity)s, %(positions)s, now())
+    ON CONFLICT (date) DO UPDATE
+    SET cash = EXCLUDED.cash,
+        invested = EXCLUDED.invested,
+        equity = EXCLUDED.equity,
+        positions = EXCLUDED.positions,
+        updated_at = EXCLUDED.updated_at;
+"""
+
+# Notifiche ai lettori (dashboard) dopo ogni scrittura.
+# pg_notify dentro la transazione: l'evento parte solo se il COMMIT va a buon fine.
+NOTIFY_CHANNEL = "petunia_updates"
+NOTIFY_OHLC = "ohlc"
+NOTIFY_PORTFOLIO = "portfolio"
+NOTIFY_ORDERS = "orders"
+SQL_NOTIFY = "SELECT pg_notify(%s, %s);"
+
+SQL_UPSERT_CHECKPOINTS = """
+    INSERT INTO ohlc_ingest_checkpoints(job, ticker, status, n_rows, error, updated_at)
+    SELECT %s, t.ticker, t.status, t.n_rows, t.error, now()
+    FROM unnest(%s::text[], %s::text[], %s::int[], %s::text[]) AS t(ticker, status, n_rows, error)
+    ON CONFLICT (job, ticker) DO UPDATE
+    SET status = EXCLUDED.status,
+        n_rows = EXCLUDED.n_rows,
+        error = EXCLUDED.error,
+        updated_at = EXCLUDED.updated_at;
+"""
+
+# Ordini pendenti: la tabella è la fonte di verità, il tab 'Orders' dello Sheet ne è una copia
+ORDER_PENDING = "PENDING"
+ORDER_FILLED = "FILLED"
+ORDER_CANCELLED = "CANCELLED"
+
+SQL_INSERT_PENDING_ORDER = """
+    INSERT INTO pending_orders(ticker, action, quantity, price, stop_loss, take_profit, reason, meta)
+    VALUES (%(ticker)s, %(action)s, %(quantity)s, %(price)s, %(stop_loss)s, %(take_profit)s, %(reason)s, %(meta)s)
+    RETURNING id;
+"""
+
+# Solo gli ordini ancora PENDING: rieseguire il run non li esegue due volte
+SQL_FILL_PENDING_ORDERS = """
+    UPDATE pending_orders AS o
+    SET status = 'FILLED', fill_price = f.price, updated_at = now()
+    FROM unnest(%s::bigint[], %s::numeric[]) AS f(id, price)
+    WHERE o.id = f.id AND o.status = 'PENDING';
+"""
+
+# Log eventi del portafoglio (append-only) + snapshot compatti periodici.
+# 'uid' generato da PortfolioManager: risalvare gli stessi eventi non li duplica.
+SQL_INSERT_PORTFOLIO_EVENT = """
+    INSERT INTO portfolio_events(uid, ts, kind, ticker, payload)
+    VALUES (%(uid)s, %(ts)s, %(kind)s, %(ticker)s, %(payload)s)
+    ON CONFLICT (uid) DO NOTHING;
+"""
+
+# Un nuovo snapshot ogni PORTFOLIO_SNAPSHOT_EVERY eventi (e il primo in assoluto, che
+# fissa lo stato precedente all'introduzione del log). Tutto lato server: niente
+# round trip extra in pipeline mode.
+# Il ts dello snapshot è quello del suo ultimo evento (stesso orologio, quello
+# dell'applicazione): niente now() del server, che potrebbe avere un altro fuso/orario.
+# Con il log ancora vuoto si usa %(ts)s, passato dall'applicazione.
+PORTFOLIO_SNAPSHOT_EVERY = 200
+SQL_MAYBE_SNAPSHOT_PORTFOLIO = """
+    INSERT INTO portfolio_snapshots(event_id, ts, state)
+    SELECT e.max_id, COALESCE(e.max_ts, %(ts)s::timestamp), %(state)s
+    FROM (
+        SELECT COALESCE(max(id), 0) AS max_id,
+               (SELECT ts FROM portfolio_events ORDER BY id DESC LIMIT 1) AS max_ts
+        FROM portfolio_events
+    ) AS e
+    WHERE NOT EXISTS (SELECT 1 FROM portfolio_snapshots)
+       OR e.max_id - (SELECT max(event_id) FROM portfolio_snapshots) >= %(every)s;
+"""
+
+
+def portfolio_event_to_params(event: dict) -> dict:
+    """Adatta un evento di PortfolioManager.get_new_events ai parametri di SQL_INSERT_PORTFOLIO_EVENT."""
+    return {**event, "payload": Jsonb(event["payload"])}
+
+
+def equity_record_to_params(record: dict) -> dict:
+    """Adatta il record di PortfolioManager.get_equity_record ai parametri di SQL_UPSERT_EQUITY."""
+    return {**record, "positions": Jsonb(record.get("positions") or {})}
+
+
+def pending_order_to_params(order: dict) -> dict:
+    """Adatta un ordine (formato DriveManager / RiskManager) ai parametri di SQL_INSERT_PENDING_ORDER."""
+    def _num(value):
+        return None if value in (None, "") else float(str(value).replace(",", "."))
+
+    meta = order.get("meta") or {}
+    return {
+        "ticker": str(order["ticker"]).strip().upper(),
+        "action": str(order.get("action", "BUY")).upper(),
+        "quantity": int(order.get("quantity", 0) or 0),
+        "price": _num(order.get("price")),
+        "stop_loss": _num(order.get("stop_loss")),
+        "take_profit": _num(order.get("take_profit")),
+        "reason": order.get("reason") or None,
+        "meta": Jsonb(meta if isinstance(meta, dict) else {"raw": str(meta)}),
+    }
+
+
+def fills_to_params(fills: List[dict]) -> tuple:
+    """[{"id", "price"}] -> array per SQL_FILL_PENDING_ORDERS."""
+    return [int(f["id"]) for f in fills], [float(f["price"]) for f in fills]
+
+
+def portfolio_save_statements(snapshot_dict: dict) -> List[Tuple[str, object, bool]]:
+    """
+    Statement di save_portfolio nell'ordine di esecuzione: [(sql, params, executemany)].
+    Unico punto in cui si traduce lo snapshot (formato di DatabaseManager.save_portfolio)
+    in SQL: DatabaseManager e AsyncDatabaseManager li eseguono nella propria transazione.
+    Una chiave assente (None) o vuota non genera statement per la tabella corrispondente.
+    """
+    df_port = snapshot_dict.get("portfolio", None)
+    flat = snapshot_dict.get("flat", False)
+    df_cash = snapshot_dict.get("cash", None)
+    df_trades = snapshot_dict.get("trades", None)
+    equity_record = snapshot_dict.get("equity", None)
+    filled_orders = snapshot_dict.get("filled_orders", None)
+    events = snapshot_dict.get("events", None)
+    state = snapshot_dict.get("state", None)
+
+    statements = []
+    if df_port is not None:
+        # Upsert delle posizioni + cancellazione di quelle chiuse (size=0 o assenti dallo snapshot).
+        # Uno snapshot vuoto svuota la tabella solo se il chiamante conferma che non ci sono
+        # posizioni aperte ("flat"): un PortfolioManager mai caricato non deve cancellare il portafoglio.
+        records = df_port.to_dict(orient="records") if not df_port.empty else []
+        if records:
+            statements.append((SQL_UPSERT_PORTFOLIO, records, True))
+        if records or flat:
+            statements.append((SQL_DELETE_CLOSED_POSITIONS, ([r["ticker"] for r in records],), False))
+
+    if df_cash is not None and not df_cash.empty:
+        # La cassa viene sovrascritta completamente
+        statements.append((SQL_DELETE_CASH, None, False))
+        statements.append((SQL_INSERT_CASH, df_cash.to_dict(orient="records"), True))
+
+    if df_trades is not None and not df_trades.empty:
+        params = trades_to_params(df_trades)
+        if params[0]:
+            statements.append((SQL_INSERT_TRADES, params, False))
+
+    if equity_record is not None:
+        statements.append((SQL_UPSERT_EQUITY, equity_record_to_params(equity_record), False))
+
+    if filled_orders:
+        statements.append((SQL_FILL_PENDING_ORDERS, fills_to_params(filled_orders), False))
+        statements.append((SQL_NOTIFY, (NOTIFY_CHANNEL, NOTIFY_ORDERS), False))
+
+    if events:
+        statements.append((SQL_INSERT_PORTFOLIO_EVENT, [portfolio_event_to_params(e) for e in events], True))
+    if state is not None:
+        statements.append((SQL_MAYBE_SNAPSHOT_PORTFOLIO,
+                           {"state": Jsonb(state), "ts": datetime.now(), "every": PORTFOLIO_SNAPSHOT_EVERY}, False))
+
+    statements.append((SQL_NOTIFY, (NOTIFY_CHANNEL, NOTIFY_PORTFOLIO), False))
+    return statements
+
+
+def ohlc_upsert_params(data: List[tuple]) -> tuple:
+    """
+    Tuple (ticker, date, open, high, low, close, volume) -> una lista per colonna.
+    Le chiavi (ticker, date) ripetute vengono ridotte all'ultima occorrenza:
+    ON CONFLICT non può aggiornare due volte la stessa riga nello stesso statement.
+    """
+    unique = {(row[0], row[1]): row for row in data}
+    return tuple(list(col) for col in zip(*unique.values()))
+
+
+def ohlc_upsert_counts(results: List[dict], total: int) -> dict:
+    """Riassunto di un upsert OHLC a partire dalle righe di RETURNING."""
+    inserted = sum(1 for r in results if r["inserted"])
+    updated = len(results) - inserted
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": total - inserted - updated,
+        "tickers": sorted({r["ticker"] for r in results})
+    }
+
+
+def ohlc_rows_to_frame(rows: List[dict]) -> pd.DataFrame:
+    """Converte le righe OHLC (dict_row) in un DataFrame con i tipi corretti."""
+    df = pd.DataFrame(rows)
+    
+    # Assicuriamoci che i tipi siano corretti (NUMERIC arriva come Decimal)
+    cols_float = ['open', 'high', 'low', 'close']
+    df[cols_float] = df[cols_float].astype(float)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def trades_to_params(df: pd.DataFrame) -> tuple:
+    """
+    Prepara i parametri (colonne come liste) per SQL_INSERT_TRADES.
+    Le righe con un 'id' valorizzato arrivano dal DB e sono già salvate: vengono scartate.
+    """
+    if "id" in df.columns:
+        df = df[df["id"].isna()]
+    keys = df["trade_key"] if "trade_key" in df.columns else [None] * len(df)
+    return (
+        df["ticker"].astype(str).tolist(),
+        df["size"].astype(int).tolist(),
+        df["price"].astype(float).tolist(),
+        df["action"].astype(str).tolist(),
+        [ts.to_pydatetime() for ts in pd.to_datetime(df["date"])],
+        [k if isinstance(k, str) and k else None for k in keys],
+    )
+
 
 class DatabaseManager:
     """
     Gestisce la connessione al DB PostgreSQL e tutte le operazioni CRUD principali
     su tabelle: ohlc, portfolio, portfolio_cash, portfolio_trades
+
+    Backend:
+    - "postgres" (default): DB di produzione.
+    - "duckdb": file embedded in sola lettura (modalità ricerca/backtest),
+      popolato da services.sync_research_db. Supporta le letture
+      (get_ohlc, get_ohlc_all_tickers, load_portfolio), non le scritture.
     """
 
-    def __init__(self):
+    BACKENDS = ("postgres", "duckdb")
+
+    def __init__(self, backend: Optional[str] = None):
         self.logger = get_logger(self.__class__.__name__)
+        self.backend = (backend or config.DB_BACKEND).lower()
+        if self.backend not in self.BACKENDS:
+            raise ValueError(f"Backend DB '{self.backend}' non supportato. Disponibili: {list(self.BACKENDS)}")
         self.conn = None
+        # Nomi univoci per i cursori server-side (streaming)
+        self._stream_ids = itertools.count()
+        self._listen_warned = False
         self._connect()
 
     def _connect(self):
         """Crea la connessione usando le variabili d'ambiente (via config)."""
+        if self.backend == "duckdb":
+            # Import locale: il backend embedded serve solo in modalità ricerca
+            from src.duckdb_backend import connect_duckdb
+            try:
+                self.conn = connect_duckdb(config.RESEARCH_DB_PATH, read_only=True)
+                self.logger.info(f"Connessione al DB di ricerca DuckDB stabilita ({config.RESEARCH_DB_PATH}).")
+            except Exception as e:
+                self.logger.error(f"Errore durante l'apertura del DB DuckDB: {e}")
+                raise
+            return
+
         try:
             # ORA LEGGIAMO DA CONFIG, NON DA FUNZIONI ESTERNE
-            self.conn = psycopg.connect(
-                host=config.DB_HOST,
-                port=int(config.DB_PORT),
-                dbname=config.DB_NAME,
-                user=config.DB_USER,
-                password=config.DB_PASSWORD,
-                row_factory=dict_row
-            )
+            self.conn = self._pg_connect()
             self.logger.info("Connessione al DB PostgreSQL stabilita.")
         except Exception as e:
             self.logger.error(f"Errore durante la connessione al DB: {e}")
             raise
 
+    @staticmethod
+    def _pg_connect(**kwargs) -> psycopg.Connection:
+        return psycopg.connect(
+            host=config.DB_HOST,
+            port=int(config.DB_PORT),
+            dbname=config.DB_NAME,
+            user=config.DB_USER,
+            password=config.DB_PASSWORD,
+            row_factory=dict_row,
+            **kwargs
+        )
+
     def close(self):
         """Chiude la connessione"""
         if self.conn:
@@ -53,6 +388,41 @@ class DatabaseManager:
             except Exception:
                 return []
 
+    # ----------------------
+    # Notifiche (LISTEN/NOTIFY)
+    # ----------------------
+    def _notify(self, cur, topic: str):
+        """Accoda una notifica nella transazione corrente (consegnata al COMMIT)."""
+        if self.backend == "postgres":
+            cur.execute(SQL_NOTIFY, (NOTIFY_CHANNEL, topic))
+
+    @property
+    def supports_notify(self) -> bool:
+        return self.backend == "postgres"
+
+    def listen(self, timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        Genera i topic notificati dalle scritture (NOTIFY_OHLC, NOTIFY_PORTFOLIO, NOTIFY_ORDERS).
+        Sui backend senza NOTIFY (duckdb) non genera nulla.
+
+        Usa una connessione dedicata in autocommit: l'attesa è bloccante e non
+        deve occupare la connessione usata per le query. Con `timeout` il generatore
+        termina dopo tanti secondi senza notifiche.
+        """
+        if not self.supports_notify:
+            # Nessuna notifica sui backend in sola lettura: il generatore termina subito
+            # (i lettori restano sull'invalidazione a TTL). Avviso una sola volta.
+            if not self._listen_warned:
+                self.logger.warning(f"[DB] LISTEN/NOTIFY non disponibile sul backend '{self.backend}': nessuna notifica.")
+                self._listen_warned = True
+            return
+
+        with self._pg_connect(autocommit=True) as listen_conn:
+            listen_conn.execute(f"LISTEN {NOTIFY_CHANNEL};")
+            self.logger.info(f"[DB] In ascolto sul canale '{NOTIFY_CHANNEL}'.")
+            for notify in listen_conn.notifies(timeout=timeout):
+                yield notify.payload
+
     # ----------------------
     # Schema management
     # ----------------------
@@ -93,13 +463,154 @@ class DatabaseManager:
                 size INT,
                 price NUMERIC,
                 action TEXT,
-                date TIMESTAMP
+                date TIMESTAMP,
+                trade_key TEXT
             );
 
             CREATE INDEX IF NOT EXISTS idx_trades_ticker_date
             ON portfolio_trades(ticker, date);
+
+            -- Ordinamento globale per data (paginazione keyset dello storico)
+            CREATE INDEX IF NOT EXISTS idx_trades_date_id
+            ON portfolio_trades(date, id);
             """)
+
+            # --- MIGRAZIONE: chiave di idempotenza sui trades ---
+            # Le versioni precedenti reinserivano tutto lo storico a ogni salvataggio:
+            # rimuoviamo i duplicati esatti (stesso timestamp) delle sole righe senza chiave,
+            # poi assegniamo alle righe legacy la chiave naturale (con un progressivo
+            # se due righe la condividono) prima di renderla univoca.
+            cur.execute("""
+            ALTER TABLE portfolio_trades ADD COLUMN IF NOT EXISTS trade_key TEXT;
+
+            DELETE FROM portfolio_trades a
+            USING portfolio_trades b
+            WHERE a.id > b.id
+              AND a.trade_key IS NULL AND b.trade_key IS NULL
+              AND a.ticker = b.ticker AND a.action = b.action
+              AND a.size = b.size AND a.price = b.price AND a.date = b.date;
+
+            UPDATE portfolio_trades t
+            SET trade_key = k.natural_key || CASE WHEN k.n > 1 THEN '#' || k.n ELSE '' END
+            FROM (
+                SELECT id, concat_ws('|', date::date, ticker, action, size, price) AS natural_key,
+                       row_number() OVER (
+                           PARTITION BY concat_ws('|', date::date, ticker, action, size, price) ORDER BY id
+                       ) AS n
+                FROM portfolio_trades
+                WHERE trade_key IS NULL
+            ) AS k
+            WHERE t.id = k.id;
+
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_trades_trade_key
+            ON portfolio_trades(trade_key);
+            """)
+
+            # --- STORICO EQUITY (una riga per giorno, scritta dal daily run) ---
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_equity_history (
+                date DATE PRIMARY KEY,
+                cash NUMERIC,
+                invested NUMERIC,
+                equity NUMERIC,
+                positions JSONB,
+                updated_at TIMESTAMP
+            );
+            """)
+
+            # --- CHECKPOINT DEI CARICAMENTI OHLC (ripresa del bootstrap interrotto) ---
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS ohlc_ingest_checkpoints (
+                job TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                status TEXT NOT NULL,
+                n_rows INT,
+                error TEXT,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (job, ticker)
+            );
+            """)
+
+            # --- BUCHI GIÀ RICHIESTI AL PROVIDER SENZA RICEVERE DATI (chiusure di mercato, titoli poco scambiati) ---
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS ohlc_checked_gaps (
+                ticker TEXT NOT NULL,
+                start_date DATE NOT NULL,
+                end_date DATE NOT NULL,
+                checked_at TIMESTAMP,
+                PRIMARY KEY (ticker, start_date, end_date)
+            );
+            """)
+
+            # --- LOG EVENTI DEL PORTAFOGLIO + SNAPSHOT (stato a una data qualsiasi) ---
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_events (
+                id BIGSERIAL PRIMARY KEY,
+                uid TEXT NOT NULL UNIQUE,
+                ts TIMESTAMP NOT NULL,
+                kind TEXT NOT NULL,
+                ticker TEXT,
+                payload JSONB NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_portfolio_events_ts
+            ON portfolio_events(ts, id);
+
+            CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+                id BIGSERIAL PRIMARY KEY,
+                event_id BIGINT NOT NULL,
+                ts TIMESTAMP NOT NULL,
+                state JSONB NOT NULL
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_ts
+            ON portfolio_snapshots(ts);
+            """)
+
+            # --- ORDINI PENDENTI (fonte di verità; lo Sheet 'Orders' è solo una copia) ---
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS pending_orders (
+                id BIGSERIAL PRIMARY KEY,
+                ticker TEXT NOT NULL,
+                action TEXT NOT NULL,
+                quantity INT NOT NULL,
+                price NUMERIC,
+                stop_loss NUMERIC,
+                take_profit NUMERIC,
+                reason TEXT,
+                meta JSONB,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                fill_price NUMERIC,
+                created_at TIMESTAMP NOT NULL DEFAULT now(),
+                updated_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_pending_orders_status_ticker
+            ON pending_orders(status, ticker);
+            """)
+
+            # --- SUMMARY PRE-AGGREGATI (letti dalla dashboard in O(ticker)) ---
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS ohlc_summary (
+                ticker TEXT PRIMARY KEY,
+                bars INT NOT NULL,
+                first_date DATE,
+                last_date DATE,
+                last_close NUMERIC,
+                updated_at TIMESTAMP
+            );
+            """)
+
+            # Migrazione: summary vuoto su un DB che ha già lo storico (tabella appena creata)
+            cur.execute("""
+            SELECT NOT EXISTS (SELECT 1 FROM ohlc_summary)
+               AND EXISTS (SELECT 1 FROM ohlc) AS needs_backfill;
+            """)
+            needs_backfill = cur.fetchone()["needs_backfill"]
             self.conn.commit()
+
+        if needs_backfill:
+            self.refresh_ohlc_summary()
         self.logger.info("Schema DB creato correttamente.")
 
     def drop_schema(self):
@@ -107,6 +618,13 @@ class DatabaseManager:
         self.logger.warning("Eliminazione schema DB...")
         with self.conn.cursor() as cur:
             cur.execute("""
+            DROP TABLE IF EXISTS ohlc_summary;
+            DROP TABLE IF EXISTS pending_orders;
+            DROP TABLE IF EXISTS portfolio_snapshots;
+            DROP TABLE IF EXISTS portfolio_events;
+            DROP TABLE IF EXISTS ohlc_ingest_checkpoints;
+            DROP TABLE IF EXISTS ohlc_checked_gaps;
+            DROP TABLE IF EXISTS portfolio_equity_history;
             DROP TABLE IF EXISTS portfolio_trades;
             DROP TABLE IF EXISTS portfolio_cash;
             DROP TABLE IF EXISTS portfolio;
@@ -118,7 +636,7 @@ class DatabaseManager:
     # ----------------------
     # OHLC
     # ----------------------
-    def upsert_ohlc(self, data: list[tuple]):
+    def upsert_ohlc(self, data: list[tuple]) -> dict:
         """
         Inserisce o aggiorna più righe OHLC in batch usando psycopg 3.
         
@@ -128,34 +646,133 @@ class DatabaseManager:
         Requisiti:
         - Ogni tupla deve rispettare l'ordine esatto delle colonne nella query.
         - L'ordine delle tuple nella lista non importa.
+
+        Le righe già presenti con valori identici non vengono riscritte.
+
+        Output:
+            {"inserted": int, "updated": int, "unchanged": int, "tickers": [ticker modificati]}
         """
         if not data:
             self.logger.info("Nessun dato da inserire.")
-            return
+            return ohlc_upsert_counts([], 0)
 
-        sql = """
-        INSERT INTO ohlc(ticker, date, open, high, low, close, volume)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (ticker, date) DO UPDATE
-        SET open = EXCLUDED.open,
-            high = EXCLUDED.high,
-            low = EXCLUDED.low,
-            close = EXCLUDED.close,
-            volume = EXCLUDED.volume;
+        columns = ohlc_upsert_params(data)
+        total = len(columns[0])
+        results = []
+        try:
+            with self.conn.cursor() as cur:
+                for start in range(0, total, OHLC_UPSERT_CHUNK):
+                    cur.execute(SQL_UPSERT_OHLC, tuple(col[start:start + OHLC_UPSERT_CHUNK] for col in columns))
+                    results.extend(cur.fetchall())
+                if results:
+                    self._notify(cur, NOTIFY_OHLC)
+                self.conn.commit()
+            counts = ohlc_upsert_counts(results, total)
+            self.logger.info(
+                f"[DB] Upsert OHLC: {counts['inserted']} inseriti, {counts['updated']} aggiornati, "
+                f"{counts['unchanged']} invariati."
+            )
+            return counts
+        except Exception as e:
+            self.conn.rollback()
+            self.logger.error(f"[DB] Errore durante upsert batch OHLC: {e}")
+            raise
+
+    def copy_ohlc(self, df: pd.DataFrame,
+                  checkpoint_job: Optional[str] = None,
+                  completed: Optional[Dict[str, int]] = None) -> dict:
+        """
+        Come upsert_ohlc, ma per frame colonnari (vedi MarketDataProvider.download_frame):
+        il frame viene serializzato in blocco (CSV in C, nessuna tupla Python per riga)
+        e inviato con COPY. Stesso output di upsert_ohlc.
+
+        checkpoint_job: se indicato, i ticker completati vengono segnati come tali
+        per quel job nella stessa transazione dei dati (vedi get_ingest_checkpoints).
+        completed: {ticker: righe} da segnare come completati; default tutti i ticker
+        del frame (quando il frame contiene tutto il loro download).
         """
+        if df is None or df.empty:
+            self.logger.info("Nessun dato da inserire.")
+            return ohlc_upsert_counts([], 0)
 
+        df = df.drop_duplicates(["ticker", "date"], keep="last")
+        buffer = df[["ticker", "date", "open", "high", "low", "close", "volume"]].to_csv(
+            index=False, header=False, date_format="%Y-%m-%d"
+        )
         try:
             with self.conn.cursor() as cur:
-                cur.executemany(sql, data)
+                cur.execute(SQL_CREATE_OHLC_STAGE)
+                with cur.copy(SQL_COPY_OHLC_STAGE) as copy:
+                    copy.write(buffer)
+                cur.execute(SQL_MERGE_OHLC_STAGE)
+                results = cur.fetchall()
+                if checkpoint_job:
+                    rows_by_ticker = df["ticker"].value_counts() if completed is None else completed
+                    self._save_ingest_checkpoints(cur, checkpoint_job, {
+                        t: {"status": "done", "rows": int(n), "error": None} for t, n in rows_by_ticker.items()
+                    })
+                if results:
+                    self._notify(cur, NOTIFY_OHLC)
                 self.conn.commit()
-            self.logger.info(f"[DB] Inseriti/aggiornati {len(data)} record OHLC.")
+            counts = ohlc_upsert_counts(results, len(df))
+            self.logger.info(
+                f"[DB] COPY OHLC: {counts['inserted']} inseriti, {counts['updated']} aggiornati, "
+                f"{counts['unchanged']} invariati."
+            )
+            return counts
         except Exception as e:
             self.conn.rollback()
-            self.logger.error(f"[DB] Errore durante upsert batch OHLC: {e}")
+            self.logger.error(f"[DB] Errore durante COPY OHLC: {e}")
             raise
 
+    # ----------------------
+    # Checkpoint caricamenti
+    # ----------------------
+    def _save_ingest_checkpoints(self, cur, job: str, entries: Dict[str, dict]):
+        tickers = list(entries)
+        if not tickers:
+            return
+        cur.execute(SQL_UPSERT_CHECKPOINTS, (
+            job, tickers,
+            [entries[t]["status"] for t in tickers],
+            [entries[t].get("rows") for t in tickers],
+            [entries[t].get("error") for t in tickers],
+        ))
+
+    def save_ingest_checkpoints(self, job: str, entries: Dict[str, dict]):
+        """
+        Registra l'esito per ticker di un caricamento.
+        entries: {ticker: {"status": "done" | "failed", "rows": int, "error": str | None}}
+        """
+        if not entries:
+            return
+        with self.conn.cursor() as cur:
+            self._save_ingest_checkpoints(cur, job, entries)
+        self.conn.commit()
+
+    def get_ingest_checkpoints(self, job: str) -> Dict[str, dict]:
+        """Esito registrato per ogni ticker del job: {ticker: {"status", "rows", "error", "updated_at"}}."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT ticker, status, n_rows AS rows, error, updated_at
+                FROM ohlc_ingest_checkpoints
+                WHERE job = %s;
+            """, (job,))
+            rows = cur.fetchall()
+        return {r.pop("ticker"): r for r in rows}
+
+    def clear_ingest_checkpoints(self, job: str):
+        """Chiude un job completato: il prossimo caricamento riparte dagli high-water mark."""
+        with self.conn.cursor() as cur:
+            cur.execute("DELETE FROM ohlc_ingest_checkpoints WHERE job = %s;", (job,))
+        self.conn.commit()
+
     def get_ohlc(self, tickers: list[str], start_date: str, end_date: str) -> List[dict]:
-        """Restituisce OHLC tra due date per uno o più ticker"""
+        """
+        Restituisce OHLC tra due date per uno o più ticker, come lista di righe.
+        Pensata per finestre brevi (verifiche, dashboard): le letture grandi
+        passano da iter_ohlc / iter_ohlc_by_ticker, in streaming.
+        """
         if not tickers:
             return []
 
@@ -172,7 +789,9 @@ class DatabaseManager:
     def get_ohlc_all_tickers(self, days: int = 365) -> dict:
         """
         Recupera lo storico degli ultimi N giorni per TUTTI i ticker nel DB.
-        Restituisce un dizionario ottimizzato per le strategie:
+        Restituisce un dizionario ottimizzato per le strategie.
+        Per letture ripetute di storico lungo (backtest) usare OhlcCache, stesso contratto;
+        per un solo passaggio sui ticker iter_ohlc_by_ticker, senza tenere il dizionario in memoria.
         
         Output:
             {
@@ -184,157 +803,493 @@ class DatabaseManager:
         # Calcolo data limite
         cutoff_date = (datetime.now() - timedelta(days=days)).date()
         
-        # Query unica (molto più veloce di fare un loop per ogni ticker)
-        query = """
-            SELECT ticker, date, open, high, low, close, volume 
-            FROM ohlc 
-            WHERE date >= %s
+        # Query unica letta a blocchi da un cursore server-side: in memoria
+        # restano solo i DataFrame finali più un blocco di righe alla volta
+        data_map = dict(self.iter_ohlc_by_ticker(start_date=cutoff_date))
+
+        if not data_map:
+            self.logger.warning(f"Nessun dato OHLC trovato negli ultimi {days} giorni.")
+            return {}
+        
+        self.logger.info(f"Caricati dati storici per {len(data_map)} ticker.")
+        return data_map
+
+    def iter_ohlc(self,
+                  tickers: Optional[List[str]] = None,
+                  start_date=None,
+                  end_date=None,
+                  batch_size: int = 50_000) -> Iterator[pd.DataFrame]:
+        """
+        Streaming OHLC: generatore di DataFrame tipizzati di al massimo `batch_size` righe,
+        ordinati per (ticker, date). Usa un cursore server-side (named cursor):
+        il result set non viene mai materializzato per intero lato client.
+
+        Nota: durante l'iterazione non eseguire commit sulla stessa connessione
+        (chiuderebbe il cursore server-side).
+        """
+        conditions, params = [], []
+        if tickers:
+            conditions.append("ticker = ANY(%s::text[])")
+            params.append(list(tickers))
+        if start_date is not None:
+            conditions.append("date >= %s")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("date <= %s")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        query = f"""
+            SELECT ticker, date, open, high, low, close, volume
+            FROM ohlc
+            {where}
             ORDER BY ticker, date ASC;
         """
-        
+        with self.conn.cursor(name=f"ohlc_stream_{next(self._stream_ids)}") as cur:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield ohlc_rows_to_frame(rows)
+
+    def iter_ohlc_by_ticker(self, **kwargs) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Come iter_ohlc (stessi filtri), ma restituisce coppie (ticker, DataFrame)
+        con lo storico COMPLETO di un ticker alla volta.
+        """
+        pending: List[pd.DataFrame] = []
+        pending_ticker = None
+
+        for batch in self.iter_ohlc(**kwargs):
+            for ticker, df in batch.groupby('ticker', sort=False):
+                if pending_ticker is not None and ticker != pending_ticker:
+                    yield pending_ticker, pd.concat(pending, ignore_index=True)
+                    pending = []
+                pending_ticker = ticker
+                pending.append(df)
+
+        if pending_ticker is not None:
+            yield pending_ticker, pd.concat(pending, ignore_index=True)
+
+    def get_ohlc_since(self, high_water_marks: Dict[str, date], overlap_days: int = 0) -> List[dict]:
+        """
+        Sync incrementale: restituisce solo le righe OHLC più recenti
+        dell'high-water mark di ciascun ticker.
+
+        Parametri:
+        - high_water_marks: {ticker: ultima data già posseduta}. I ticker assenti
+          dal dizionario vengono restituiti con tutto lo storico.
+        - overlap_days: giorni di sovrapposizione riletti prima dell'high-water mark
+          (le ultime candele possono essere state riscritte dall'upsert giornaliero).
+        """
+        tickers = list(high_water_marks.keys())
+        last_dates = [high_water_marks[t] for t in tickers]
+
+        # Una sola query: join con l'elenco (ticker, last_date) passato come array
+        query = """
+            SELECT o.ticker, o.date, o.open, o.high, o.low, o.close, o.volume
+            FROM ohlc o
+            LEFT JOIN unnest(%s::text[], %s::date[]) AS hw(ticker, last_date)
+                ON hw.ticker = o.ticker
+            WHERE hw.last_date IS NULL OR o.date > hw.last_date - %s::int
+            ORDER BY o.ticker, o.date ASC;
+        """
         with self.conn.cursor() as cur:
-            cur.execute(query, (cutoff_date,))
+            cur.execute(query, (tickers, last_dates, overlap_days))
             rows = cur.fetchall()
 
-        if not rows:
-            self.logger.warning(f"Nessun dato OHLC trovato negli ultimi {days} giorni.")
+        self.logger.info(f"[DB] Sync incrementale OHLC: {len(rows)} righe nuove/aggiornate.")
+        return rows
+
+    def get_ohlc_high_water_marks(self, tickers: List[str]) -> Dict[str, Optional[date]]:
+        """
+        Ultima data salvata per ogni ticker richiesto (None se il ticker non ha dati).
+        Un MAX per ticker sull'indice della PK: costo proporzionale ai ticker, non alle righe.
+        """
+        if not tickers:
             return {}
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT t.ticker, (SELECT MAX(o.date) FROM ohlc o WHERE o.ticker = t.ticker) AS last_date
+                FROM unnest(%s::text[]) AS t(ticker);
+            """, (list(tickers),))
+            rows = cur.fetchall()
+        return {r["ticker"]: r["last_date"] for r in rows}
 
-        # Creiamo un UNICO DataFrame gigante
-        df_all = pd.DataFrame(rows)
-        
-        # Assicuriamoci che i tipi siano corretti
-        cols_float = ['open', 'high', 'low', 'close']
-        df_all[cols_float] = df_all[cols_float].astype(float)
-        df_all['date'] = pd.to_datetime(df_all['date'])
-        
-        # TRUCCO PANDAS: Groupby per splittare in dizionario
-        # Questo crea: {'AAPL': df_aapl, 'TSLA': df_tsla, ...}
-        # È molto performante.
-        data_map = {ticker: df for ticker, df in df_all.groupby('ticker')}
-        
-        self.logger.info(f"Caricati dati storici per {len(data_map)} ticker.")
-        return data_map
+    def find_ohlc_gaps(self, tickers: Optional[List[str]] = None, min_gap_days: int = 5) -> List[dict]:
+        """
+        Buchi nello storico: candele consecutive distanti più di `min_gap_days` giorni
+        (weekend e festività brevi non contano). Sono esclusi i buchi contenuti in un
+        intervallo già richiesto al provider senza ricevere dati (vedi mark_ohlc_gaps_checked):
+        chiusure di mercato più lunghe o titoli poco scambiati non si riscaricano a ogni init.
 
+        Output:
+            [{"ticker": str, "start": date, "end": date}, ...]
+            start = giorno dopo l'ultima candela prima del buco, end = prima candela dopo (esclusa).
+        """
+        where = "WHERE ticker = ANY(%s::text[])" if tickers is not None else ""
+        params = [list(tickers)] if tickers is not None else []
+        params.append(min_gap_days)
 
-    # ----------------------
-    # Portfolio
-    # ----------------------
-    # ----------------------
-    # Portfolio Snapshot
-    # ----------------------
-    def _load_portfolio_snapshot(self) -> pd.DataFrame:
-        """Carica l'intero portafoglio come DataFrame."""
-        query = "SELECT * FROM portfolio ORDER BY ticker ASC;"
         with self.conn.cursor() as cur:
-            cur.execute(query)
+            cur.execute(f"""
+                SELECT ticker, prev_date + 1 AS start, date AS "end"
+                FROM (
+                    SELECT ticker, date, LAG(date) OVER (PARTITION BY ticker ORDER BY date) AS prev_date
+                    FROM ohlc
+                    {where}
+                ) d
+                WHERE date - prev_date > %s
+                  AND NOT EXISTS (
+                      SELECT 1 FROM ohlc_checked_gaps c
+                      WHERE c.ticker = d.ticker AND c.start_date <= d.prev_date + 1 AND c.end_date >= d.date
+                  )
+                ORDER BY ticker, start;
+            """, params)
             rows = cur.fetchall()
-        return pd.DataFrame(rows) if rows else pd.DataFrame()
 
-    def _save_portfolio_snapshot(self, df: pd.DataFrame):
+        if rows:
+            self.logger.warning(f"[DB] Trovati {len(rows)} buchi nello storico OHLC.")
+        return rows
+
+    def mark_ohlc_gaps_checked(self, gaps: List[dict]):
         """
-        Aggiorna la tabella portfolio usando UPSERT (più sicuro del TRUNCATE).
-        Gestisce anche la cancellazione di posizioni chiuse (size=0).
+        Registra buchi (formato di find_ohlc_gaps) già richiesti al provider senza
+        ricevere righe: find_ohlc_gaps non li restituisce più.
         """
-        if df.empty:
-            self.logger.warning("[DB] DataFrame portfolio vuoto.")
+        if not gaps:
             return
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ohlc_checked_gaps(ticker, start_date, end_date, checked_at)
+                SELECT g.ticker, g.start_date, g.end_date, now()
+                FROM unnest(%s::text[], %s::date[], %s::date[]) AS g(ticker, start_date, end_date)
+                ON CONFLICT (ticker, start_date, end_date) DO UPDATE SET checked_at = EXCLUDED.checked_at;
+            """, ([g["ticker"] for g in gaps], [g["start"] for g in gaps], [g["end"] for g in gaps]))
+        self.conn.commit()
+        self.logger.info(f"[DB] {len(gaps)} buchi senza dati dal provider: non verranno riprovati.")
 
-        self.logger.info("[DB] Upsert snapshot portfolio...")
-        
-        # Converto timestamp in stringa se necessario, o mi assicuro che sia datetime
-        records = df.to_dict(orient="records")
-
-        sql = """
-            INSERT INTO portfolio(ticker, stop_loss, profit_take, size, price, updated_at)
-            VALUES (%(ticker)s, %(stop_loss)s, %(profit_take)s, %(size)s, %(price)s, %(updated_at)s)
-            ON CONFLICT (ticker) DO UPDATE 
-            SET stop_loss = EXCLUDED.stop_loss,
-                profit_take = EXCLUDED.profit_take,
-                size = EXCLUDED.size,
-                price = EXCLUDED.price,
-                updated_at = EXCLUDED.updated_at;
+    # ----------------------
+    # Summary (pre-aggregati)
+    # ----------------------
+    def refresh_ohlc_summary(self, tickers: Optional[List[str]] = None):
         """
+        Ricalcola copertura, ultima candela e ultimo close in 'ohlc_summary'.
+        Con `tickers` il ricalcolo è incrementale: solo i ticker appena aggiornati
+        (scansione sull'indice della PK di ohlc). Senza, ricostruisce tutto.
+        """
+        if tickers is not None and not tickers:
+            return
+        where = "WHERE o.ticker = ANY(%s::text[])" if tickers is not None else ""
+        params = (list(tickers),) if tickers is not None else ()
 
+        sql = f"""
+            INSERT INTO ohlc_summary(ticker, bars, first_date, last_date, last_close, updated_at)
+            SELECT o.ticker, COUNT(*), MIN(o.date), MAX(o.date),
+                   (array_agg(o.close ORDER BY o.date DESC))[1], now()
+            FROM ohlc o
+            {where}
+            GROUP BY o.ticker
+            ON CONFLICT (ticker) DO UPDATE
+            SET bars = EXCLUDED.bars,
+                first_date = EXCLUDED.first_date,
+                last_date = EXCLUDED.last_date,
+                last_close = EXCLUDED.last_close,
+                updated_at = EXCLUDED.updated_at;
+        """
         try:
             with self.conn.cursor() as cur:
-                cur.executemany(sql, records)
-                # Opzionale: Pulizia posizioni chiuse (size = 0)
-                cur.execute("DELETE FROM portfolio WHERE size = 0;")
+                cur.execute(sql, params)
+                self._notify(cur, NOTIFY_OHLC)
                 self.conn.commit()
-            self.logger.info(f"[DB] Upsert completato per {len(df)} record.")
+            scope = f"{len(tickers)} ticker" if tickers is not None else "tutti i ticker"
+            self.logger.info(f"[DB] ohlc_summary aggiornato ({scope}).")
         except Exception as e:
-            self.logger.error(f"[DB] Errore upsert portfolio: {e}")
             self.conn.rollback()
+            self.logger.error(f"[DB] Errore aggiornamento ohlc_summary: {e}")
             raise
 
+    def get_ohlc_summary(self) -> pd.DataFrame:
+        """Copertura dati per ticker, letta dalla tabella pre-aggregata."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT ticker, bars AS count, first_date, last_date, last_close
+                FROM ohlc_summary
+                ORDER BY ticker ASC;
+            """)
+            rows = cur.fetchall()
+        return pd.DataFrame(rows) if rows else pd.DataFrame()
+
+    def get_portfolio_summary(self) -> dict:
+        """
+        KPI aggregati del portafoglio calcolati dal DB (nessun DataFrame intermedio):
+        cassa, capitale investito, equity e numero di posizioni.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                    COALESCE((SELECT cash FROM portfolio_cash ORDER BY updated_at DESC LIMIT 1), 0) AS cash,
+                    COALESCE((SELECT currency FROM portfolio_cash ORDER BY updated_at DESC LIMIT 1), 'EUR') AS currency,
+                    COALESCE(SUM(p.size * p.price), 0) AS invested,
+                    COUNT(p.ticker) AS positions
+                FROM portfolio p;
+            """)
+            row = cur.fetchone()
+        cash = float(row["cash"])
+        invested = float(row["invested"])
+        return {
+            "cash": cash,
+            "currency": row["currency"],
+            "invested": invested,
+            "equity": cash + invested,
+            "positions": int(row["positions"])
+        }
+
+
+    # ----------------------
+    # Portfolio
+    # ----------------------
+    # ----------------------
+    # Portfolio Snapshot
+    # ----------------------
+    def _load_portfolio_snapshot(self) -> pd.DataFrame:
+        """Carica l'intero portafoglio come DataFrame."""
+        with self.conn.cursor() as cur:
+            cur.execute(SQL_LOAD_PORTFOLIO)
+            rows = cur.fetchall()
+        return pd.DataFrame(rows) if rows else pd.DataFrame()
 
     # ----------------------
     # Portfolio Cash
     # ----------------------
     def _load_portfolio_cash(self) -> pd.DataFrame:
         """Carica la situazione di cassa del portafoglio."""
-        query = "SELECT * FROM portfolio_cash ORDER BY updated_at DESC;"
         with self.conn.cursor() as cur:
-            cur.execute(query)
+            cur.execute(SQL_LOAD_CASH)
             rows = cur.fetchall()
         return pd.DataFrame(rows) if rows else pd.DataFrame()
 
-    def _save_portfolio_cash(self, df: pd.DataFrame):
+    # ----------------------
+    # Portfolio Trades
+    # ----------------------
+    def _load_portfolio_trades(self) -> pd.DataFrame:
+        """Carica la cronologia delle operazioni di trading."""
+        with self.conn.cursor() as cur:
+            cur.execute(SQL_LOAD_TRADES)
+            rows = cur.fetchall()
+        return pd.DataFrame(rows) if rows else pd.DataFrame()
+
+    def get_trades_page(self,
+                        limit: int = 50,
+                        cursor: Optional[Tuple[datetime, int]] = None,
+                        ticker: Optional[str] = None,
+                        action: Optional[str] = None,
+                        start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        newest_first: bool = True) -> Tuple[pd.DataFrame, Optional[Tuple[datetime, int]]]:
         """
-        Sovrascrive completamente la tabella 'portfolio_cash' con il contenuto del DataFrame.
+        Una pagina dello storico trades, con paginazione keyset su (date, id).
+
+        A differenza di OFFSET, il costo non cresce con il numero di pagine:
+        la query riparte dall'ultima riga vista usando l'indice idx_trades_date_id.
+
+        Args:
+            limit: righe per pagina.
+            cursor: valore restituito dalla pagina precedente (None = prima pagina).
+            ticker / action: filtri opzionali (es. "AAPL", "BUY").
+            start_date / end_date: intervallo di date, estremi inclusi.
+            newest_first: True = dal trade più recente al più vecchio.
+
+        Returns:
+            (DataFrame della pagina, cursore per la pagina successiva o None se finita)
         """
-        if df.empty:
-            self.logger.warning("[DB] DataFrame vuoto: portfolio_cash non aggiornato.")
-            return
+        conditions, params = [], []
+        if ticker:
+            conditions.append("ticker = %s")
+            params.append(ticker)
+        if action:
+            conditions.append("action = %s")
+            params.append(action)
+        if start_date:
+            conditions.append("date >= %s")
+            params.append(pd.Timestamp(start_date).to_pydatetime())
+        if end_date:
+            # 'date' è un TIMESTAMP: l'estremo incluso diventa "< giorno successivo"
+            conditions.append("date < %s")
+            params.append((pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).to_pydatetime())
+        if cursor is not None:
+            conditions.append("(date, id) < (%s, %s)" if newest_first else "(date, id) > (%s, %s)")
+            params.extend(cursor)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "DESC" if newest_first else "ASC"
+        # Una riga in più per sapere se esiste una pagina successiva
+        params.append(limit + 1)
 
-        self.logger.info("[DB] Salvataggio snapshot portfolio_cash (truncate + insert)...")
         with self.conn.cursor() as cur:
-            cur.execute("TRUNCATE TABLE portfolio_cash;")
-            records = df.to_dict(orient="records")
-            cur.executemany("""
-                INSERT INTO portfolio_cash(cash, currency, updated_at)
-                VALUES (%(cash)s, %(currency)s, %(updated_at)s);
-            """, records)
-            self.conn.commit()
-        self.logger.info(f"[DB] Salvati {len(df)} record in 'portfolio_cash'.")
+            cur.execute(f"""
+                SELECT id, ticker, size, price, action, date
+                FROM portfolio_trades
+                {where}
+                ORDER BY date {order}, id {order}
+                LIMIT %s;
+            """, params)
+            rows = cur.fetchall()
 
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            return pd.DataFrame(), None
+
+        next_cursor = (rows[-1]["date"], rows[-1]["id"]) if has_more else None
+        return pd.DataFrame(rows), next_cursor
 
     # ----------------------
-    # Portfolio Trades
+    # Storico Equity
     # ----------------------
-    def _load_portfolio_trades(self) -> pd.DataFrame:
-        """Carica la cronologia delle operazioni di trading."""
-        query = "SELECT * FROM portfolio_trades ORDER BY date ASC;"
+    def get_equity_history(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """
+        Serie storica giornaliera di cassa, investito ed equity (una range scan sulla PK).
+        Le valorizzazioni per posizione restano nella colonna 'positions' ({ticker: {size, price}}).
+        """
+        conditions, params = [], []
+        if start_date:
+            conditions.append("date >= %s")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= %s")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
         with self.conn.cursor() as cur:
-            cur.execute(query)
+            cur.execute(f"""
+                SELECT date, cash, invested, equity, positions
+                FROM portfolio_equity_history
+                {where}
+                ORDER BY date ASC;
+            """, params)
             rows = cur.fetchall()
-        return pd.DataFrame(rows) if rows else pd.DataFrame()
 
-    def _save_portfolio_trades(self, df: pd.DataFrame):
+        if not rows:
+            return pd.DataFrame()
+        df = pd.DataFrame(rows)
+        df[['cash', 'invested', 'equity']] = df[['cash', 'invested', 'equity']].astype(float)
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    # ----------------------
+    # Log eventi del portafoglio
+    # ----------------------
+    def get_portfolio_state(self, as_of: Optional[datetime] = None) -> dict:
         """
-        Inserisce nuovi record nella tabella 'portfolio_trades' (append only).
+        Stato del portafoglio a una data (default: adesso), ricostruito dallo snapshot
+        più recente non successivo ad `as_of` + gli eventi successivi fino ad `as_of`.
+        Formato di src.portfolio_events.empty_state; i prezzi si prendono dalla tabella ohlc.
+
+        Solleva ValueError se non c'è uno snapshot non successivo ad `as_of`: il primo
+        snapshot fissa lo stato preesistente al log (dati legacy), prima non è ricostruibile.
         """
-        if df.empty:
-            self.logger.warning("[DB] DataFrame vuoto: nessuna operazione salvata.")
-            return
+        as_of = as_of or datetime.now()
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT event_id, state FROM portfolio_snapshots
+                WHERE ts <= %s
+                ORDER BY ts DESC, id DESC
+                LIMIT 1;
+            """, (as_of,))
+            snapshot = cur.fetchone()
+            if snapshot is None:
+                raise ValueError(f"Nessuno snapshot del portafoglio al {as_of}: stato non ricostruibile.")
+            cur.execute("""
+                SELECT ts, kind, ticker, payload FROM portfolio_events
+                WHERE id > %s AND ts <= %s
+                ORDER BY id ASC;
+            """, (snapshot["event_id"], as_of))
+            events = cur.fetchall()
+
+        return replay(snapshot["state"], events)
 
-        self.logger.info("[DB] Inserimento operazioni in 'portfolio_trades'...")
+    # ----------------------
+    # Ordini Pendenti
+    # ----------------------
+    def get_pending_orders(self, tickers: Optional[List[str]] = None) -> List[dict]:
+        """
+        Ordini ancora da eseguire (status PENDING), nell'ordine di inserimento.
+        Stesso formato di DriveManager.get_pending_orders, più la chiave 'id'.
+        """
+        ticker_filter = "AND ticker = ANY(%s::text[])" if tickers is not None else ""
+        params = [ORDER_PENDING] + ([list(tickers)] if tickers is not None else [])
         with self.conn.cursor() as cur:
-            records = df.to_dict(orient="records")
-            cur.executemany("""
-                INSERT INTO portfolio_trades(ticker, size, price, action, date)
-                VALUES (%(ticker)s, %(size)s, %(price)s, %(action)s, %(date)s);
-            """, records)
+            cur.execute(f"""
+                SELECT id, action, ticker, quantity, price, stop_loss, take_profit, reason, meta
+                FROM pending_orders
+                WHERE status = %s {ticker_filter}
+                ORDER BY id ASC;
+            """, params)
+            rows = cur.fetchall()
+
+        for r in rows:
+            for col in ("price", "stop_loss", "take_profit"):
+                r[col] = float(r[col]) if r[col] is not None else None
+            r["meta"] = r["meta"] or {}
+        return rows
+
+    def add_pending_orders(self, orders: List[dict]) -> List[int]:
+        """Inserisce nuovi ordini PENDING (una transazione). Restituisce gli id assegnati, nell'ordine di `orders`."""
+        if not orders:
+            return []
+        try:
+            ids = []
+            with self.conn.cursor() as cur:
+                cur.executemany(SQL_INSERT_PENDING_ORDER, [pending_order_to_params(o) for o in orders], returning=True)
+                while True:
+                    ids.append(cur.fetchone()["id"])
+                    if not cur.nextset():
+                        break
+                self._notify(cur, NOTIFY_ORDERS)
             self.conn.commit()
-        self.logger.info(f"[DB] Salvate {len(df)} operazioni in 'portfolio_trades'.")
+            self.logger.info(f"[DB] Inseriti {len(orders)} ordini pendenti.")
+            return ids
+        except Exception as e:
+            self.conn.rollback()
+            self.logger.error(f"[DB] Errore inserimento ordini pendenti: {e}")
+            raise
+
+    def import_pending_orders(self, orders: List[dict]) -> int:
+        """
+        Migrazione una tantum dal tab 'Orders' dello Sheet: inserisce gli ordini
+        solo se la tabella non ha mai avuto righe. Restituisce quanti ne ha importati.
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pending_orders) AS has_orders;")
+            has_orders = cur.fetchone()["has_orders"]
+        if has_orders or not orders:
+            return 0
+        self.add_pending_orders(orders)
+        return len(orders)
+
+    def cancel_pending_orders(self, order_ids: List[int]):
+        """Annulla ordini ancora PENDING."""
+        if not order_ids:
+            return
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE pending_orders
+                SET status = %s, updated_at = now()
+                WHERE id = ANY(%s::bigint[]) AND status = %s;
+            """, (ORDER_CANCELLED, [int(i) for i in order_ids], ORDER_PENDING))
+            self._notify(cur, NOTIFY_ORDERS)
+        self.conn.commit()
 
     # -----------------------
     # Wrapper Portfolio
     # -----------------------
-    def load_portfolio(self) -> dict:
+    def load_portfolio(self, include_trades: bool = True) -> dict:
         """
         Restituisce un dizionario completo con portfolio, cash e trades.
+        Con include_trades=False lo storico trades non viene letto
+        ("trades" è un DataFrame vuoto): i run operativi non ne hanno bisogno.
 
         Output:
             {
@@ -347,7 +1302,7 @@ class DatabaseManager:
         return {
             "portfolio": self._load_portfolio_snapshot(),
             "cash": self._load_portfolio_cash(),
-            "trades": self._load_portfolio_trades()
+            "trades": self._load_portfolio_trades() if include_trades else pd.DataFrame()
         }
 
     def save_portfolio(self, snapshot_dict: dict):
@@ -357,11 +1312,34 @@ class DatabaseManager:
         Input:
             {
                 "portfolio": DataFrame,
+                "flat": bool          (opzionale, True = "portfolio" vuoto perché non ci sono posizioni aperte)
                 "cash": DataFrame,
-                "trades": DataFrame
+                "trades": DataFrame   (solo i trade nuovi, vedi PortfolioManager.get_new_trades)
+                "equity": dict        (opzionale, vedi PortfolioManager.get_equity_record)
+                "filled_orders": list (opzionale, [{"id", "price"}] degli ordini pendenti eseguiti)
+                "events": list        (opzionale, vedi PortfolioManager.get_new_events)
+                "state": dict         (opzionale, stato compatto per gli snapshot del log eventi)
             }
+
+        Tutto in UNA transazione (o si salva tutto o niente: cassa e posizioni
+        restano coerenti anche se il processo muore a metà) e in pipeline mode,
+        così upsert, delete e insert viaggiano insieme in pochi round trip.
+        Una chiave assente (None) lascia invariata la tabella corrispondente.
         """
         self.logger.info("[DB] Salvataggio completo del portafoglio...")
-        self._save_portfolio_snapshot(snapshot_dict.get("portfolio", None))
-        self._save_portfolio_cash(snapshot_dict.get("cash", None))
-        self._save_portfolio_trades(snapshot_dict.get("trades", None))
\ No newline at end of file
+        statements = portfolio_save_statements(snapshot_dict)
+
+        try:
+            with self.conn.pipeline():
+                with self.conn.cursor() as cur:
+                    for sql, params, many in statements:
+                        if many:
+                            cur.executemany(sql, params)
+                        else:
+                            cur.execute(sql, params)
+            self.conn.commit()
+            self.logger.info(f"[DB] Portafoglio salvato (transazione unica, {len(statements)} statement).")
+        except Exception as e:
+            self.conn.rollback()
+            self.logger.error(f"[DB] Errore salvataggio portafoglio, rollback: {e}")
+            raise
\ No newline at end of file
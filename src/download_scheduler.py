@@ -0,0 +1,136 @@
+# src/download_scheduler.py
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+import pandas as pd
+
+from src.logger import get_logger
+
+# fetch_fn(tickers, start, end) -> lista di tuple (ticker, date, open, high, low, close, volume)
+# oppure DataFrame colonnare con colonna 'ticker'.
+# Può sollevare eccezioni: il chunk viene ritentato.
+FetchFn = Callable[[List[str], date, date], Union[List[Tuple], pd.DataFrame]]
+
+# Errore registrato per i ticker a cui il provider ha risposto senza righe (nessuna eccezione)
+NO_DATA_ERROR = "nessun dato ricevuto"
+
+
+class DownloadScheduler:
+    """
+    Esegue un piano di download (vedi src.fetch_planner.plan_fetches) a blocchi:
+
+    - divide i ticker di ogni voce del piano in chunk da `chunk_size`;
+    - scarica al massimo `max_workers` chunk in parallelo, e ne tiene in memoria
+      al massimo `max_pending` (in corso + pronti non ancora consumati):
+      se chi consuma (es. la scrittura sul DB) è lento, i download si fermano;
+    - ritenta SOLO i ticker falliti (eccezione o nessuna riga ricevuta),
+      con backoff esponenziale, fino a `max_retries` volte;
+    - restituisce i risultati chunk per chunk (generatore), così l'ingest
+      può scrivere sul DB mentre gli altri download sono ancora in corso.
+
+    Dopo l'esecuzione `status` contiene l'esito per ticker:
+        {"AAPL": {"rows": 250, "attempts": 1, "error": None}, ...}
+    """
+
+    def __init__(self,
+                 fetch_fn: FetchFn,
+                 chunk_size: int = 50,
+                 max_workers: int = 4,
+                 max_retries: int = 2,
+                 backoff_seconds: float = 2.0,
+                 max_pending: Optional[int] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.logger = get_logger(self.__class__.__name__)
+        self.fetch_fn = fetch_fn
+        self.chunk_size = max(1, chunk_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_pending = max(self.max_workers, max_pending or 2 * self.max_workers)
+        self._sleep = sleep
+        self.status: Dict[str, dict] = {}
+
+    def _chunks(self, tickers: List[str]) -> List[List[str]]:
+        return [tickers[i:i + self.chunk_size] for i in range(0, len(tickers), self.chunk_size)]
+
+    def run(self, plan: List[dict]) -> Iterator[List[Tuple]]:
+        """Esegue il piano e genera le righe scaricate, un chunk alla volta."""
+        self.status = {}
+        pending = [
+            (batch["start"], batch["end"], chunk)
+            for batch in plan
+            for chunk in self._chunks(batch["tickers"])
+        ]
+
+        attempt = 0
+        while pending:
+            attempt += 1
+            if attempt > 1:
+                delay = self.backoff_seconds * 2 ** (attempt - 2)
+                n_tickers = sum(len(chunk) for _, _, chunk in pending)
+                self.logger.warning(f"Nuovo tentativo ({attempt}) per {n_tickers} ticker tra {delay:.1f}s...")
+                self._sleep(delay)
+
+            retry = []
+            queue = iter(pending)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                in_flight = {}
+                while True:
+                    # Backpressure: nuovi chunk solo quando quelli già pronti sono stati consumati
+                    for start, end, chunk in queue:
+                        in_flight[pool.submit(self.fetch_fn, chunk, start, end)] = (start, end, chunk)
+                        if len(in_flight) >= self.max_pending:
+                            break
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start, end, chunk = in_flight.pop(future)
+                        rows, error = self._result(future)
+                        failed = self._record(rows, chunk, attempt, error)
+
+                        if failed:
+                            if attempt <= self.max_retries:
+                                retry.append((start, end, failed))
+                            else:
+                                for ticker in failed:
+                                    self.status[ticker]["error"] = error or NO_DATA_ERROR
+                        if len(rows):
+                            yield rows
+            pending = retry
+
+        failed = self.failed_tickers()
+        if failed:
+            self.logger.error(f"Download falliti dopo {attempt} tentativi: {failed}")
+
+    @staticmethod
+    def _result(future) -> Tuple[Union[List[Tuple], pd.DataFrame], Optional[str]]:
+        try:
+            rows = future.result()
+            return (rows if rows is not None else []), None
+        except Exception as e:
+            return [], repr(e)
+
+    @staticmethod
+    def _count_by_ticker(rows: Union[List[Tuple], pd.DataFrame]) -> Dict[str, int]:
+        if isinstance(rows, pd.DataFrame):
+            return rows["ticker"].value_counts().to_dict() if not rows.empty else {}
+        received: Dict[str, int] = {}
+        for row in rows:
+            received[row[0]] = received.get(row[0], 0) + 1
+        return received
+
+    def _record(self, rows, chunk: List[str], attempt: int, error: Optional[str]) -> List[str]:
+        """Aggiorna lo stato per ticker e restituisce i ticker del chunk senza righe."""
+        received = self._count_by_ticker(rows)
+
+        for ticker in chunk:
+            entry = self.status.setdefault(ticker, {"rows": 0, "attempts": 0, "error": None})
+            entry["attempts"] = max(entry["attempts"], attempt)
+            entry["rows"] += received.get(ticker, 0)
+        return [t for t in chunk if t not in received]
+
+    def failed_tickers(self) -> List[str]:
+        return sorted(t for t, s in self.status.items() if s["error"] is not None)
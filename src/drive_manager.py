@@ -1,10 +1,47 @@
 import json
+import os
+from collections import Counter
 import pandas as pd
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
 from src.logger import get_logger
 from config.config import config
 
+# Colonne del tab 'Orders' (riga di intestazione).
+# 'id' è l'id della tabella pending_orders: le righe senza id sono ordini inseriti
+# a mano sullo Sheet e non ancora importati nel DB (vedi daily_run.sync_sheet_orders).
+ORDER_HEADERS = ["id", "action", "ticker", "quantity", "price", "stop_loss", "take_profit", "reason", "meta"]
+
+
+def is_new_sheet_order(order: dict) -> bool:
+    """True se la riga del tab 'Orders' non è ancora nella tabella pending_orders (id vuoto)."""
+    return str(order.get("id", "")).strip() == ""
+
+
+def order_key(order: dict) -> tuple:
+    """(ticker, azione, quantità, prezzo): una riga senza id uguale a un ordine del DB è quell'ordine."""
+    price = order.get("price")
+    return (
+        str(order.get("ticker", "")).strip().upper(),
+        str(order.get("action") or "BUY").strip().upper(),
+        int(order.get("quantity") or 0),
+        float(str(price).replace(",", ".")) if price not in (None, "") else None,
+    )
+
+
+def unmatched_orders(rows: list, orders: list) -> list:
+    """Righe di `rows` che non corrispondono (per order_key, una a una) a nessun ordine di `orders`."""
+    available = Counter(order_key(o) for o in orders)
+    unmatched = []
+    for row in rows:
+        key = order_key(row)
+        if available[key] > 0:
+            available[key] -= 1
+        else:
+            unmatched.append(row)
+    return unmatched
+
 class DriveManager:
     """
     Gestisce l'accesso a Google Drive e Google Sheets.
@@ -12,6 +49,12 @@ class DriveManager:
     1. Autenticazione sicura via Google Secret Manager.
     2. Lettura Ticker (Universe).
     3. Gestione Ordini Pendenti (Lettura/Scrittura su Sheet condiviso).
+
+    Per ridurre latenza e quota API:
+    - spreadsheet e worksheet aperti una volta sola per istanza;
+    - letture memoizzate per la durata dell'istanza (= un run), aggiornate dalle scritture;
+    - Universe riletto solo se lo Sheet è stato modificato dall'ultima lettura
+      (copia locale in config.UNIVERSE_CACHE_PATH).
     """
 
     DEFAULT_SCOPES = [
@@ -22,6 +65,10 @@ class DriveManager:
     def __init__(self):
         self.logger = get_logger(self.__class__.__name__)
         self.gsheet_client = None
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._reads = {}
+        self._orders_height = None  # righe occupate nel tab 'Orders' (intestazione inclusa), se note
         self._authenticate()
 
     # def _get_secret(self, secret_name: str, version: str = "latest") -> dict:
@@ -51,30 +98,86 @@ class DriveManager:
             self.logger.critical(f"Errore autenticazione Google: {e}")
             raise
 
+    def _get_spreadsheet(self, sheet_id: str):
+        """Spreadsheet aperto una sola volta per istanza."""
+        if sheet_id not in self._spreadsheets:
+            self._spreadsheets[sheet_id] = self.gsheet_client.open_by_key(sheet_id)
+        return self._spreadsheets[sheet_id]
+
     def _get_worksheet(self, sheet_id: str, tab_name: str):
-        """Helper sicuro per ottenere un worksheet."""
+        """Helper sicuro per ottenere un worksheet (handle in cache)."""
+        key = (sheet_id, tab_name)
+        if key in self._worksheets:
+            return self._worksheets[key]
         try:
             # Apre lo spreadsheet per ID
-            spreadsheet = self.gsheet_client.open_by_key(sheet_id)
+            spreadsheet = self._get_spreadsheet(sheet_id)
             # Cerca il tab specifico
             try:
                 worksheet = spreadsheet.worksheet(tab_name)
             except gspread.WorksheetNotFound:
                 self.logger.warning(f"Tab '{tab_name}' non trovato. Creazione in corso...")
                 worksheet = spreadsheet.add_worksheet(title=tab_name, rows=100, cols=10)
+            self._worksheets[key] = worksheet
             return worksheet
         except Exception as e:
             self.logger.error(f"Errore accesso Sheet {sheet_id} / Tab {tab_name}: {e}")
             raise
 
+    def invalidate_cache(self):
+        """Dimentica le letture memoizzate (gli handle restano validi)."""
+        self._reads.clear()
+
+    def _modified_time(self, spreadsheet):
+        """Ultima modifica dello Sheet (metadato Drive), None se non disponibile."""
+        try:
+            modified = spreadsheet.get_lastUpdateTime()
+            return modified if isinstance(modified, str) else None
+        except Exception as e:
+            self.logger.warning(f"Data di modifica dello Sheet non disponibile: {e}")
+            return None
+
+    def _load_universe_cache(self, sheet_id: str, modified_time: str):
+        try:
+            with open(config.UNIVERSE_CACHE_PATH) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("sheet_id") == sheet_id and cached.get("modified_time") == modified_time:
+            return cached.get("tickers")
+        return None
+
+    def _save_universe_cache(self, sheet_id: str, modified_time: str, tickers: list):
+        try:
+            path = config.UNIVERSE_CACHE_PATH
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"sheet_id": sheet_id, "modified_time": modified_time, "tickers": tickers}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Impossibile salvare la copia locale dell'Universe: {e}")
+
     # --- METODI PUBBLICI ---
 
     def get_universe_tickers(self) -> list[str]:
         """Legge la lista dei ticker dal foglio Universe."""
+        if "universe" in self._reads:
+            return list(self._reads["universe"])
         try:
             # Assumiamo che UNIVERSE_SHEET_ID contenga un tab (es. 'Sheet1' o 'Universe')
-            sheet = self.gsheet_client.open_by_key(config.UNIVERSE_SHEET_ID).sheet1
-            data = sheet.get_all_values()
+            spreadsheet = self._get_spreadsheet(config.UNIVERSE_SHEET_ID)
+
+            # Sheet non modificato dall'ultima lettura: copia locale, nessuna lettura delle celle
+            modified_time = self._modified_time(spreadsheet)
+            if modified_time:
+                tickers = self._load_universe_cache(config.UNIVERSE_SHEET_ID, modified_time)
+                if tickers is not None:
+                    self.logger.info(f"Universe invariato ({modified_time}): {len(tickers)} ticker dalla copia locale.")
+                    self._reads["universe"] = tickers
+                    return list(tickers)
+
+            data = spreadsheet.sheet1.get_all_values()
             
             if not data:
                 return []
@@ -86,58 +189,80 @@ class DriveManager:
             tickers = [t for t in tickers if t]
             
             self.logger.info(f"Universe caricato: {len(tickers)} ticker.")
-            return tickers
+            if modified_time:
+                self._save_universe_cache(config.UNIVERSE_SHEET_ID, modified_time, tickers)
+            self._reads["universe"] = tickers
+            return list(tickers)
         except Exception as e:
             self.logger.error(f"Errore lettura Universe: {e}")
             return []
 
     def get_pending_orders(self) -> list:
-        """Legge gli ordini pendenti dal tab 'Orders' del Report Sheet."""
+        """Legge gli ordini pendenti dal tab 'Orders' del Report Sheet (una volta per run)."""
+        if "orders" in self._reads:
+            return [dict(o) for o in self._reads["orders"]]
         try:
-            sheet = self._get_worksheet(config.REPORT_SHEET_ID, "Orders")
-            orders = sheet.get_all_records() # Restituisce lista di dict
-            
-            clean_orders = []
-            for o in orders:
-                if not o.get("ticker"): continue # Salta righe vuote
-                
-                # Conversione tipi (GSheet ritorna stringhe o numeri misti)
-                try:
-                    # Gestione robusta per numeri che potrebbero arrivare come "10" o 10 o "150,5"
-                    qty = o.get("quantity", 0)
-                    price = str(o.get("price", "0")).replace(",", ".")
-                    
-                    o["quantity"] = int(qty) if qty else 0
-                    o["price"] = float(price)
-                    clean_orders.append(o)
-                except ValueError:
-                    self.logger.warning(f"Dati non validi nella riga ordine: {o}")
-                    continue
-            
-            return clean_orders
+            return self._read_orders()
         except Exception as e:
             self.logger.error(f"Errore lettura Pending Orders: {e}")
             return []
 
-    def save_pending_orders(self, orders: list):
-        """Sovrascrive il tab 'Orders' con la nuova lista."""
+    def _read_orders(self) -> list:
+        """Lettura del tab 'Orders' (solleva in caso di errore)."""
+        sheet = self._get_worksheet(config.REPORT_SHEET_ID, "Orders")
+        orders = sheet.get_all_records() # Restituisce lista di dict
+        self._orders_height = len(orders) + 1
+
+        clean_orders = []
+        for o in orders:
+            if not o.get("ticker"): continue # Salta righe vuote
+
+            # Conversione tipi (GSheet ritorna stringhe o numeri misti)
+            try:
+                # Gestione robusta per numeri che potrebbero arrivare come "10" o 10 o "150,5"
+                qty = o.get("quantity", 0)
+                price = str(o.get("price", "0")).replace(",", ".")
+
+                o["quantity"] = int(qty) if qty else 0
+                o["price"] = float(price)
+                clean_orders.append(o)
+            except ValueError:
+                self.logger.warning(f"Dati non validi nella riga ordine: {o}")
+                continue
+
+        self._reads["orders"] = clean_orders
+        return [dict(o) for o in clean_orders]
+
+    def save_pending_orders(self, orders: list, keep_new_rows: bool = False, imported: list = ()):
+        """
+        Sovrascrive il tab 'Orders' con la nuova lista.
+
+        Una sola scrittura (values_update) di intestazione + righe: il tab non resta
+        mai vuoto a metà salvataggio. Le righe in eccesso della lista precedente
+        vengono svuotate nella stessa scrittura (padding con celle vuote).
+
+        keep_new_rows: rilegge il tab e conserva in coda le righe senza id (ordini
+        inseriti a mano, non ancora importati nel DB), tranne quelle uguali a un
+        ordine della lista o di `imported` (già importate). Se la rilettura fallisce
+        non scrive nulla, per non cancellarle.
+        imported: ordini importati dallo Sheet in questo run, con il loro id, anche se
+        nel frattempo eseguiti: la loro riga senza id non deve sopravvivere (verrebbe reimportata).
+        """
+        self._reads.pop("orders", None)
         try:
             sheet = self._get_worksheet(config.REPORT_SHEET_ID, "Orders")
-            sheet.clear()
-
-            # Headers standard
-            headers = ["action", "ticker", "quantity", "price", "stop_loss", "take_profit", "reason", "meta"]
-            
-            if not orders:
-                sheet.append_row(headers)
-                self.logger.info("Lista ordini vuota salvata su GSheet.")
-                return
+            if keep_new_rows:
+                new_rows = [o for o in self._read_orders() if is_new_sheet_order(o)]
+                self._reads.pop("orders", None)
+                known = {o["id"]: o for o in [*imported, *orders] if "id" in o}
+                matchable = list(known.values()) + [o for o in orders if "id" not in o]
+                orders = list(orders) + unmatched_orders(new_rows, matchable)
 
             # Preparazione dati
-            values = []
+            values = [ORDER_HEADERS]
             for o in orders:
                 row = []
-                for h in headers:
+                for h in ORDER_HEADERS:
                     val = o.get(h, "")
                     # Convertiamo meta dict in stringa per non rompere GSheet
                     if h == "meta" and isinstance(val, dict):
@@ -145,9 +270,17 @@ class DriveManager:
                     row.append(val)
                 values.append(row)
 
+            # Righe da coprire: le nuove + quelle occupate dalla lista precedente
+            # (se non le conosciamo, tutta la griglia del tab)
+            previous = self._orders_height if self._orders_height is not None else sheet.row_count
+            height = max(len(values), previous)
+            if height > sheet.row_count:
+                sheet.resize(rows=height)
+            values += [[""] * len(ORDER_HEADERS)] * (height - len(values))
+
             # Scrittura batch
-            sheet.append_row(headers)
-            sheet.append_rows(values)
+            sheet.update(values, f"A1:{rowcol_to_a1(height, len(ORDER_HEADERS))}")
+            self._orders_height = len(orders) + 1
             self.logger.info(f"Salvati {len(orders)} ordini su GSheet.")
 
         except Exception as e:
@@ -0,0 +1,232 @@
+# src/duckdb_backend.py
+import json
+import re
+from pathlib import Path
+from typing import Optional
+import duckdb
+import pandas as pd
+
+from src.logger import get_logger
+
+logger = get_logger("DuckDBBackend")
+
+# Le query del DatabaseManager usano i placeholder di psycopg (%s, %(nome)s).
+# DuckDB usa ? e $nome: li traduciamo al volo, così le query restano una sola.
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+
+def _translate(sql: str) -> str:
+    return _NAMED_PARAM.sub(r"$\1", sql).replace("%s", "?")
+
+
+class DuckDBCursor:
+    """Cursore compatibile con l'uso che ne fa DatabaseManager (righe come dict)."""
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection):
+        self._cur = conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._cur.close()
+
+    def execute(self, sql: str, params=None):
+        self._cur.execute(_translate(sql), params if params else None)
+        return self
+
+    def executemany(self, sql: str, params_seq):
+        self._cur.executemany(_translate(sql), list(params_seq))
+
+    def _as_dicts(self, rows: list) -> list[dict]:
+        if self._cur.description is None:
+            return []
+        cols = [d[0] for d in self._cur.description]
+        return [dict(zip(cols, r)) for r in rows]
+
+    def fetchone(self) -> Optional[dict]:
+        row = self._cur.fetchone()
+        return self._as_dicts([row])[0] if row is not None else None
+
+    def fetchall(self) -> list[dict]:
+        return self._as_dicts(self._cur.fetchall())
+
+    def fetchmany(self, size: int) -> list[dict]:
+        return self._as_dicts(self._cur.fetchmany(size))
+
+
+class DuckDBConnection:
+    """
+    Adattatore minimale che espone a DatabaseManager la stessa interfaccia
+    della connessione psycopg (cursor / commit / rollback / close).
+    """
+
+    def __init__(self, path: Path, read_only: bool = True):
+        self.path = Path(path)
+        self.raw = duckdb.connect(str(self.path), read_only=read_only)
+
+    def cursor(self, name: Optional[str] = None) -> DuckDBCursor:
+        # 'name' (cursori server-side di Postgres) non ha senso in un DB embedded
+        return DuckDBCursor(self.raw)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        try:
+            self.raw.rollback()
+        except duckdb.TransactionException:
+            # Nessuna transazione attiva: niente da annullare
+            pass
+
+    def close(self):
+        self.raw.close()
+
+
+def connect_duckdb(path: Path, read_only: bool = True) -> DuckDBConnection:
+    """Apre il file DuckDB. In sola lettura più processi possono condividerlo."""
+    if read_only and not Path(path).exists():
+        raise FileNotFoundError(
+            f"DB di ricerca non trovato in {path}. Eseguire prima 'python -m services.sync_research_db'."
+        )
+    return DuckDBConnection(path, read_only=read_only)
+
+
+# ----------------------
+# Schema & Sync da Postgres
+# ----------------------
+def init_research_schema(conn: DuckDBConnection):
+    """Crea le tabelle del DB di ricerca (tipi colonnari: DOUBLE al posto di NUMERIC)."""
+    conn.raw.execute("""
+        CREATE TABLE IF NOT EXISTS ohlc (
+            ticker TEXT NOT NULL,
+            date DATE NOT NULL,
+            open DOUBLE,
+            high DOUBLE,
+            low DOUBLE,
+            close DOUBLE,
+            volume BIGINT,
+            PRIMARY KEY (ticker, date)
+        );
+
+        CREATE TABLE IF NOT EXISTS portfolio (
+            ticker TEXT PRIMARY KEY,
+            stop_loss DOUBLE,
+            profit_take DOUBLE,
+            size INTEGER,
+            price DOUBLE,
+            updated_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS portfolio_cash (
+            cash DOUBLE,
+            currency TEXT,
+            updated_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS portfolio_trades (
+            id INTEGER,
+            ticker TEXT,
+            size INTEGER,
+            price DOUBLE,
+            action TEXT,
+            date TIMESTAMP,
+            trade_key TEXT
+        );
+
+        ALTER TABLE portfolio_trades ADD COLUMN IF NOT EXISTS trade_key TEXT;
+
+        CREATE TABLE IF NOT EXISTS portfolio_equity_history (
+            date DATE PRIMARY KEY,
+            cash DOUBLE,
+            invested DOUBLE,
+            equity DOUBLE,
+            positions JSON,
+            updated_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS ohlc_checked_gaps (
+            ticker TEXT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            checked_at TIMESTAMP,
+            PRIMARY KEY (ticker, start_date, end_date)
+        );
+
+        CREATE TABLE IF NOT EXISTS ohlc_summary (
+            ticker TEXT PRIMARY KEY,
+            bars INTEGER NOT NULL,
+            first_date DATE,
+            last_date DATE,
+            last_close DOUBLE,
+            updated_at TIMESTAMP
+        );
+    """)
+
+
+def sync_from_postgres(pg_db, conn: DuckDBConnection, overlap_days: int = 5) -> int:
+    """
+    Allinea il DB di ricerca a Postgres.
+    - ohlc: incrementale, solo le righe successive all'high-water mark di ogni ticker
+      (più 'overlap_days' di sovrapposizione, riscritti dal daily run).
+    - portfolio / cash / trades / storico equity: tabelle piccole, copiate per intero.
+    Restituisce il numero di righe OHLC sincronizzate.
+    """
+    init_research_schema(conn)
+
+    hwm = dict(conn.raw.execute("SELECT ticker, MAX(date) FROM ohlc GROUP BY ticker").fetchall())
+    rows = pg_db.get_ohlc_since(hwm, overlap_days=overlap_days)
+
+    conn.raw.begin()
+    try:
+        if rows:
+            df_ohlc = pd.DataFrame(rows)
+            cols_float = ['open', 'high', 'low', 'close']
+            df_ohlc[cols_float] = df_ohlc[cols_float].astype(float)
+            conn.raw.register("df_ohlc", df_ohlc)
+            # Sostituiamo la finestra riletta (stessa chiave ticker+date)
+            conn.raw.execute("""
+                DELETE FROM ohlc USING df_ohlc
+                WHERE ohlc.ticker = df_ohlc.ticker AND ohlc.date = df_ohlc.date;
+            """)
+            conn.raw.execute("""
+                INSERT INTO ohlc
+                SELECT ticker, date, open, high, low, close, volume FROM df_ohlc;
+            """)
+            conn.raw.unregister("df_ohlc")
+
+            # Summary ricalcolato in locale (scansione colonnare, niente round trip)
+            conn.raw.execute("""
+                INSERT OR REPLACE INTO ohlc_summary
+                SELECT ticker, COUNT(*), MIN(date), MAX(date), arg_max(close, date), now()
+                FROM ohlc
+                GROUP BY ticker;
+            """)
+
+        snapshot = pg_db.load_portfolio()
+        for table, key in [("portfolio", "portfolio"), ("portfolio_cash", "cash"), ("portfolio_trades", "trades")]:
+            df = snapshot.get(key)
+            conn.raw.execute(f"DELETE FROM {table};")
+            if df is not None and not df.empty:
+                conn.raw.register("df_snapshot", df)
+                conn.raw.execute(f"INSERT INTO {table} BY NAME SELECT * FROM df_snapshot;")
+                conn.raw.unregister("df_snapshot")
+
+        df_equity = pg_db.get_equity_history()
+        conn.raw.execute("DELETE FROM portfolio_equity_history;")
+        if not df_equity.empty:
+            df_equity = df_equity.assign(positions=df_equity["positions"].map(json.dumps))
+            conn.raw.register("df_equity", df_equity)
+            conn.raw.execute("INSERT INTO portfolio_equity_history BY NAME SELECT * FROM df_equity;")
+            conn.raw.unregister("df_equity")
+
+        conn.raw.commit()
+    except Exception:
+        conn.raw.rollback()
+        raise
+
+    logger.info(f"DB di ricerca sincronizzato ({conn.path}): {len(rows)} righe OHLC.")
+    return len(rows)
@@ -0,0 +1,58 @@
+# src/fetch_planner.py
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+def plan_fetches(tickers: List[str],
+                 high_water_marks: Dict[str, Optional[date]],
+                 end_date: date,
+                 history_days: int = 365,
+                 overlap_days: int = 1,
+                 merge_days: int = 7,
+                 holes: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Pianifica il minimo numero di download per portare ogni ticker a `end_date`.
+
+    - Ticker già nel DB: si riparte dall'ultima data salvata (meno `overlap_days`,
+      per ricevere di nuovo l'ultima candela e le eventuali correzioni).
+    - Ticker nuovi (nessun high-water mark): backfill di `history_days`.
+    - Buchi nello storico (vedi DatabaseManager.find_ohlc_gaps): un download per intervallo.
+
+    I ticker con date di partenza vicine (entro `merge_days`) finiscono nello stesso
+    download partendo dalla data più vecchia: qualche riga in più (già scartata
+    dall'upsert se invariata) costa meno di una richiesta HTTP in più.
+
+    `end_date` è esclusiva, come il parametro `end` di yf.download.
+
+    Output:
+        [{"start": date, "end": date, "tickers": [...]}, ...]
+        (prima gli aggiornamenti in ordine di start, poi i buchi)
+    """
+    starts: Dict[date, List[str]] = {}
+    for ticker in tickers:
+        hwm = high_water_marks.get(ticker)
+        if hwm is None:
+            start = end_date - timedelta(days=history_days)
+        else:
+            start = hwm + timedelta(days=1 - overlap_days)
+        if start >= end_date:
+            continue
+        starts.setdefault(start, []).append(ticker)
+
+    plan: List[dict] = []
+    for start in sorted(starts):
+        if plan and (start - plan[-1]["start"]).days <= merge_days:
+            plan[-1]["tickers"].extend(starts[start])
+        else:
+            plan.append({"start": start, "end": end_date, "tickers": list(starts[start])})
+
+    # Buchi: stesso intervallo -> stesso download
+    ranges: Dict[Tuple[date, date], List[str]] = {}
+    for hole in holes or []:
+        ranges.setdefault((hole["start"], hole["end"]), []).append(hole["ticker"])
+    for (start, end), hole_tickers in sorted(ranges.items()):
+        plan.append({"start": start, "end": end, "tickers": sorted(set(hole_tickers))})
+
+    for batch in plan:
+        batch["tickers"] = sorted(batch["tickers"])
+    return plan
@@ -0,0 +1,144 @@
+# src/ohlc_cache.py
+import os
+from datetime import datetime, timedelta, date
+from pathlib import Path
+from typing import Dict, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from config.config import config
+from src.logger import get_logger
+
+# Schema fisso della cache (stesse colonne della tabella ohlc)
+OHLC_SCHEMA = pa.schema([
+    ("ticker", pa.string()),
+    ("date", pa.date32()),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+])
+
+
+class OhlcCache:
+    """
+    Cache locale colonnare della tabella ohlc (file Arrow IPC non compresso).
+
+    - Il file viene letto in memory-map: nessun trasferimento di rete e
+      nessuna copia dei buffer finché non si passa a pandas.
+    - La sincronizzazione con Postgres è incrementale: per ogni ticker si
+      scaricano solo le righe successive al suo high-water mark.
+
+    Ambito: letture ripetute di anni di storico, cioè i backtest (CLI e dashboard,
+    via services/backtest.py). I run schedulati restano sul DB: il weekly run legge
+    un anno una volta a settimana in streaming (DatabaseManager.iter_ohlc_by_ticker),
+    il daily run non legge storico. Per loro la cache aggiungerebbe solo un sync.
+    """
+
+    def __init__(self, path: Optional[Path] = None, overlap_days: int = 5):
+        """
+        overlap_days: giorni riletti prima dell'high-water mark a ogni sync,
+        perché il daily run riscrive le ultime candele (default: 5, come il fetch giornaliero).
+        """
+        self.logger = get_logger(self.__class__.__name__)
+        self.path = Path(path) if path else config.OHLC_CACHE_PATH
+        self.overlap_days = overlap_days
+
+    # ----------------------
+    # Lettura
+    # ----------------------
+    def _read_table(self) -> Optional[pa.Table]:
+        """Apre il file in memory-map (zero-copy). None se la cache non esiste."""
+        if not self.path.exists():
+            return None
+        source = pa.memory_map(str(self.path), "r")
+        return ipc.open_file(source).read_all()
+
+    def high_water_marks(self) -> Dict[str, date]:
+        """Ultima data presente in cache per ogni ticker."""
+        table = self._read_table()
+        if table is None or table.num_rows == 0:
+            return {}
+        agg = table.group_by("ticker").aggregate([("date", "max")])
+        return dict(zip(agg["ticker"].to_pylist(), agg["date_max"].to_pylist()))
+
+    def get_ohlc_all_tickers(self, days: int = 365) -> dict:
+        """
+        Stesso contratto di DatabaseManager.get_ohlc_all_tickers, ma letto dal file locale.
+
+        Output:
+            {
+                "AAPL": pd.DataFrame(...),
+                ...
+            }
+        """
+        table = self._read_table()
+        if table is None or table.num_rows == 0:
+            self.logger.warning(f"Cache OHLC vuota o assente ({self.path}).")
+            return {}
+
+        # Il filtro per data lavora sui buffer mappati, prima della conversione a pandas
+        cutoff_date = (datetime.now() - timedelta(days=days)).date()
+        table = table.filter(pc.greater_equal(table["date"], pa.scalar(cutoff_date, pa.date32())))
+        if table.num_rows == 0:
+            self.logger.warning(f"Nessun dato OHLC in cache negli ultimi {days} giorni.")
+            return {}
+
+        df_all = table.to_pandas()
+        df_all['date'] = pd.to_datetime(df_all['date'])
+
+        data_map = {ticker: df for ticker, df in df_all.groupby('ticker')}
+        self.logger.info(f"Caricati da cache dati storici per {len(data_map)} ticker.")
+        return data_map
+
+    # ----------------------
+    # Sync
+    # ----------------------
+    def sync(self, db) -> int:
+        """
+        Allinea la cache al DB scaricando solo le righe nuove per ogni ticker.
+        Restituisce il numero di righe ricevute dal DB.
+        """
+        table = self._read_table()
+        hwm = self.high_water_marks() if table is not None else {}
+
+        rows = db.get_ohlc_since(hwm, overlap_days=self.overlap_days)
+        if not rows:
+            self.logger.info("Cache OHLC già allineata.")
+            return 0
+
+        df_new = pd.DataFrame(rows)
+        cols_float = ['open', 'high', 'low', 'close']
+        df_new[cols_float] = df_new[cols_float].astype(float)
+        df_new['volume'] = df_new['volume'].fillna(0).astype('int64')
+        new_table = pa.Table.from_pandas(df_new[OHLC_SCHEMA.names], schema=OHLC_SCHEMA, preserve_index=False)
+
+        if table is not None and table.num_rows > 0 and hwm:
+            # Scartiamo dalla cache la finestra di overlap appena riletta dal DB
+            tickers = pa.array(list(hwm.keys()), pa.string())
+            starts = pa.array(
+                [d - timedelta(days=self.overlap_days) for d in hwm.values()], pa.date32()
+            )
+            ticker_start = pc.take(starts, pc.index_in(table["ticker"], value_set=tickers))
+            table = table.filter(pc.less_equal(table["date"], ticker_start))
+            table = pa.concat_tables([table.cast(OHLC_SCHEMA), new_table])
+        else:
+            table = new_table
+
+        table = table.sort_by([("ticker", "ascending"), ("date", "ascending")])
+        self._write_table(table)
+
+        self.logger.info(f"Cache OHLC aggiornata: {len(rows)} righe sincronizzate, {table.num_rows} totali.")
+        return len(rows)
+
+    def _write_table(self, table: pa.Table):
+        """Scrittura atomica: file temporaneo + rename (i lettori non vedono mai un file a metà)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self.path)
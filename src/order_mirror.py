@@ -0,0 +1,74 @@
+# src/order_mirror.py
+import threading
+from typing import Callable, Iterable, List, Optional
+
+from src.logger import get_logger
+
+
+class SheetsOrderMirror:
+    """
+    Copia asincrona degli ordini pendenti sul tab 'Orders' dello Sheet (revisione umana).
+
+    La fonte di verità è la tabella pending_orders: il run pubblica lo stato
+    aggiornato con `publish` e prosegue senza attendere Google. Le righe dello
+    Sheet senza id (ordini inseriti a mano, non ancora importati) vengono conservate,
+    tranne quelle importate durante il run (`imported`, anche se già eseguite). Un thread
+    in background scrive solo l'ultimo stato pubblicato (le pubblicazioni
+    ravvicinate si fondono in una sola scrittura). `close` attende l'ultima
+    scrittura, con timeout, prima dell'uscita del processo.
+
+    drive_factory: crea il DriveManager nel thread di background
+    (anche l'autenticazione resta fuori dal percorso critico).
+    """
+
+    def __init__(self, drive_factory: Callable):
+        self.logger = get_logger(self.__class__.__name__)
+        self.drive_factory = drive_factory
+        self._drive = None
+        self._latest: Optional[List[dict]] = None
+        self._imported = {}  # id -> ordine importato dallo Sheet in questo run
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="sheets-order-mirror", daemon=True)
+        self._thread.start()
+
+    def publish(self, orders: List[dict], imported: Iterable[dict] = ()):
+        """
+        Accoda lo stato corrente degli ordini pendenti (non bloccante).
+        imported: ordini appena importati dallo Sheet (con id); restano noti per tutto il run.
+        """
+        with self._cond:
+            self._latest = [dict(o) for o in orders]
+            self._imported.update((o["id"], dict(o)) for o in imported)
+            self._cond.notify()
+
+    def close(self, timeout: Optional[float] = 30.0) -> bool:
+        """Scrive l'ultimo stato pubblicato e ferma il thread. False se il timeout scade prima."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.warning("⚠️ Copia ordini su Sheet non completata entro il timeout.")
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._latest is None and not self._closed:
+                    self._cond.wait()
+                orders, self._latest = self._latest, None
+                if orders is None:
+                    return
+                imported = list(self._imported.values())
+            self._write(orders, imported)
+
+    def _write(self, orders: List[dict], imported: List[dict]):
+        try:
+            if self._drive is None:
+                self._drive = self.drive_factory()
+            self._drive.save_pending_orders(orders, keep_new_rows=True, imported=imported)
+        except Exception as e:
+            # Lo Sheet è solo una copia: l'errore non deve fermare il run
+            self.logger.error(f"Errore copia ordini pendenti su Sheet: {e}")
@@ -0,0 +1,68 @@
+# src/portfolio_events.py
+from typing import Iterable, Optional
+
+# Eventi del portafoglio (log append-only, vedi DatabaseManager.save_portfolio chiave "events")
+EVENT_FILL = "FILL"          # ordine eseguito: {"action", "quantity", "price", "commission", "stop_loss", "profit_take"}
+EVENT_CASH = "CASH"          # cassa impostata a mano (depositi, rettifiche): {"cash", "currency"}
+EVENT_POSITION = "POSITION"  # posizione impostata a mano / cambio stop: {"size", "stop_loss", "profit_take"}
+
+
+def empty_state() -> dict:
+    """
+    Stato compatto del portafoglio (quello salvato nei snapshot periodici):
+        {"cash": float, "currency": str, "positions": {ticker: {"size", "stop_loss", "profit_take"}}}
+    I prezzi non fanno parte dello stato: la valorizzazione a una data si fa con la tabella ohlc.
+    """
+    return {"cash": 0.0, "currency": "EUR", "positions": {}}
+
+
+def make_event(kind: str, ticker: Optional[str], ts, **payload) -> dict:
+    return {"ts": ts, "kind": kind, "ticker": ticker, "payload": payload}
+
+
+def apply_event(state: dict, event: dict) -> dict:
+    """Applica un evento allo stato (in place) e lo restituisce."""
+    kind, ticker, p = event["kind"], event.get("ticker"), event["payload"]
+    positions = state["positions"]
+
+    if kind == EVENT_CASH:
+        state["cash"] = float(p["cash"])
+        state["currency"] = p.get("currency") or state["currency"]
+
+    elif kind == EVENT_POSITION:
+        if int(p["size"]) <= 0:
+            positions.pop(ticker, None)
+        else:
+            positions[ticker] = {"size": int(p["size"]), "stop_loss": p.get("stop_loss"),
+                                 "profit_take": p.get("profit_take")}
+
+    elif kind == EVENT_FILL:
+        qty, value, fee = int(p["quantity"]), int(p["quantity"]) * float(p["price"]), float(p.get("commission") or 0.0)
+        pos = positions.get(ticker)
+        if p["action"] == "BUY":
+            state["cash"] -= value + fee
+            size = (pos["size"] if pos else 0) + qty
+            positions[ticker] = {"size": size, "stop_loss": p.get("stop_loss"), "profit_take": p.get("profit_take")}
+        else:
+            state["cash"] += value - fee
+            size = (pos["size"] if pos else 0) - qty
+            if size <= 0:
+                positions.pop(ticker, None)
+            else:
+                pos["size"] = size
+
+    else:
+        raise ValueError(f"Evento di portafoglio sconosciuto: {kind}")
+    return state
+
+
+def replay(state: Optional[dict], events: Iterable[dict]) -> dict:
+    """Stato dopo gli eventi, partendo da uno snapshot (o dallo stato vuoto)."""
+    state = empty_state() if state is None else {
+        "cash": float(state["cash"]),
+        "currency": state.get("currency", "EUR"),
+        "positions": {t: dict(p) for t, p in state["positions"].items()},
+    }
+    for event in events:
+        apply_event(state, event)
+    return state
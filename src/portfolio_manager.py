@@ -1,7 +1,64 @@
+import uuid
 import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import datetime, date
+from typing import Dict, List, Optional
 from src.logger import get_logger
+from src.portfolio_events import EVENT_CASH, EVENT_FILL, EVENT_POSITION, make_event
+
+
+PORTFOLIO_COLUMNS = ["ticker", "size", "price", "stop_loss", "profit_take", "updated_at"]
+CASH_COLUMNS = ["cash", "currency", "updated_at"]
+# trade_key: identificativo del trade generato alla creazione (chiave di idempotenza sul DB)
+TRADE_COLUMNS = ["ticker", "size", "price", "action", "date", "trade_key"]
+
+# Esito per ordine di execute_orders
+ORDER_FILLED = "FILLED"
+ORDER_REJECTED = "REJECTED"
+
+
+class FeeModel:
+    """
+    Commissioni per trade: quota fissa + percentuale sul controvalore.
+    Stesso formato di SettingsManager.get_fees_config(): {"fixed_euro", "percentage"}.
+    """
+    __slots__ = ("fixed", "percentage")
+
+    def __init__(self, fixed: float = 0.0, percentage: float = 0.0):
+        self.fixed = float(fixed)
+        self.percentage = float(percentage)
+
+    @classmethod
+    def from_config(cls, fees_conf: Optional[dict]) -> "FeeModel":
+        fees_conf = fees_conf or {}
+        return cls(fees_conf.get("fixed_euro", 0.0), fees_conf.get("percentage", 0.0))
+
+    def __call__(self, trade_values: np.ndarray) -> np.ndarray:
+        return self.fixed + trade_values * self.percentage
+
+
+def _opt_float(value) -> Optional[float]:
+    """Float o None (NaN/None/"" dal DB o dagli ordini)."""
+    if value is None or value == "" or pd.isna(value):
+        return None
+    return float(value)
+
+
+class Position:
+    """Una posizione aperta (record leggero: niente dict per istanza)."""
+    __slots__ = ("ticker", "size", "price", "stop_loss", "profit_take", "updated_at")
+
+    def __init__(self, ticker: str, size: int, price: float,
+                 stop_loss: float = None, profit_take: float = None, updated_at: datetime = None):
+        self.ticker = ticker
+        self.size = size
+        self.price = price
+        self.stop_loss = stop_loss
+        self.profit_take = profit_take
+        self.updated_at = updated_at
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
 
 
 class PortfolioManager:
@@ -10,21 +67,79 @@ class PortfolioManager:
 
     ⚙️ Il DatabaseManager gestisce la persistenza, mentre questa classe
     si occupa della parte di business logic:
-      - mantenere e aggiornare i DataFrame locali
+      - mantenere e aggiornare lo stato locale
       - gestire le operazioni di trading e di cassa
       - esportare o importare snapshot completi del portafoglio
+
+    Stato interno pensato per i run live (operazioni O(1) per ticker):
+      - posizioni: dict ticker -> Position
+      - cassa: scalari
+      - trades: storico caricato (DataFrame) + buffer dei nuovi (lista di dict)
+      - eventi: ogni modifica (fill, cassa, posizione/stop) genera un evento
+        per il log append-only del DB (vedi src.portfolio_events)
+    I DataFrame si costruiscono solo quando servono (get_snapshot,
+    get_positions_summary e le proprietà df_portfolio / df_cash / df_trades).
     """
 
     def __init__(self):
         self.logger = get_logger(self.__class__.__name__)
 
-        # Snapshot in memoria
-        self.df_portfolio = pd.DataFrame(columns=["ticker", "size", "price", "stop_loss", "profit_take", "updated_at"])
-        self.df_cash = pd.DataFrame(columns=["cash", "currency", "updated_at"])
-        self.df_trades = pd.DataFrame(columns=["ticker", "size", "price", "action", "date"])
+        self.positions: Dict[str, Position] = {}
+        self._cash: Optional[float] = None   # None = cassa mai impostata
+        self._currency = "EUR"
+        self._cash_updated_at: Optional[datetime] = None
+        # Trade già salvati sul DB (caricati) + trade nuovi, gli unici da persistere
+        self._loaded_trades = pd.DataFrame(columns=TRADE_COLUMNS)
+        self._new_trades: List[dict] = []
+        self._new_events: List[dict] = []
+        # True dopo load_from_db: solo allora "nessuna posizione" significa portafoglio flat
+        self._loaded = False
 
         self.logger.info("PortfolioManager inizializzato con strutture vuote.")
 
+    # ----------------------
+    # Viste DataFrame (materializzate su richiesta)
+    # ----------------------
+    @property
+    def df_portfolio(self) -> pd.DataFrame:
+        return pd.DataFrame([p.as_dict() for p in self.positions.values()], columns=PORTFOLIO_COLUMNS)
+
+    @property
+    def df_cash(self) -> pd.DataFrame:
+        if self._cash is None:
+            return pd.DataFrame(columns=CASH_COLUMNS)
+        return pd.DataFrame([{"cash": self._cash, "currency": self._currency, "updated_at": self._cash_updated_at}])
+
+    @property
+    def df_trades(self) -> pd.DataFrame:
+        if not self._new_trades:
+            return self._loaded_trades
+        new = self.get_new_trades()
+        if self._loaded_trades.empty:
+            return new
+        return pd.concat([self._loaded_trades, new], ignore_index=True)
+
+    @property
+    def cash(self) -> float:
+        return self._cash if self._cash is not None else 0.0
+
+    def get_position_arrays(self):
+        """
+        Posizioni come array allineati (per il motore stop vettoriale, vedi risk_manager.position_exit_orders):
+        (tickers, sizes, stop_loss, profit_take), livelli mancanti = NaN.
+        """
+        pos = list(self.positions.values())
+        return (
+            [p.ticker for p in pos],
+            np.array([p.size for p in pos], dtype=np.int64),
+            np.array([_opt_float(p.stop_loss) for p in pos], dtype=float),
+            np.array([_opt_float(p.profit_take) for p in pos], dtype=float),
+        )
+
+    def get_position_sizes(self) -> Dict[str, int]:
+        """{ticker: size} delle posizioni aperte."""
+        return {t: p.size for t, p in self.positions.items() if p.size > 0}
+
     # ----------------------
     # Load & Save
     # ----------------------
@@ -32,35 +147,83 @@ class PortfolioManager:
         """Usa il dizionario restituito esattamente da db.load_portfolio()"""
         self.logger.info("Caricamento stato Portfolio...")
         
-        # Gestione robusta: se il DB è vuoto, usa i DF vuoti init
-        if not snapshot_dict.get("portfolio").empty:
-            self.df_portfolio = snapshot_dict["portfolio"].copy()
+        # Gestione robusta: se il DB è vuoto, restano le strutture vuote init
+        df_port = snapshot_dict.get("portfolio")
+        if df_port is not None and not df_port.empty:
             # Assicuriamoci che i tipi siano corretti per i calcoli e gestiamo i NaN
-            self.df_portfolio["size"] = self.df_portfolio["size"].fillna(0).astype(int)
-            self.df_portfolio["price"] = self.df_portfolio["price"].fillna(0.0).astype(float)
+            sizes = pd.to_numeric(df_port["size"], errors="coerce").fillna(0).astype(int)
+            prices = pd.to_numeric(df_port["price"], errors="coerce").fillna(0.0).astype(float)
+            self.positions = {
+                t: Position(t, int(sz), float(px), sl, tp, upd)
+                for t, sz, px, sl, tp, upd in zip(
+                    df_port["ticker"], sizes, prices,
+                    df_port.get("stop_loss", [None] * len(df_port)),
+                    df_port.get("profit_take", [None] * len(df_port)),
+                    df_port.get("updated_at", [None] * len(df_port)),
+                )
+            }
         
-        if not snapshot_dict.get("cash").empty:
-            self.df_cash = snapshot_dict["cash"].copy()
-            self.df_cash["cash"] = self.df_cash["cash"].astype(float)
+        df_cash = snapshot_dict.get("cash")
+        if df_cash is not None and not df_cash.empty:
+            first = df_cash.iloc[0]
+            self._cash = float(first["cash"])
+            self._currency = first.get("currency", "EUR") or "EUR"
+            self._cash_updated_at = first.get("updated_at")
             
-        if not snapshot_dict.get("trades").empty:
-            self.df_trades = snapshot_dict["trades"].copy()
+        trades = snapshot_dict.get("trades")
+        if trades is not None and not trades.empty:
+            self._loaded_trades = trades.copy()
+        self._new_trades = []
+        self._new_events = []
+        self._loaded = True
 
         self.logger.info("[Portfolio] Snapshot caricato dal DB.")
 
     def get_snapshot(self) -> dict:
-        """Restituisce uno snapshot completo del portafoglio come dizionario di DataFrame."""
+        """
+        Restituisce uno snapshot del portafoglio come dizionario di DataFrame.
+        "trades" ed "events" contengono solo le novità rispetto al caricamento (delta da persistere),
+        "state" lo stato compatto per gli snapshot periodici del log eventi.
+        "flat" è True solo se il portafoglio è stato caricato dal DB e non ha più posizioni aperte.
+        """
         # Aggiorna timestamp prima di salvare
         now = datetime.now()
-        if not self.df_portfolio.empty:
-            self.df_portfolio["updated_at"] = now
+        for pos in self.positions.values():
+            pos.updated_at = now
         
         return {
             "portfolio": self.df_portfolio,
+            "flat": self._loaded and not self.positions,
             "cash": self.df_cash,
-            "trades": self.df_trades
+            "trades": self.get_new_trades(),
+            "events": self.get_new_events(),
+            "state": self.get_state()
         }
 
+    def get_new_trades(self) -> pd.DataFrame:
+        """Trade registrati dopo load_from_db (non ancora salvati sul DB)."""
+        return pd.DataFrame(self._new_trades, columns=TRADE_COLUMNS)
+
+    def get_new_events(self) -> List[dict]:
+        """Eventi generati dopo load_from_db (ognuno con un 'uid': salvarli due volte non li duplica)."""
+        return list(self._new_events)
+
+    def get_state(self) -> dict:
+        """Stato compatto (formato di src.portfolio_events.empty_state)."""
+        return {
+            "cash": self.cash,
+            "currency": self._currency,
+            "positions": {
+                t: {"size": int(p.size), "stop_loss": _opt_float(p.stop_loss), "profit_take": _opt_float(p.profit_take)}
+                for t, p in self.positions.items()
+            },
+        }
+
+    def _emit(self, kind: str, ticker: Optional[str], ts: datetime, **payload):
+        event = make_event(kind, ticker, ts, **payload)
+        event["uid"] = uuid.uuid4().hex
+        self._new_events.append(event)
+
     # ----------------------
     # Business Logic Core
     # ----------------------
@@ -69,31 +232,29 @@ class PortfolioManager:
         Calcola il valore totale del portafoglio (Net Liquidation Value).
         Formula: Cash Disponibile + Somma(Size * Current_Price per ogni posizione)
         """
-        # 1. Recupero Cash
-        cash = 0.0
-        if not self.df_cash.empty:
-            cash = self.df_cash.iloc[0]["cash"]
-
-        # 2. Recupero Valore Posizioni
-        positions_value = 0.0
-        if not self.df_portfolio.empty:
-            # Calcolo vettoriale: Moltiplica colonna size per colonna price e somma tutto
-            # 1. pd.to_numeric forza tutto a numero (o NaN) -> colonna diventa float
-            # 2. fillna(0) ora lavora su float -> nessun warning di downcasting da object
-            # 3. astype(int) converte il risultato finale
-            self.df_portfolio["size"] = pd.to_numeric(
-                self.df_portfolio["size"], errors='coerce'
-            ).fillna(0).astype(int)
-
-            self.df_portfolio["price"] = pd.to_numeric(
-                self.df_portfolio["price"], errors='coerce'
-            ).fillna(0.0).astype(float)
-            val_series = (self.df_portfolio["size"] * self.df_portfolio["price"])
-            positions_value = val_series.sum()
-
-        return float(cash + positions_value)
-
-    def execute_order(self, order: dict):
+        positions_value = sum(p.size * p.price for p in self.positions.values())
+        return float(self.cash + positions_value)
+
+    def get_equity_record(self, as_of: Optional[date] = None) -> dict:
+        """
+        Riga giornaliera per lo storico equity (vedi DatabaseManager.save_portfolio, chiave "equity").
+        'positions' contiene la valorizzazione di ogni posizione: {ticker: {"size", "price"}}.
+        """
+        equity = self.get_total_equity()
+        positions = {
+            t: {"size": int(p.size), "price": float(p.price)}
+            for t, p in self.positions.items() if p.size != 0
+        }
+        invested = float(sum(p["size"] * p["price"] for p in positions.values()))
+        return {
+            "date": as_of or datetime.now().date(),
+            "cash": equity - invested,
+            "invested": invested,
+            "equity": equity,
+            "positions": positions
+        }
+
+    def execute_order(self, order: dict, fee_model: Optional[FeeModel] = None) -> bool:
         """
         Esegue un ordine (BUY/SELL) aggiornando Cash, Posizioni e Storico Trades.
         Usato principalmente dal Backtester o per sincronizzare ordini manuali.
@@ -107,95 +268,129 @@ class PortfolioManager:
             "stop_loss": 140.0,   (opzionale)
             "take_profit": 160.0, (opzionale, o 'profit_take')
         }
+
+        Nessun controllo di cassa (l'ordine singolo è "law"); True se eseguito.
+        Per più ordini usare execute_orders.
         """
-        ticker = order.get("ticker")
-        action = order.get("action").upper()
+        result = self.execute_orders([order], fee_model=fee_model, check_cash=False)[0]
+        if result["status"] == ORDER_REJECTED:
+            self.logger.warning(f"Ordine non eseguito ({result['reason']}): {order}")
+        return result["status"] == ORDER_FILLED
+
+    def execute_orders(self, orders: List[dict],
+                       fee_model: Optional[FeeModel] = None,
+                       check_cash: bool = True) -> List[dict]:
+        """
+        Esegue una lista di ordini (formato di execute_order) in un solo passaggio.
+
+        Controvalori e commissioni sono calcolati in blocco (numpy); gli ordini
+        vengono poi applicati in sequenza sullo stato in memoria: cassa e storico
+        trades si aggiornano una volta sola alla fine.
+
+        Un ordine viene rifiutato se:
+          - quantità <= 0, prezzo mancante o azione sconosciuta (controlli in blocco);
+          - SELL senza posizione;
+          - BUY oltre la cassa disponibile, commissione inclusa (con check_cash).
+        Una SELL oltre la size posseduta chiude la posizione: la quantità eseguita
+        (e il controvalore accreditato) si riduce alla size.
+
+        Output (uno per ordine, stesso ordine dell'input):
+            {"ticker", "action", "quantity", "price", "commission",
+             "status": "FILLED" | "REJECTED", "reason": str | None}
+        """
+        if not orders:
+            return []
+
+        n = len(orders)
         # Gestiamo sia 'quantity' che 'size' per compatibilità
-        qty = int(order.get("quantity", order.get("size", 0)))
-        price = float(order.get("price"))
-        
-        if qty <= 0:
-            self.logger.warning(f"Tentativo di esecuzione ordine con qtà <= 0: {order}")
-            return
+        qtys = pd.to_numeric(pd.Series([o.get("quantity", o.get("size")) for o in orders], dtype=object),
+                             errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+        prices = pd.to_numeric(pd.Series([o.get("price") for o in orders], dtype=object),
+                               errors="coerce").to_numpy(dtype=float)
+        actions = np.array([str(o.get("action", "")).upper() for o in orders], dtype=object)
 
-        # Recupero Cash Attuale
-        current_cash = 0.0
-        currency = "EUR"
-        if not self.df_cash.empty:
-            current_cash = float(self.df_cash.iloc[0]["cash"])
-            currency = self.df_cash.iloc[0]["currency"]
+        values = qtys * prices
+        fees = fee_model(values) if fee_model is not None else np.zeros(n)
 
-        transaction_value = qty * price
-        
-        # --- LOGICA BUY ---
-        if action == "BUY":
-            # 1. Aggiorna Cash
-            new_cash = current_cash - transaction_value
-            # Nota: Il RiskManager dovrebbe aver già controllato la capienza, ma qui applichiamo cmq
-            self.update_cash(new_cash, currency)
-            
-            # 2. Calcola Nuova Size Posizione
-            current_pos_size = 0
-            # Se esiste già, prendiamo la size attuale
-            mask = self.df_portfolio["ticker"] == ticker
-            if not self.df_portfolio.empty and mask.any():
-                current_pos_size = int(self.df_portfolio.loc[mask, "size"].iloc[0])
-            
-            new_size = current_pos_size + qty
-            
-            # 3. Aggiorna Posizione
-            # Nota: aggiorniamo stop loss e profit take solo se forniti nel nuovo ordine
-            sl = order.get("stop_loss", order.get("stop_loss")) # Se None, potrebbe restare quello vecchio? 
-            # Per semplicità, in questa implementazione sovrascriviamo se presenti nell'ordine
-            # Se l'ordine non ha SL (es. market buy manuale), bisognerebbe decidere se tenere il vecchio.
-            # Qui assumiamo che l'ordine sia "law".
-            
-            self.update_position(
-                ticker=ticker,
-                size=new_size,
-                price=price, # Aggiorniamo al prezzo di esecuzione (Mark-to-Market immediato)
-                stop_loss=order.get("stop_loss"),
-                profit_take=order.get("take_profit", order.get("profit_take"))
-            )
-
-        # --- LOGICA SELL ---
-        elif action == "SELL":
-            # 1. Aggiorna Cash
-            new_cash = current_cash + transaction_value
-            self.update_cash(new_cash, currency)
-            
-            # 2. Calcola Nuova Size
-            current_pos_size = 0
-            mask = self.df_portfolio["ticker"] == ticker
-            if not self.df_portfolio.empty and mask.any():
-                current_pos_size = int(self.df_portfolio.loc[mask, "size"].iloc[0])
-            
-            new_size = current_pos_size - qty
-            
-            # 3. Gestione chiusura o riduzione
-            if new_size <= 0:
-                # Posizione chiusa: Rimuoviamo la riga dal DataFrame
-                if not self.df_portfolio.empty:
-                    self.df_portfolio = self.df_portfolio[self.df_portfolio["ticker"] != ticker]
-                    self.logger.info(f"[Portfolio] Posizione chiusa su {ticker}.")
+        # Controlli che non dipendono dallo stato: in blocco
+        invalid = np.select(
+            [qtys <= 0, np.isnan(prices), ~np.isin(actions, ("BUY", "SELL"))],
+            ["quantità <= 0", "prezzo mancante", "azione sconosciuta"],
+            "",
+        )
+
+        now = datetime.now()
+        cash = self.cash
+        results, trades = [], []
+        # Posizioni e cassa cambiano ordine dopo ordine: il resto è sequenziale
+        for i, order in enumerate(orders):
+            ticker = order.get("ticker")
+            action, qty, price = actions[i], int(qtys[i]), float(prices[i])
+            value, fee = float(values[i]), float(fees[i])
+            pos = self.positions.get(ticker)
+            held = pos.size if pos is not None else 0
+
+            reason = invalid[i] or None
+            if reason is None and action == "SELL":
+                if held <= 0:
+                    reason = "nessuna posizione da vendere"
+                elif qty > held:
+                    self.logger.warning(f"[Portfolio] SELL {qty} {ticker} oltre la posizione ({held}): chiudo la posizione.")
+                    qty = held
+                    value = qty * price
+                    fee = float(fee_model(value)) if fee_model is not None else 0.0
+            if reason is None and action == "BUY" and check_cash and value + fee > cash + 1e-9:
+                reason = "cassa insufficiente"
+
+            results.append({
+                "ticker": ticker, "action": action, "quantity": qty, "price": price,
+                "commission": fee if reason is None else 0.0,
+                "status": ORDER_REJECTED if reason else ORDER_FILLED, "reason": reason,
+            })
+            if reason:
+                continue
+
+            # --- LOGICA BUY ---
+            if action == "BUY":
+                cash -= value + fee
+                # L'ordine è "law": SL/TP sovrascritti con quelli dell'ordine,
+                # prezzo aggiornato a quello di esecuzione (Mark-to-Market immediato)
+                sl = order.get("stop_loss")
+                tp = order.get("take_profit", order.get("profit_take"))
+                if pos is None:
+                    self.positions[ticker] = Position(ticker, qty, price, sl, tp, now)
+                else:
+                    pos.size, pos.price, pos.stop_loss, pos.profit_take, pos.updated_at = \
+                        held + qty, price, sl, tp, now
+
+            # --- LOGICA SELL ---
             else:
-                # Posizione ridotta: Aggiorniamo solo size e prezzo corrente
-                # Manteniamo i vecchi SL/TP se non specificati diversamente, 
-                # ma solitamente in sell parziale non si cambiano gli stop.
-                # Recuperiamo i vecchi valori per non perderli
-                old_sl = self.df_portfolio.loc[mask, "stop_loss"].iloc[0]
-                old_tp = self.df_portfolio.loc[mask, "profit_take"].iloc[0]
-                
-                self.update_position(
-                    ticker=ticker,
-                    size=new_size,
-                    price=price,
-                    stop_loss=old_sl,
-                    profit_take=old_tp
-                )
+                cash += value - fee
+                if qty == held:
+                    # Posizione chiusa: rimossa dal portafoglio
+                    del self.positions[ticker]
+                else:
+                    # Posizione ridotta: in una vendita parziale SL/TP restano quelli della posizione
+                    pos.size, pos.price, pos.updated_at = held - qty, price, now
+
+            trades.append({"ticker": ticker, "size": qty, "price": price, "action": action, "date": now,
+                           "trade_key": uuid.uuid4().hex})
+            self._emit(EVENT_FILL, ticker, now, action=action, quantity=qty, price=price, commission=fee,
+                       stop_loss=_opt_float(order.get("stop_loss")),
+                       profit_take=_opt_float(order.get("take_profit", order.get("profit_take"))))
+
+        # Cassa e storico trades: un solo aggiornamento per tutto il batch
+        if trades:
+            self._new_trades.extend(trades)
+            self._cash = float(cash)
+            self._cash_updated_at = now
 
-        # 4. Log Trade (Storico)
-        self.add_trade(ticker, qty, price, action)
+        filled = len(trades)
+        self.logger.info(
+            f"[Portfolio] Eseguiti {filled}/{n} ordini "
+            f"(commissioni {sum(r['commission'] for r in results):.2f}, cassa {self.cash:.2f})."
+        )
+        return results
 
 
     # ----------------------
@@ -203,105 +398,93 @@ class PortfolioManager:
     # ----------------------
     def update_market_prices(self, current_prices: dict):
         """
-        Aggiorna solo la colonna 'price' (Mark-to-Market).
+        Aggiorna solo il prezzo corrente delle posizioni (Mark-to-Market).
         Input: {'AAPL': 155.0, 'MSFT': 300.0}
         """
-        if self.df_portfolio.empty:
+        if not self.positions:
             return
 
         now = datetime.now()
-        # Iterazione efficiente su Pandas
-        for ticker, new_price in current_prices.items():
-            mask = self.df_portfolio["ticker"] == ticker
-            if mask.any():
-                self.df_portfolio.loc[mask, "price"] = new_price
-                self.df_portfolio.loc[mask, "updated_at"] = now
+        # Si scorre il lato più piccolo: lookup O(1) sull'altro
+        if len(current_prices) <= len(self.positions):
+            for ticker, new_price in current_prices.items():
+                pos = self.positions.get(ticker)
+                if pos is not None:
+                    pos.price = new_price
+                    pos.updated_at = now
+        else:
+            for ticker, pos in self.positions.items():
+                if ticker in current_prices:
+                    pos.price = current_prices[ticker]
+                    pos.updated_at = now
 
     def check_stops_and_targets(self) -> list:
         """
         Restituisce una lista di allarmi se un prezzo ha superato i livelli.
         """
         alerts = []
-        if self.df_portfolio.empty:
-            return alerts
-
-        for _, row in self.df_portfolio.iterrows():
-            curr = row["price"]
-            sl = row["stop_loss"]
-            tp = row["profit_take"]
+        for pos in self.positions.values():
+            curr, sl, tp = pos.price, pos.stop_loss, pos.profit_take
             
             # Check validità (potrebbero essere NaN o None)
             if pd.notna(sl) and curr <= sl:
-                alerts.append(f"STOP LOSS HIT: {row['ticker']} @ {curr}")
+                alerts.append(f"STOP LOSS HIT: {pos.ticker} @ {curr}")
             elif pd.notna(tp) and curr >= tp:
-                alerts.append(f"TARGET HIT: {row['ticker']} @ {curr}")
+                alerts.append(f"TARGET HIT: {pos.ticker} @ {curr}")
         
         return alerts
 
     def add_trade(self, ticker: str, size: int, price: float, action: str):
-        """Registra un nuovo trade nel DataFrame trades."""
-        trade = {
+        """Registra un nuovo trade (buffer dei trade da persistere)."""
+        self._new_trades.append({
             "ticker": ticker,
             "size": size,
             "price": price,
             "action": action,
-            "date": datetime.now()
-        }
-        # Creiamo il DF per la singola riga
-        new_trade_row = pd.DataFrame([trade])
-
-        if self.df_trades.empty:
-            self.df_trades = new_trade_row
-        else:
-            self.df_trades = pd.concat([self.df_trades, new_trade_row], ignore_index=True)
-            
+            "date": datetime.now(),
+            "trade_key": uuid.uuid4().hex
+        })
         self.logger.info(f"[Portfolio] Trade eseguito: {action} {size} {ticker} @ {price}")
 
     def update_position(self, ticker: str, size: int, price: float,
                         stop_loss: float = None, profit_take: float = None):
         """
-        Aggiorna o inserisce una posizione nel DataFrame portfolio.
+        Aggiorna o inserisce una posizione.
         """
         now = datetime.now()
-        mask = self.df_portfolio["ticker"] == ticker if not self.df_portfolio.empty else pd.Series(dtype=bool)
+        pos = self.positions.get(ticker)
         
-        if mask.any():
+        if pos is not None:
             # Update esistente
-            self.df_portfolio.loc[mask, ["size", "price", "stop_loss", "profit_take", "updated_at"]] = \
-                [size, price, stop_loss, profit_take, now]
+            pos.size, pos.price, pos.stop_loss, pos.profit_take, pos.updated_at = \
+                size, price, stop_loss, profit_take, now
             self.logger.info(f"[Portfolio] Posizione aggiornata per {ticker}.") # Ridotto log per backtest
         else:
             # Insert nuovo
-            new_pos = {
-                "ticker": ticker,
-                "size": size,
-                "price": price,
-                "stop_loss": stop_loss,
-                "profit_take": profit_take,
-                "updated_at": now
-            }
-            new_pos_row = pd.DataFrame([new_pos])
-
-            if self.df_portfolio.empty:
-                self.df_portfolio = new_pos_row
-            else:
-                self.df_portfolio = pd.concat([self.df_portfolio, new_pos_row], ignore_index=True)
+            self.positions[ticker] = Position(ticker, size, price, stop_loss, profit_take, now)
             self.logger.info(f"[Portfolio] Nuova posizione aggiunta: {ticker}.")
+        self._emit(EVENT_POSITION, ticker, now, size=int(size),
+                   stop_loss=_opt_float(stop_loss), profit_take=_opt_float(profit_take))
 
     def update_cash(self, cash: float, currency: str = "EUR"):
         """Aggiorna il valore della cassa."""
-        now = datetime.now()
-        self.df_cash = pd.DataFrame([{
-            "cash": cash,
-            "currency": currency,
-            "updated_at": now
-        }])
+        self._cash = float(cash)
+        self._currency = currency
+        self._cash_updated_at = datetime.now()
+        self._emit(EVENT_CASH, None, self._cash_updated_at, cash=self._cash, currency=currency)
         self.logger.info(f"[Portfolio] Cassa aggiornata: {cash:.2f} {currency}")
 
     def get_positions_summary(self) -> pd.DataFrame:
-        return self.df_portfolio.copy()
+        return self.df_portfolio
 
     def get_trades_history(self, limit: int = 10) -> pd.DataFrame:
-        if self.df_trades.empty:
+        """
+        Ultimi trade in memoria, dal più recente.
+        Lo storico è già in ordine cronologico (caricato ORDER BY date, poi append):
+        basta prendere la coda, senza riordinare tutto lo storico.
+        Per lo storico completo sul DB usare DatabaseManager.get_trades_page.
+        """
+        df_trades = self.df_trades
+        if df_trades.empty:
             return pd.DataFrame()
-        return self.df_trades.sort_values("date", ascending=False).head(limit).reset_index(drop=True)
\ No newline at end of file
+        return df_trades.tail(limit).iloc[::-1].reset_index(drop=True)
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from config.config import config
+from .base import MarketDataProvider
+from .yahoo import YahooProvider
+from .local_files import LocalFilesProvider
+
+# Mappa dei nomi provider alle classi
+PROVIDER_MAP = {
+    "yahoo": YahooProvider,
+    "local": LocalFilesProvider
+}
+
+def get_provider(provider_name: Optional[str] = None, **kwargs) -> MarketDataProvider:
+    """
+    Factory Method: Istanzia e restituisce il provider di dati di mercato richiesto.
+
+    Args:
+        provider_name (str): Nome del provider (es. "yahoo", "local").
+                             Default: config.MARKET_DATA_PROVIDER.
+        **kwargs: Parametri specifici (es. root=Path(...) per "local").
+
+    Returns:
+        MarketDataProvider: L'istanza del provider configurato.
+
+    Raises:
+        ValueError: Se il nome del provider non è supportato.
+    """
+    provider_name = (provider_name or config.MARKET_DATA_PROVIDER).lower()
+    if provider_name not in PROVIDER_MAP:
+        raise ValueError(f"Provider '{provider_name}' non trovato. Disponibili: {list(PROVIDER_MAP.keys())}")
+
+    return PROVIDER_MAP[provider_name](**kwargs)
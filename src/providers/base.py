@@ -0,0 +1,138 @@
+# src/providers/base.py
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Tuple
+import pandas as pd
+
+from config.config import config
+from src.download_scheduler import DownloadScheduler
+from src.logger import get_logger
+
+# Formato colonnare dei dati OHLCV (una colonna per campo, date come datetime64)
+OHLC_FRAME_COLUMNS = ["ticker", "date", "open", "high", "low", "close", "volume"]
+
+
+def empty_ohlc_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "ticker": pd.Series(dtype=object), "date": pd.Series(dtype="datetime64[ns]"),
+        "open": pd.Series(dtype=float), "high": pd.Series(dtype=float),
+        "low": pd.Series(dtype=float), "close": pd.Series(dtype=float),
+        "volume": pd.Series(dtype="int64"),
+    })
+
+
+def frame_to_rows(df: pd.DataFrame) -> List[Tuple]:
+    """Frame colonnare -> tuple (ticker, date, open, high, low, close, volume) per i chiamanti legacy."""
+    if df.empty:
+        return []
+    return list(zip(
+        df["ticker"].tolist(), df["date"].dt.date.tolist(),
+        df["open"].tolist(), df["high"].tolist(), df["low"].tolist(), df["close"].tolist(),
+        df["volume"].tolist(),
+    ))
+
+
+def rows_to_frame(rows: List[Tuple]) -> pd.DataFrame:
+    """Tuple OHLCV -> frame colonnare."""
+    if not rows:
+        return empty_ohlc_frame()
+    df = pd.DataFrame(rows, columns=OHLC_FRAME_COLUMNS)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+class MarketDataProvider(ABC):
+    """
+    Classe astratta per le sorgenti di dati OHLCV (Yahoo, file locali, ...).
+
+    Le sottoclassi implementano solo `download`; fetch a finestra, piani di
+    fetch (src.fetch_planner) e scheduling a chunk con retry sono comuni.
+
+    Due formati di output:
+    - tuple (ticker, date, open, high, low, close, volume), quello di
+      DatabaseManager.upsert_ohlc (chiamanti legacy);
+    - frame colonnare (OHLC_FRAME_COLUMNS), da passare a DatabaseManager.copy_ohlc
+      senza creare un oggetto Python per riga. Le sottoclassi possono produrlo
+      nativamente ridefinendo `download_frame`.
+    """
+
+    # Chunk scaricabili in parallelo (vedi DownloadScheduler)
+    max_workers: int = 1
+
+    def __init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+        # Esito per ticker dell'ultimo piano eseguito (vedi DownloadScheduler.status)
+        self.last_status: Dict[str, dict] = {}
+
+    @abstractmethod
+    def download(self, tickers: List[str], start_date: date, end_date: date) -> List[Tuple]:
+        """
+        Righe OHLCV dei ticker nell'intervallo [start_date, end_date) (end esclusa).
+        Solleva un'eccezione in caso di errore: lo scheduler ritenta il chunk.
+        I ticker senza dati semplicemente non compaiono nel risultato.
+        """
+        pass
+
+    def download_frame(self, tickers: List[str], start_date: date, end_date: date) -> pd.DataFrame:
+        """Come download, in formato colonnare."""
+        return rows_to_frame(self.download(tickers, start_date, end_date))
+
+    def fetch_range(self, tickers: List[str], start_date: date, end_date: date) -> List[Tuple]:
+        """Come download, ma in caso di errore registra il problema e restituisce []."""
+        try:
+            return self.download(tickers, start_date, end_date)
+        except Exception as e:
+            self.logger.error(f"Errore durante il fetch OHLCV: {e}")
+            return []
+
+    def fetch_ohlc(self, tickers: List[str], days: int = 30) -> List[Tuple]:
+        """Recupera dati OHLCV per i ticker indicati dagli ultimi `days` giorni."""
+        end_date = datetime.now(timezone.utc).date()
+        start_date = end_date - timedelta(days=days)
+        return self.fetch_range(tickers, start_date, end_date)
+
+    def fetch_history(self, tickers: List[str], years: int = 3) -> List[Tuple]:
+        """Recupera i dati storici fino a `years` anni fa per bootstrap iniziale."""
+        days = years * 365
+        self.logger.info(f"Fetching {years} year(s) of history ({days} days)...")
+        return self.fetch_ohlc(tickers, days=days)
+
+    # ----------------------
+    # Piani di fetch
+    # ----------------------
+    def iter_plan(self, plan: List[dict]) -> Iterator[List[Tuple]]:
+        """
+        Esegue i download pianificati da src.fetch_planner.plan_fetches tramite
+        DownloadScheduler (chunk, retry con backoff dei soli ticker falliti)
+        e genera le righe un chunk alla volta.
+        L'esito per ticker resta in self.last_status a fine iterazione.
+        """
+        return self._run_plan(plan, self.download)
+
+    def iter_plan_frames(self, plan: List[dict]) -> Iterator[pd.DataFrame]:
+        """Come iter_plan, ma ogni chunk è un frame colonnare (per DatabaseManager.copy_ohlc)."""
+        return self._run_plan(plan, self.download_frame)
+
+    def _run_plan(self, plan: List[dict], fetch_fn) -> Iterator:
+        scheduler = DownloadScheduler(
+            fetch_fn,
+            chunk_size=config.FETCH_CHUNK_SIZE,
+            max_workers=self.max_workers,
+            max_retries=config.FETCH_MAX_RETRIES
+        )
+        try:
+            yield from scheduler.run(plan)
+        finally:
+            self.last_status = scheduler.status
+
+    def fetch_plan(self, plan: List[dict]) -> List[Tuple]:
+        """Come iter_plan, ma restituisce tutte le righe in un'unica lista."""
+        all_data: List[Tuple] = []
+        for rows in self.iter_plan(plan):
+            all_data.extend(rows)
+        self.logger.info(f"Piano di fetch completato: {len(plan)} voci, {len(all_data)} record.")
+        return all_data
+
+    def failed_tickers(self) -> List[str]:
+        """Ticker che l'ultimo piano non è riuscito a scaricare."""
+        return sorted(t for t, s in self.last_status.items() if s["error"] is not None)
@@ -0,0 +1,102 @@
+# src/providers/download_cache.py
+import hashlib
+import json
+import os
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Optional
+import pandas as pd
+
+from config.config import config
+from src.logger import get_logger
+
+
+class DownloadCache:
+    """
+    Cache su disco dei frame grezzi scaricati dai provider (content-addressed).
+
+    La chiave è l'hash di (provider, insieme dei ticker, intervallo, opzioni):
+    lo stesso download rieseguito (rerun di daily_run, init_db, tester) viene
+    servito dal file invece che dalla rete.
+
+    Validità:
+    - intervalli che finiscono più di `settle_days` giorni fa: fino a `max_age_days`
+      (lo storico consolidato non cambia più);
+    - intervalli recenti: `ttl_seconds` (le ultime candele possono essere corrette).
+
+    Ogni chiave distinta è un file: alla prima scrittura di ogni istanza le voci più
+    vecchie di `max_age_days` vengono eliminate, così la cartella non cresce senza limiti.
+    """
+
+    def __init__(self,
+                 root: Optional[Path] = None,
+                 ttl_seconds: Optional[int] = None,
+                 settle_days: int = 7,
+                 max_age_days: Optional[int] = None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.root = Path(root) if root else config.DOWNLOAD_CACHE_DIR
+        self.ttl_seconds = config.DOWNLOAD_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        self.settle_days = settle_days
+        self.max_age_days = config.DOWNLOAD_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        self._pruned = False
+
+    @staticmethod
+    def key(provider: str, tickers: list, start_date: date, end_date: date, **options) -> str:
+        payload = json.dumps({
+            "provider": provider,
+            "tickers": sorted(set(tickers)),
+            "start": str(start_date),
+            "end": str(end_date),
+            "options": options,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        # Due livelli di directory per non avere migliaia di file in una sola cartella
+        return self.root / key[:2] / f"{key}.pkl"
+
+    def _is_settled(self, end_date: date) -> bool:
+        return end_date <= date.today() - timedelta(days=self.settle_days)
+
+    def get(self, key: str, end_date: date) -> Optional[pd.DataFrame]:
+        """Frame in cache, o None se assente / scaduto."""
+        path = self._path(key)
+        if not path.exists():
+            return None
+        age = time.time() - path.stat().st_mtime
+        if age > self.max_age_days * 86400:
+            return None
+        if not self._is_settled(end_date) and age > self.ttl_seconds:
+            return None
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            self.logger.warning(f"Voce di cache illeggibile ({path.name}), la ignoro: {e}")
+            return None
+
+    def put(self, key: str, data: pd.DataFrame):
+        """Scrittura atomica: file temporaneo + rename."""
+        if not self._pruned:
+            self.prune()
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        data.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+    def prune(self) -> int:
+        """Elimina le voci più vecchie di `max_age_days`. Restituisce quante ne ha rimosse."""
+        self._pruned = True
+        cutoff = time.time() - self.max_age_days * 86400
+        removed = 0
+        for path in self.root.glob("*/*.pkl"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue  # rimossa nel frattempo da un altro processo
+        if removed:
+            self.logger.info(f"Cache download: eliminate {removed} voci più vecchie di {self.max_age_days} giorni.")
+        return removed
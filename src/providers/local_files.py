@@ -0,0 +1,97 @@
+# src/providers/local_files.py
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+
+from config.config import config
+from src.providers.base import MarketDataProvider, OHLC_FRAME_COLUMNS, empty_ohlc_frame, frame_to_rows
+
+OHLC_COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+
+
+class LocalFilesProvider(MarketDataProvider):
+    """
+    Dati OHLCV registrati su disco: un file per ticker, <root>/<TICKER>.parquet
+    oppure <root>/<TICKER>.csv, con colonne date, open, high, low, close, volume
+    (maiuscole/minuscole indifferenti, come nell'export di Yahoo).
+
+    Nessuna rete: serve per replay della pipeline live, load test e benchmark.
+    I file si possono produrre con `record` a partire da qualunque altro provider.
+    """
+
+    # Letture da disco indipendenti: i chunk possono andare in parallelo
+    max_workers = 8
+
+    def __init__(self, root: Optional[Path] = None, cache: bool = True):
+        """cache: tiene in memoria i file già letti (replay ripetuti alla velocità della RAM)."""
+        super().__init__()
+        self.root = Path(root) if root else config.LOCAL_MARKET_DATA_DIR
+        self.cache = cache
+        self._frames: Dict[str, pd.DataFrame] = {}
+
+    def _path(self, ticker: str) -> Optional[Path]:
+        for suffix in (".parquet", ".csv"):
+            path = self.root / f"{ticker}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def _load(self, ticker: str) -> Optional[pd.DataFrame]:
+        if ticker in self._frames:
+            return self._frames[ticker]
+
+        path = self._path(ticker)
+        if path is None:
+            return None
+
+        df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+        df.columns = [c.lower() for c in df.columns]
+        df = df[OHLC_COLUMNS].copy()
+        df["date"] = pd.to_datetime(df["date"]).dt.normalize()
+        df[["open", "high", "low", "close"]] = df[["open", "high", "low", "close"]].astype(float)
+        df["volume"] = df["volume"].fillna(0).astype("int64")
+        df = df.sort_values("date").reset_index(drop=True)
+
+        if self.cache:
+            self._frames[ticker] = df
+        return df
+
+    def download(self, tickers: List[str], start_date: date, end_date: date) -> List[Tuple]:
+        return frame_to_rows(self.download_frame(tickers, start_date, end_date))
+
+    def download_frame(self, tickers: List[str], start_date: date, end_date: date) -> pd.DataFrame:
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        windows = []
+        for ticker in tickers:
+            df = self._load(ticker)
+            if df is None:
+                self.logger.warning(f"Nessun file di dati per {ticker} in {self.root}.")
+                continue
+            window = df[(df["date"] >= start) & (df["date"] < end)]
+            if not window.empty:
+                windows.append(window.assign(ticker=ticker))
+        if not windows:
+            return empty_ohlc_frame()
+        return pd.concat(windows, ignore_index=True)[OHLC_FRAME_COLUMNS]
+
+    def record(self, rows: List[Tuple]):
+        """
+        Salva righe OHLCV (formato upsert_ohlc) nei file parquet dei rispettivi ticker,
+        unendole a quelle già presenti (a parità di data vince la riga nuova).
+        """
+        if not rows:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        df_new = pd.DataFrame(rows, columns=["ticker"] + OHLC_COLUMNS)
+
+        for ticker, df in df_new.groupby("ticker"):
+            existing = self._load(ticker)
+            df = df[OHLC_COLUMNS].assign(date=pd.to_datetime(df["date"]))
+            if existing is not None:
+                df = pd.concat([existing, df]).drop_duplicates("date", keep="last")
+            df = df.sort_values("date").reset_index(drop=True)
+            df.to_parquet(self.root / f"{ticker}.parquet", index=False)
+            self._frames.pop(ticker, None)
+
+        self.logger.info(f"Registrate {len(df_new)} righe OHLCV per {df_new['ticker'].nunique()} ticker in {self.root}.")
@@ -0,0 +1,146 @@
+# src/providers/yahoo.py
+import threading
+from typing import List, Optional, Tuple
+from datetime import date
+import pandas as pd
+import yfinance as yf
+import numpy as np
+
+from config.config import config
+from src.providers.base import MarketDataProvider, empty_ohlc_frame, frame_to_rows
+from src.providers.download_cache import DownloadCache
+
+YF_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+MAX_BIGINT_SAFE = 10**15
+
+# yf.download accumula i risultati in uno stato globale del modulo (yfinance.shared):
+# due chiamate contemporanee si mescolano i dati. Le serializziamo (rete di sicurezza
+# se più provider girano nello stesso processo); il parallelismo dentro al chunk
+# resta quello di yfinance (threads=True).
+_YF_DOWNLOAD_LOCK = threading.Lock()
+
+
+class YahooProvider(MarketDataProvider):
+    """
+    Gestisce il recupero e la pulizia di dati OHLCV da Yahoo Finance.
+    - threads: abilita il threading nativo di yfinance
+    - auto_adjust: passato esplicitamente a yf.download per rimuovere il FutureWarning
+    - cache: cache su disco dei frame grezzi (default: attiva se config.DOWNLOAD_CACHE_ENABLED)
+
+    Concorrenza: un chunk alla volta (max_workers = 1). yf.download non è rientrante
+    (vedi _YF_DOWNLOAD_LOCK), quindi più worker resterebbero comunque in coda sul lock;
+    il parallelismo effettivo è quello interno di yfinance sui ticker del chunk.
+    Lo scheduler sovrappone comunque il download del chunk successivo alla scrittura sul DB.
+    """
+
+    max_workers = 1
+
+    def __init__(self, threads: bool = True, auto_adjust: bool = False, cache: Optional[DownloadCache] = None):
+        super().__init__()
+        self.threads = threads
+        self.auto_adjust = auto_adjust
+        self.cache = cache if cache is not None else (DownloadCache() if config.DOWNLOAD_CACHE_ENABLED else None)
+
+    def download(self, tickers: List[str], start_date: date, end_date: date) -> List[Tuple]:
+        """Una chiamata a yf.download; righe come tuple (chiamanti legacy)."""
+        return frame_to_rows(self.download_frame(tickers, start_date, end_date))
+
+    def download_frame(self, tickers: List[str], start_date: date, end_date: date) -> pd.DataFrame:
+        """Una chiamata a yf.download + normalizzazione colonnare."""
+        key = None
+        if self.cache is not None:
+            key = DownloadCache.key("yahoo", tickers, start_date, end_date, auto_adjust=self.auto_adjust)
+            data = self.cache.get(key, end_date)
+            if data is not None:
+                self.logger.info(f"Cache hit OHLCV per {len(tickers)} ticker ({start_date} -> {end_date}).")
+                return self._normalize_frame(data, tickers)
+
+        data = self._fetch_raw(tickers, start_date, end_date)
+        if key is not None and data is not None and not data.empty:
+            self.cache.put(key, data)
+
+        cleaned = self._normalize_frame(data, tickers)
+        self.logger.info(f"Fetched {len(cleaned)} OHLCV records from Yahoo Finance.")
+
+        return cleaned
+
+    def _fetch_raw(self, tickers: List[str], start_date: date, end_date: date) -> pd.DataFrame:
+        """Frame grezzo di yf.download (date x [ticker, campo])."""
+        self.logger.info(f"Fetching OHLCV for {len(tickers)} ticker(s) from {start_date} to {end_date}")
+
+        with _YF_DOWNLOAD_LOCK:
+            data = yf.download(
+                tickers=tickers,
+                start=start_date,
+                end=end_date,
+                progress=False,
+                group_by="ticker",
+                threads=self.threads,
+                auto_adjust=self.auto_adjust,  # *** esplicito per sopprimere FutureWarning ***
+            )
+        return data
+
+    def _normalize_data(self, data: pd.DataFrame, tickers: List) -> List[Tuple]:
+        """Normalizzazione in lista di tuple (ticker, date, open, high, low, close, volume)."""
+        return frame_to_rows(self._normalize_frame(data, tickers))
+
+    def _normalize_frame(self, data: pd.DataFrame, tickers: List) -> pd.DataFrame:
+        """
+        Trasforma l'output di yf.download (date x [ticker, campo]) nel frame colonnare
+        OHLC_FRAME_COLUMNS, tutto con operazioni numpy sulle matrici date x ticker:
+        niente stack del frame intero e nessun oggetto Python per riga.
+
+        Pulizia:
+        - prezzi non finiti -> NaN; le righe senza close vengono scartate
+          (ticker senza dati in quella data: non devono arrivare al DB);
+        - volume NaN/inf -> 0, limitato a MAX_BIGINT_SAFE e convertito a int64.
+        """
+        if data is None or (isinstance(data, pd.DataFrame) and data.empty):
+            self.logger.warning("Nessun dato ricevuto da yfinance (data è vuoto).")
+            return empty_ohlc_frame()
+
+        # Gestione Multi-Index vs Single-Index
+        # Se scarichiamo 1 solo ticker, yfinance non usa il MultiIndex sulle colonne.
+        try:
+            if isinstance(data.columns, pd.MultiIndex):
+                # group_by="ticker": livello 0 = ticker, livello 1 = campo
+                frame_tickers = data.columns.get_level_values(0).unique()
+                matrices = {
+                    f: data.xs(f, axis=1, level=1).reindex(columns=frame_tickers).to_numpy(dtype=float)
+                    for f in YF_FIELDS
+                }
+            else:
+                # Caso singolo ticker: una sola colonna per campo
+                frame_tickers = pd.Index([tickers[0] if tickers else "UNKNOWN"])
+                matrices = {f: data[[f]].to_numpy(dtype=float) for f in YF_FIELDS}
+        except KeyError as e:
+            self.logger.error(f"Colonne mancanti nel DataFrame normalizzato: {e}")
+            return empty_ohlc_frame()
+
+        # Date senza timezone e senza orario (una candela giornaliera)
+        dates = pd.DatetimeIndex(pd.to_datetime(data.index))
+        if dates.tz is not None:
+            dates = dates.tz_localize(None)
+        dates = dates.normalize().to_numpy()
+
+        # Matrici trasposte (ticker x date): il mask produce righe già ordinate per ticker, data
+        prices = {f: matrices[f].T.copy() for f in ["Open", "High", "Low", "Close"]}
+        for m in prices.values():
+            m[~np.isfinite(m)] = np.nan
+        volume = np.nan_to_num(matrices["Volume"].T, nan=0.0, posinf=0.0, neginf=0.0)
+
+        # Il max di Postgres BIGINT è ~9.22 * 10^18.
+        # Impostiamo un limite sicuro (es. 10^15) che è comunque irraggiungibile per volumi reali.
+        volume = np.clip(volume, 0, MAX_BIGINT_SAFE).astype(np.int64)
+
+        valid = ~np.isnan(prices["Close"])
+        n_tickers, n_dates = valid.shape
+        return pd.DataFrame({
+            "ticker": np.broadcast_to(frame_tickers.to_numpy(dtype=object)[:, None], (n_tickers, n_dates))[valid],
+            "date": np.broadcast_to(dates[None, :], (n_tickers, n_dates))[valid],
+            "open": prices["Open"][valid],
+            "high": prices["High"][valid],
+            "low": prices["Low"][valid],
+            "close": prices["Close"][valid],
+            "volume": volume[valid],
+        })
@@ -3,6 +3,8 @@ import numpy as np
 from typing import List, Dict, Any
 from src.logger import get_logger
 
+_logger = get_logger("RiskManager")
+
 class RiskManager:
     """
     Risk Manager: Modulo puro.
@@ -23,192 +25,274 @@ class RiskManager:
                  signals_df: pd.DataFrame, 
                  total_equity: float, 
                  available_cash: float, 
-                 current_positions: Dict[str, int]) -> List[Dict[str, Any]]:
+                 current_positions: Dict[str, int],
+                 fee_model=None) -> List[Dict[str, Any]]:
         """
         Valuta i segnali rispetto ai dati finanziari forniti.
+
+        Calcolo vettoriale (numpy) su tutti i segnali:
+          1. SELL delle posizioni possedute (la cassa liberata è subito disponibile);
+          2. BUY: stop, size a rischio costante e controllo di cassa per tutti i candidati,
+             nell'ordine dei segnali (= priorità). La cassa si consuma con una somma
+             cumulativa: gli ordini che ci stanno interi si accettano in blocco, il primo
+             che sfora viene ridotto alla cassa residua e si riparte da quello successivo.
+
+        fee_model: commissioni da scontare nel controllo di cassa (oggetto con .fixed e
+        .percentage, vedi portfolio_manager.FeeModel). Va passato lo stesso modello usato
+        in esecuzione: altrimenti l'ultimo ordine dimensionato sulla cassa esatta viene
+        rifiutato da PortfolioManager.execute_orders per "cassa insufficiente".
+
+        current_positions ({ticker: size}) non viene modificato.
         """
         orders = []
         if signals_df.empty:
             return orders
 
-        # Usiamo variabili locali per simulare l'evoluzione della cassa nel loop
-        simulated_cash = available_cash
-        
         # LOG INIZIALE: Fondamentale per sapere con quanti soldi stiamo partendo
         self.logger.info(f"Risk Eval Start. Equity: {total_equity:.2f}, Cash: {available_cash:.2f}")
 
-        # -----------------------------------------------------------
-        # FASE 1: VENDITE (Generano Cash Virtuale)
-        # -----------------------------------------------------------
-        sell_signals = signals_df[signals_df['signal'] == 'SELL']
-        
-        for _, row in sell_signals.iterrows():
-            ticker = row['ticker']
-            price = row['price']
-
-            if ticker in current_positions:
-                size_to_sell = current_positions[ticker]
-                if size_to_sell <= 0: 
-                    continue
-
-                # LOG VENDITA
-                self.logger.info(f"📉 SELLING {ticker}: Qty {size_to_sell} @ {price:.2f}")
-
-                orders.append({
-                    "ticker": ticker,
-                    "action": "SELL",
-                    "order_type": "MARKET",
-                    "quantity": size_to_sell,
-                    "price": price,
-                    "reason": row.get('meta')
-                })
-
-                # Aggiorniamo la cassa simulata
-                proceeds = size_to_sell * price
-                simulated_cash += proceeds
-                
-                # Rimuoviamo virtualmente
-                del current_positions[ticker]
-
-        # -----------------------------------------------------------
-        # FASE 2: ACQUISTI (Consumano Cash Virtuale)
-        # -----------------------------------------------------------
-        buy_signals = signals_df[signals_df['signal'] == 'BUY']
-
-        for _, row in buy_signals.iterrows():
-            ticker = row['ticker']
-            price = row['price']
-            atr = row.get('atr', 0.0)
-
-            # 1. Non comprare se ho già la posizione
-            if ticker in current_positions:
-                # LOG DEBUG: Skippo perché lo ho già
-                self.logger.debug(f"⏭️ SKIP BUY {ticker}: Posizione già in portafoglio.")
-                continue
-            
-            # 2. Validazione ATR
-            if atr <= 0 or pd.isna(atr):
-                # LOG WARNING: Problema dati
-                self.logger.warning(f"⚠️ SKIP BUY {ticker}: ATR non valido ({atr}).")
-                continue
-
-            # --- POSITION SIZING ---
-            risk_budget = total_equity * self.risk_per_trade 
-            stop_distance = atr * self.stop_atr_multiplier
-            stop_loss_price = price - stop_distance
-
-            if stop_loss_price <= 0:
-                self.logger.warning(f"⚠️ SKIP BUY {ticker}: Stop Price negativo ({stop_loss_price:.2f}).")
-                continue
-
-            # Size = Rischio Euro / Rischio per Azione
-            shares_calc = risk_budget / stop_distance
-            shares = int(np.floor(shares_calc))
-
-            # LOG CRUCIALE: Qui vediamo i calcoli matematici
-            # Se shares è 0, vedremo esattamente perché (es. Stop distance troppo grande rispetto al budget)
-            self.logger.debug(
-                f"🔍 CALC {ticker} | Price: {price:.2f} | ATR: {atr:.2f} | "
-                f"RiskBudget: {risk_budget:.2f} | StopDist: {stop_distance:.2f} | "
-                f"RawShares: {shares_calc:.4f} -> {shares}"
-            )
-
-            # --- CASH CHECK ---
-            cost = shares * price
-            
-            # Se il costo supera la cassa (inclusa quella liberata dalle vendite)
-            if cost > simulated_cash:
-                max_shares_cash = int(np.floor(simulated_cash / price))
-                # LOG CASH: Se ridimensioniamo per mancanza di fondi
-                self.logger.debug(f"💰 RESIZE {ticker}: Cash insufficiente ({simulated_cash:.2f} vs Costo {cost:.2f}). Ridotto a {max_shares_cash}.")
-                shares = max_shares_cash
-                cost = shares * price
-            
-            if shares < 1:
-                # LOG USCITA: Se alla fine la size è 0
-                self.logger.debug(f"❌ SKIP {ticker}: Quantità finale pari a 0.")
-                continue
-
-            # LOG SUCCESSO
-            self.logger.info(f"✅ BUY {ticker}: {shares} shares @ {price:.2f} (Stop: {stop_loss_price:.2f})")
+        fixed_fee = float(getattr(fee_model, "fixed", 0.0) or 0.0)
+        pct_fee = float(getattr(fee_model, "percentage", 0.0) or 0.0)
 
-            orders.append({
+        sell_orders, proceeds, sold = self._sell_orders(signals_df, current_positions)
+        # Incasso netto: anche le vendite pagano commissioni
+        proceeds -= len(sell_orders) * fixed_fee + proceeds * pct_fee
+        buy_orders = self._buy_orders(
+            signals_df,
+            total_equity,
+            available_cash + proceeds,
+            held={t for t, size in current_positions.items() if t not in sold},
+            fees=(fixed_fee, pct_fee),
+        )
+        return sell_orders + buy_orders
+
+    def _sell_orders(self, signals_df: pd.DataFrame, current_positions: Dict[str, int]):
+        """FASE 1: VENDITE (generano cassa virtuale). Restituisce (ordini, incasso, ticker venduti)."""
+        sells = signals_df[signals_df['signal'] == 'SELL'].drop_duplicates('ticker')
+        if sells.empty:
+            return [], 0.0, set()
+
+        sizes = sells['ticker'].map(current_positions).fillna(0).to_numpy(dtype=np.int64)
+        sells = sells[sizes > 0]
+        sizes = sizes[sizes > 0]
+        prices = sells['price'].to_numpy(dtype=float)
+        reasons = sells['meta'].tolist() if 'meta' in sells.columns else [None] * len(sells)
+
+        orders = [
+            {
                 "ticker": ticker,
+                "action": "SELL",
+                "order_type": "MARKET",
+                "quantity": int(size),
+                "price": float(price),
+                "reason": reason
+            }
+            for ticker, size, price, reason in zip(sells['ticker'], sizes, prices, reasons)
+        ]
+        for o in orders:
+            # LOG VENDITA
+            self.logger.info(f"📉 SELLING {o['ticker']}: Qty {o['quantity']} @ {o['price']:.2f}")
+        return orders, float(np.sum(sizes * prices)), set(sells['ticker'])
+
+    def _buy_orders(self, signals_df: pd.DataFrame, total_equity: float, cash: float, held: set,
+                    fees: tuple = (0.0, 0.0)):
+        """FASE 2: ACQUISTI (consumano cassa virtuale)."""
+        buys = signals_df[signals_df['signal'] == 'BUY']
+        if buys.empty:
+            return []
+
+        tickers = buys['ticker'].to_numpy()
+        prices = buys['price'].to_numpy(dtype=float)
+        atrs = buys['atr'].to_numpy(dtype=float) if 'atr' in buys.columns else np.zeros(len(buys))
+
+        # --- POSITION SIZING ---
+        risk_budget = total_equity * self.risk_per_trade
+        stop_distances = atrs * self.stop_atr_multiplier
+        stop_prices = prices - stop_distances
+
+        # 1. Non comprare se ho già la posizione; 2. ATR valido; 3. Stop positivo
+        already_held = np.isin(tickers, list(held))
+        bad_atr = ~already_held & ~(atrs > 0)  # NaN incluso
+        bad_stop = ~already_held & ~bad_atr & (stop_prices <= 0)
+        valid = ~(already_held | bad_atr | bad_stop)
+        if bad_atr.any():
+            self.logger.warning(f"⚠️ SKIP BUY per ATR non valido: {tickers[bad_atr].tolist()}")
+        if bad_stop.any():
+            self.logger.warning(f"⚠️ SKIP BUY per Stop Price negativo: {tickers[bad_stop].tolist()}")
+
+        # Size = Rischio Euro / Rischio per Azione
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = np.where(valid, np.floor(risk_budget / stop_distances), 0).astype(np.int64)
+
+        # --- CASH CHECK ---
+        shares = self._fit_to_cash(shares, prices, cash, *fees)
+
+        # Se alla fine la size è 0, niente ordine
+        accepted = np.flatnonzero(shares >= 1)
+        metas = buys['meta'].tolist() if 'meta' in buys.columns else [{}] * len(buys)
+        orders = []
+        for i in accepted:
+            price, stop_distance = float(prices[i]), float(stop_distances[i])
+            orders.append({
+                "ticker": tickers[i],
                 "action": "BUY",
                 "order_type": "LIMIT",
-                "quantity": shares,
+                "quantity": int(shares[i]),
                 "price": price,
-                "stop_loss": stop_loss_price,
+                "stop_loss": float(stop_prices[i]),
                 "take_profit": price + (stop_distance * 2),
-                "atr_at_entry": atr,
-                "meta": row.get("meta", {})
+                "atr_at_entry": float(atrs[i]),
+                "meta": metas[i] if metas[i] is not None else {}
             })
 
-            simulated_cash -= cost
-
+        # LOG RIEPILOGO (niente log per riga: in backtest i candidati sono tutto l'universo)
+        self.logger.info(
+            f"✅ BUY: {len(orders)} ordini su {len(buys)} segnali "
+            f"(già in portafoglio: {int(already_held.sum())}, scartati: {int((bad_atr | bad_stop).sum())}, "
+            f"size nulla: {int(valid.sum()) - len(orders)})"
+        )
+        for o in orders:
+            self.logger.debug(f"BUY {o['ticker']}: {o['quantity']} shares @ {o['price']:.2f} (Stop: {o['stop_loss']:.2f})")
         return orders
-        
+
+    @staticmethod
+    def _fit_to_cash(shares: np.ndarray, prices: np.ndarray, cash: float,
+                     fixed_fee: float = 0.0, pct_fee: float = 0.0) -> np.ndarray:
+        """
+        Consuma la cassa nell'ordine dato: ogni ordine che non ci sta intero viene
+        ridotto a floor((cassa residua - fisso) / (prezzo * (1 + percentuale))).
+        Costo di un ordine = controvalore + commissioni (fisso + percentuale), come in
+        PortfolioManager.execute_orders. Equivale al loop sequenziale, ma con
+        un passaggio vettoriale (cumsum + searchsorted) per ogni ordine ridotto.
+
+        La cassa può solo scendere: gli ordini che non si possono permettere neanche
+        un'azione vengono azzerati in blocco e non rientrano nelle somme successive
+        (niente passaggio per ordine quando la cassa è finita).
+        """
+        shares = shares.copy()
+        unit_costs = prices * (1.0 + pct_fee)
+        costs = np.where(shares > 0, shares * unit_costs + fixed_fee, 0.0)
+        idx = np.flatnonzero(shares > 0)
+        while idx.size:
+            affordable = unit_costs[idx] + fixed_fee <= cash
+            shares[idx[~affordable]] = 0
+            idx = idx[affordable]
+            if not idx.size:
+                break
+            csum = np.cumsum(costs[idx])
+            # Ordini candidati che ci stanno interi
+            k = int(np.searchsorted(csum, cash, side='right'))
+            if k:
+                cash -= csum[k - 1]
+            if k >= idx.size:
+                break
+            # Il primo che sfora: ridotto alla cassa residua
+            j = idx[k]
+            shares[j] = max(int(np.floor((cash - fixed_fee) / unit_costs[j])), 0)
+            if shares[j]:
+                cash -= shares[j] * unit_costs[j] + fixed_fee
+            idx = idx[k + 1:]
+        return shares
+
     def check_intraday_stops(self, 
                              current_positions: Dict[str, Any], 
                              daily_prices: Dict[str, Dict[str, float]]) -> List[Dict[str, Any]]:
         """
         Controlla Stop Loss e Take Profit intraday.
         Gestisce il GAP RISK: se Open < Stop Loss, esce all'Open.
+        current_positions: {ticker: {"stop_loss", "take_profit", "quantity"}} (vedi position_exit_orders).
         """
-        orders = []
-        
-        for ticker, pos_data in current_positions.items():
-            stop_loss = pos_data.get('stop_loss')
-            take_profit = pos_data.get('take_profit')
-            qty = pos_data.get('quantity') # Assicurati che la chiave sia 'quantity' o 'size'
-            
-            # Se non abbiamo dati per questo ticker oggi, saltiamo
-            if ticker not in daily_prices:
-                continue
-            
-            # Estraiamo i prezzi di oggi
-            today_open = daily_prices[ticker]['open']
-            today_low = daily_prices[ticker]['low']
-            today_high = daily_prices[ticker]['high']
-            
-            # 1. LOGICA STOP LOSS (con GAP PROTECTION)
-            if stop_loss and today_low <= stop_loss:
-                # Se il mercato ha aperto GIÀ sotto lo stop (Gap Down), usciamo all'Open
-                # Altrimenti usciamo al prezzo di Stop
-                exit_price = stop_loss
-                reason = "STOP_LOSS"
-                
-                if today_open < stop_loss:
-                    exit_price = today_open
-                    reason = "STOP_LOSS_GAP"
-                    self.logger.warning(f"📉 GAP DOWN su {ticker}: Open {today_open} < SL {stop_loss}. Uscita all'Open.")
-                else:
-                    self.logger.info(f"🛑 STOP LOSS HIT per {ticker}: Low {today_low} <= SL {stop_loss}")
-
-                orders.append({
-                    "ticker": ticker,
-                    "action": "SELL",
-                    "reason": reason,
-                    "quantity": qty,
-                    "price": exit_price 
-                })
-                continue # Se scatta lo stop, non controlliamo il target
-                
-            # 2. LOGICA TAKE PROFIT
-            if take_profit and today_high >= take_profit:
-                # Anche qui ci potrebbe essere un Gap Up, ma per ora usciamo al TP
-                # (conservativo: se apre sopra, prendiamo comunque il TP)
-                exit_price = take_profit
-                if today_open > take_profit:
-                    exit_price = today_open # Bonus: Gap Up a nostro favore!
-                
-                self.logger.info(f"💰 TAKE PROFIT HIT per {ticker}: High {today_high} >= TP {take_profit}")
-                orders.append({
-                    "ticker": ticker,
-                    "action": "SELL",
-                    "reason": "TAKE_PROFIT",
-                    "quantity": qty,
-                    "price": exit_price
-                })
-                
-        return orders
\ No newline at end of file
+        tickers = list(current_positions)
+        return position_exit_orders(
+            tickers,
+            [current_positions[t].get('quantity') for t in tickers],
+            [current_positions[t].get('stop_loss') for t in tickers],
+            [current_positions[t].get('take_profit') for t in tickers],
+            pd.DataFrame.from_dict(daily_prices, orient='index'),
+        )
+
+
+# ---------------------------------------------------------------
+# Motore stop/target vettoriale (condiviso da backtest e daily run)
+# ---------------------------------------------------------------
+EXIT_STOP_LOSS = "STOP_LOSS"
+EXIT_STOP_LOSS_GAP = "STOP_LOSS_GAP"
+EXIT_TAKE_PROFIT = "TAKE_PROFIT"
+
+
+def intraday_exits(stop_loss: np.ndarray,
+                   take_profit: np.ndarray,
+                   open_: np.ndarray,
+                   high: np.ndarray,
+                   low: np.ndarray):
+    """
+    Uscite intraday per array allineati (una posizione per elemento).
+
+    - Stop Loss: Low <= SL. Se il mercato ha aperto GIÀ sotto lo stop (Gap Down)
+      si esce all'Open, altrimenti allo stop: min(Open, SL).
+    - Take Profit (solo se lo stop non è scattato): High >= TP, uscita a max(Open, TP)
+      (Gap Up a nostro favore).
+    Livelli mancanti (NaN) o non positivi non scattano mai.
+
+    Output: (mask uscite, prezzi di uscita (NaN dove non si esce), motivo ("" dove non si esce))
+    """
+    stop_loss = np.asarray(stop_loss, dtype=float)
+    take_profit = np.asarray(take_profit, dtype=float)
+    open_, high, low = (np.asarray(a, dtype=float) for a in (open_, high, low))
+
+    with np.errstate(invalid='ignore'):
+        sl_hit = (stop_loss > 0) & (low <= stop_loss)
+        tp_hit = ~sl_hit & (take_profit > 0) & (high >= take_profit)
+        gap = sl_hit & (open_ < stop_loss)
+
+    prices = np.where(sl_hit, np.minimum(open_, stop_loss),
+                      np.where(tp_hit, np.maximum(open_, take_profit), np.nan))
+    reasons = np.select([gap, sl_hit, tp_hit], [EXIT_STOP_LOSS_GAP, EXIT_STOP_LOSS, EXIT_TAKE_PROFIT], "")
+    return sl_hit | tp_hit, prices, reasons
+
+
+def _as_float_array(values) -> np.ndarray:
+    """Array float allineato; None (livello/quantità non impostati) -> NaN."""
+    return np.array(values, dtype=float)
+
+
+def position_exit_orders(tickers,
+                         quantities,
+                         stop_losses,
+                         take_profits,
+                         bars: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Ordini SELL per le posizioni che oggi toccano stop o target.
+    tickers/quantities/stop_losses/take_profits: array allineati (vedi PortfolioManager.get_position_arrays).
+    bars: barre del giorno, DataFrame indicizzato per ticker (univoco) con colonne open/high/low.
+    Le posizioni senza barra oggi vengono ignorate; quantità mancanti o non intere positive
+    vengono scartate con un warning.
+    """
+    tickers = np.asarray(tickers, dtype=object)
+    if not len(tickers) or bars is None or bars.empty:
+        return []
+
+    # Allineamento per etichetta: ticker senza barra -> NaN -> nessuna uscita
+    day = bars.reindex(tickers)
+    quantities = _as_float_array(quantities)
+    valid_qty = np.isfinite(quantities) & (quantities > 0) & (quantities == np.floor(quantities))
+    if not valid_qty.all():
+        _logger.warning(f"⚠️ Quantità non valide, posizioni ignorate: {tickers[~valid_qty].tolist()}")
+
+    mask, prices, reasons = intraday_exits(
+        _as_float_array(stop_losses),
+        _as_float_array(take_profits),
+        day['open'].to_numpy(dtype=float),
+        day['high'].to_numpy(dtype=float),
+        day['low'].to_numpy(dtype=float),
+    )
+    mask &= valid_qty
+
+    orders = [
+        {"ticker": t, "action": "SELL", "reason": r, "quantity": q, "price": p}
+        for t, r, q, p in zip(tickers[mask].tolist(), reasons[mask].tolist(),
+                              quantities[mask].astype(np.int64).tolist(), prices[mask].tolist())
+    ]
+    if orders:
+        _logger.info(f"🛑 Stop/target scattati: {[(o['ticker'], o['reason']) for o in orders]}")
+    return orders
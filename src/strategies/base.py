@@ -1,9 +1,13 @@
 # src/strategy_base.py
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Iterable, Iterator, List, Mapping, Tuple, Union
 import pandas as pd
 from src.logger import get_logger
 
+# Input delle strategie: dizionario {ticker: DataFrame} oppure flusso di coppie
+# (ticker, DataFrame), es. DatabaseManager.iter_ohlc_by_ticker
+OhlcInput = Union[Mapping[str, pd.DataFrame], Iterable[Tuple[str, pd.DataFrame]]]
+
 class StrategyBase(ABC):
     """
     Classe astratta per tutte le strategie.
@@ -14,13 +18,15 @@ class StrategyBase(ABC):
         self.logger = get_logger(f"Strategy_{name}")
 
     @abstractmethod
-    def compute(self, data_map: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    def compute(self, data_map: OhlcInput) -> pd.DataFrame:
         """
         Logica principale della strategia.
         
         Input:
             data_map: Dizionario { 'TICKER': pd.DataFrame(OHLCV) }
                       Il DataFrame contiene storico sufficiente per gli indicatori.
+                      In alternativa un iterabile di coppie (ticker, DataFrame): i ticker
+                      vengono elaborati uno alla volta, senza tenerli tutti in memoria.
         
         Output:
             pd.DataFrame con colonne: 
@@ -31,6 +37,13 @@ class StrategyBase(ABC):
         """
         pass
 
+    @staticmethod
+    def _iter_tickers(data_map: OhlcInput) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Coppie (ticker, DataFrame) sia da un dizionario sia da uno stream."""
+        if isinstance(data_map, Mapping):
+            return iter(data_map.items())
+        return iter(data_map)
+
     def _validate_data(self, df: pd.DataFrame) -> bool:
         """Utility per check veloci sui dati (es. non vuoto)."""
         if df.empty or len(df) < 5: # Minimo sindacale per calcoli
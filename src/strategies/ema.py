@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
-from typing import Dict
-from .base import StrategyBase
+from .base import StrategyBase, OhlcInput
 
 class StrategyEMA(StrategyBase):
     def __init__(self, short_window: int = 50, long_window: int = 200, atr_period: int = 14):
@@ -21,11 +20,13 @@ class StrategyEMA(StrategyBase):
         tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
         return tr.ewm(alpha=1.0/period, min_periods=period, adjust=False).mean()
 
-    def compute(self, data_map: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    def compute(self, data_map: OhlcInput) -> pd.DataFrame:
         signals_list = []
-        self.logger.info(f"Avvio strategia EMA (Vectorized) su {len(data_map)} ticker.")
+        self.logger.info(f"Avvio strategia EMA (Vectorized): short={self.short_window}, long={self.long_window}.")
 
-        for ticker, df in data_map.items():
+        n_tickers = 0
+        for ticker, df in self._iter_tickers(data_map):
+            n_tickers += 1
             if len(df) < self.long_window:
                 continue
 
@@ -59,6 +60,7 @@ class StrategyEMA(StrategyBase):
 
             signals_list.append(output)
 
+        self.logger.info(f"Strategia EMA: {len(signals_list)}/{n_tickers} ticker con storico sufficiente.")
         if not signals_list:
             return pd.DataFrame()
             
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
-from typing import Dict
-from .base import StrategyBase
+from .base import StrategyBase, OhlcInput
 
 class StrategyRSI(StrategyBase):
     def __init__(self, rsi_period: int = 14, rsi_lower: int = 30, rsi_upper: int = 70, atr_period: int = 14):
@@ -40,12 +39,12 @@ class StrategyRSI(StrategyBase):
         atr = tr.ewm(alpha=1/period, min_periods=period, adjust=False).mean()
         return atr
 
-    def compute(self, data_map: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    def compute(self, data_map: OhlcInput) -> pd.DataFrame:
         signals_list = []
         # Log dei parametri ricevuti (per debuggare la tua ipotesi sui parametri)
         self.logger.info(f"RSI Params: Period={self.rsi_period}, Lower={self.rsi_lower}, Upper={self.rsi_upper}")
 
-        for ticker, df in data_map.items():
+        for ticker, df in self._iter_tickers(data_map):
             if len(df) < self.rsi_period + 5:
                 continue
             
@@ -4,6 +4,14 @@ import numpy as np
 from src.database_manager import DatabaseManager
 
 
+@pytest.fixture(autouse=True)
+def isolated_local_caches(tmp_path, monkeypatch):
+    """Le cache locali (download, Universe) non devono mai leggere/scrivere in data/ durante i test."""
+    from config.config import config
+    monkeypatch.setattr(config, "DOWNLOAD_CACHE_DIR", tmp_path / "download_cache")
+    monkeypatch.setattr(config, "UNIVERSE_CACHE_PATH", tmp_path / "universe.json")
+
+
 # --- GENERATORE DATI STANDARD ---
 def generate_market_data(trend_type, length=300, start_price=100, volatility=0.02):
     """
@@ -0,0 +1,143 @@
+"""
+Sostituto locale di gspread per i test offline di DriveManager.
+
+Ogni spreadsheet è un file JSON (<root>/<sheet_id>.json: {tab: griglia di celle}),
+riletto e riscritto a ogni chiamata come farebbe il server. `calls` conta le
+chiamate "di rete" per metodo, così i test possono verificare i round-trip.
+"""
+import json
+import re
+from collections import Counter
+from pathlib import Path
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+DEFAULT_ROWS = 1000
+DEFAULT_COLS = 26
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: "FakeSpreadsheet", title: str):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        # Metadati della griglia: noti all'apertura, come nel vero Worksheet
+        self.row_count = len(self._grid())
+
+    def _grid(self) -> list:
+        return self.spreadsheet._load()[self.title]
+
+    def _save(self, grid: list):
+        tabs = self.spreadsheet._load()
+        tabs[self.title] = grid
+        self.spreadsheet._store(tabs)
+        self.row_count = len(grid)
+
+    def _call(self, name: str):
+        self.spreadsheet.client.calls[name] += 1
+
+    def get_all_values(self) -> list:
+        self._call("get_all_values")
+        rows = [list(r) for r in self._grid()]
+        while rows and not any(rows[-1]):
+            rows.pop()
+        width = max((max((i + 1 for i, v in enumerate(r) if v != ""), default=0) for r in rows), default=0)
+        return [r[:width] for r in rows]
+
+    def get_all_records(self) -> list:
+        values = self.get_all_values()
+        if not values:
+            return []
+        headers = values[0]
+        return [dict(zip(headers, row)) for row in values[1:]]
+
+    def clear(self):
+        self._call("clear")
+        self._save([[""] * len(r) for r in self._grid()])
+
+    def resize(self, rows: int):
+        self._call("resize")
+        grid = self._grid()
+        width = len(grid[0]) if grid else DEFAULT_COLS
+        self._save((grid + [[""] * width for _ in range(rows)])[:rows])
+
+    def update(self, values: list, range_name: str):
+        self._call("update")
+        start, end = (re.sub(r"^.*!", "", p) for p in range_name.split(":"))
+        (r0, c0), (r1, c1) = a1_to_rowcol(start), a1_to_rowcol(end)
+        if len(values) > r1 - r0 + 1 or any(len(r) > c1 - c0 + 1 for r in values):
+            raise ValueError("Requested writing within range, but tried to write outside it")
+        grid = self._grid()
+        if r1 > len(grid):
+            raise ValueError(f"Range ('{self.title}'!{range_name}) exceeds grid limits")
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                grid[r0 - 1 + i][c0 - 1 + j] = "" if value is None else value
+        self._save(grid)
+
+    def _append(self, rows: list):
+        grid = self._grid()
+        last = max((i + 1 for i, r in enumerate(grid) if any(r)), default=0)
+        width = len(grid[0]) if grid else DEFAULT_COLS
+        for i, row in enumerate(rows):
+            if last + i >= len(grid):
+                grid.append([""] * width)
+            grid[last + i][:len(row)] = row
+        self._save(grid)
+
+    def append_row(self, row: list):
+        self._call("append_row")
+        self._append([row])
+
+    def append_rows(self, rows: list):
+        self._call("append_rows")
+        self._append(rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: "FakeGspreadClient", sheet_id: str):
+        self.client = client
+        self.id = sheet_id
+        self.path = client.root / f"{sheet_id}.json"
+        if not self.path.exists():
+            self._store({"Sheet1": [[""] * DEFAULT_COLS for _ in range(DEFAULT_ROWS)]})
+
+    def _load(self) -> dict:
+        return json.loads(self.path.read_text())
+
+    def _store(self, tabs: dict):
+        self.path.write_text(json.dumps(tabs))
+
+    @property
+    def sheet1(self) -> FakeWorksheet:
+        return FakeWorksheet(self, next(iter(self._load())))
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.client.calls["worksheet"] += 1
+        if title not in self._load():
+            raise gspread.WorksheetNotFound(title)
+        return FakeWorksheet(self, title)
+
+    def add_worksheet(self, title: str, rows: int, cols: int) -> FakeWorksheet:
+        self.client.calls["add_worksheet"] += 1
+        tabs = self._load()
+        tabs[title] = [[""] * cols for _ in range(rows)]
+        self._store(tabs)
+        return FakeWorksheet(self, title)
+
+    def get_lastUpdateTime(self) -> str:
+        self.client.calls["get_lastUpdateTime"] += 1
+        return f"rev-{self.path.stat().st_mtime_ns}"
+
+
+class FakeGspreadClient:
+    """Da restituire al posto di gspread.authorize(...)."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.calls = Counter()
+
+    def open_by_key(self, sheet_id: str) -> FakeSpreadsheet:
+        self.calls["open_by_key"] += 1
+        return FakeSpreadsheet(self, sheet_id)
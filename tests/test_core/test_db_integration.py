@@ -76,4 +76,302 @@ def test_db_portfolio_persistence(test_db):
     assert loaded_port.iloc[0]["size"] == 5
     
     assert not loaded_cash.empty
-    assert float(loaded_cash.iloc[0]["cash"]) == 12345.67
\ No newline at end of file
+    assert float(loaded_cash.iloc[0]["cash"]) == 12345.67
+
+def test_async_db_portfolio_roundtrip(test_db):
+    """
+    AsyncDatabaseManager: salva e ricarica il portafoglio (load in pipeline).
+    Lo schema è preparato dalla fixture sincrona.
+    """
+    import asyncio
+    from src.async_database_manager import AsyncDatabaseManager
+
+    snapshot = {
+        "portfolio": pd.DataFrame([{
+            "ticker": "MSFT", "size": 3, "price": 300.0,
+            "stop_loss": 280.0, "profit_take": 340.0,
+            "updated_at": pd.Timestamp.now()
+        }]),
+        "cash": pd.DataFrame([{"cash": 5000.0, "currency": "EUR", "updated_at": pd.Timestamp.now()}]),
+        "trades": pd.DataFrame([{
+            "ticker": "MSFT", "size": 3, "price": 300.0, "action": "BUY", "date": pd.Timestamp.now()
+        }])
+    }
+
+    async def scenario():
+        async with AsyncDatabaseManager() as db:
+            await db.save_portfolio(snapshot)
+            return await db.load_portfolio()
+
+    loaded = asyncio.run(scenario())
+
+    assert loaded["portfolio"].iloc[0]["ticker"] == "MSFT"
+    assert float(loaded["cash"].iloc[0]["cash"]) == 5000.0
+    assert len(loaded["trades"]) == 1
+
+
+def test_async_db_ohlc_streams_by_ticker(test_db):
+    """AsyncDatabaseManager: OHLC letto a blocchi (anche più piccoli di un ticker), un ticker alla volta."""
+    import asyncio
+    from src.async_database_manager import AsyncDatabaseManager
+
+    today = date.today()
+    test_db.upsert_ohlc([
+        ("TEST_A", today - timedelta(days=2), 100, 110, 90, 105, 1000),
+        ("TEST_A", today - timedelta(days=1), 105, 115, 95, 110, 2000),
+        ("TEST_B", today - timedelta(days=2), 50, 55, 45, 52, 500),
+    ])
+
+    async def scenario():
+        async with AsyncDatabaseManager() as db:
+            return await db.get_ohlc_all_tickers(days=30, batch_size=1)
+
+    data_map = asyncio.run(scenario())
+
+    assert list(data_map) == ["TEST_A", "TEST_B"]
+    assert len(data_map["TEST_A"]) == 2
+    assert data_map["TEST_A"].index.tolist() == [0, 1]
+
+
+def test_db_trades_saved_once(test_db):
+    """Salvare due volte gli stessi trade (o lo storico ricaricato) non crea duplicati."""
+    trades = pd.DataFrame([{
+        "ticker": "AAPL", "size": 10, "price": 150.0, "action": "BUY", "date": pd.Timestamp.now()
+    }])
+    snapshot = {"portfolio": pd.DataFrame(), "cash": pd.DataFrame(), "trades": trades}
+
+    test_db.save_portfolio(snapshot)
+    test_db.save_portfolio(snapshot)  # Re-run
+
+    loaded = test_db.load_portfolio()["trades"]
+    assert len(loaded) == 1
+
+    # Lo storico ricaricato (con 'id') viene riconosciuto come già salvato
+    test_db.save_portfolio({"portfolio": pd.DataFrame(), "cash": pd.DataFrame(), "trades": loaded})
+    assert len(test_db.load_portfolio()["trades"]) == 1
+    assert test_db.load_portfolio(include_trades=False)["trades"].empty
+
+
+def test_db_save_portfolio_is_atomic(test_db):
+    """Un errore a metà salvataggio non deve lasciare cassa e posizioni disallineate."""
+    now = pd.Timestamp.now()
+    test_db.save_portfolio({
+        "portfolio": pd.DataFrame([{"ticker": "NVDA", "size": 5, "price": 400.0,
+                                    "stop_loss": 380.0, "profit_take": 450.0, "updated_at": now}]),
+        "cash": pd.DataFrame([{"cash": 1000.0, "currency": "EUR", "updated_at": now}]),
+        "trades": pd.DataFrame()
+    })
+
+    # Posizione chiusa + trade non valido: deve fallire tutto insieme
+    with pytest.raises(Exception):
+        test_db.save_portfolio({
+            "portfolio": pd.DataFrame(), "flat": True,
+            "cash": pd.DataFrame([{"cash": 3000.0, "currency": "EUR", "updated_at": now}]),
+            "trades": pd.DataFrame([{"ticker": "NVDA", "size": 5, "price": "not-a-price",
+                                     "action": "SELL", "date": now}])
+        })
+
+    loaded = test_db.load_portfolio()
+    assert float(loaded["cash"].iloc[0]["cash"]) == 1000.0
+    assert loaded["portfolio"].iloc[0]["ticker"] == "NVDA"
+
+    # Stesso salvataggio valido: la posizione chiusa sparisce dal DB
+    test_db.save_portfolio({
+        "portfolio": pd.DataFrame(), "flat": True,
+        "cash": pd.DataFrame([{"cash": 3000.0, "currency": "EUR", "updated_at": now}]),
+        "trades": pd.DataFrame([{"ticker": "NVDA", "size": 5, "price": 400.0, "action": "SELL", "date": now}])
+    })
+    loaded = test_db.load_portfolio()
+    assert loaded["portfolio"].empty
+    assert float(loaded["cash"].iloc[0]["cash"]) == 3000.0
+
+def test_ohlc_summary_incremental_refresh(test_db):
+    """Il refresh per ticker aggiorna solo i ticker indicati."""
+    yesterday = date.today() - timedelta(days=1)
+    test_db.upsert_ohlc([
+        ("TEST_A", yesterday - timedelta(days=1), 100, 110, 90, 105, 1000),
+        ("TEST_B", yesterday - timedelta(days=1), 50, 55, 45, 52, 500),
+    ])
+    test_db.refresh_ohlc_summary()
+
+    test_db.upsert_ohlc([("TEST_A", yesterday, 105, 115, 95, 110, 2000)])
+    test_db.refresh_ohlc_summary(["TEST_A"])
+
+    summary = test_db.get_ohlc_summary().set_index("ticker")
+    assert summary.loc["TEST_A", "count"] == 2
+    assert summary.loc["TEST_A", "last_date"] == yesterday
+    assert float(summary.loc["TEST_A", "last_close"]) == 110.0
+    assert summary.loc["TEST_B", "count"] == 1
+
+def test_trades_keyset_pagination(test_db):
+    """Le pagine coprono tutto lo storico senza buchi né duplicati, anche con date uguali."""
+    same_day = pd.Timestamp("2024-03-01 10:00")
+    trades = pd.DataFrame([
+        {"ticker": f"T{i}", "size": 1, "price": 10.0 + i, "action": "BUY" if i % 2 else "SELL",
+         "date": same_day if i < 3 else same_day + pd.Timedelta(days=i)}
+        for i in range(7)
+    ])
+    test_db.save_portfolio({"trades": trades})
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = test_db.get_trades_page(limit=3, cursor=cursor)
+        seen.extend(page["id"].tolist())
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 7
+
+    buys, _ = test_db.get_trades_page(limit=10, action="BUY", start_date="2024-03-01", end_date="2024-03-06")
+    assert set(buys["ticker"]) == {"T1", "T3", "T5"}
+
+def test_equity_history_one_row_per_day(test_db):
+    """La riga giornaliera viene salvata con lo snapshot e sovrascritta se il run si ripete."""
+    record = {"date": date(2024, 3, 1), "cash": 9000.0, "invested": 1000.0, "equity": 10000.0,
+              "positions": {"AAPL": {"size": 10, "price": 100.0}}}
+    test_db.save_portfolio({"equity": record})
+    test_db.save_portfolio({"equity": {**record, "invested": 1200.0, "equity": 10200.0}})
+    test_db.save_portfolio({"equity": {**record, "date": date(2024, 3, 4), "equity": 9900.0}})
+
+    history = test_db.get_equity_history()
+    assert history["equity"].tolist() == [10200.0, 9900.0]
+    assert history.iloc[0]["positions"]["AAPL"]["size"] == 10
+
+    only_last = test_db.get_equity_history(start_date="2024-03-02")
+    assert len(only_last) == 1
+
+def test_writes_notify_listeners(test_db):
+    """Ogni scrittura committata notifica il topic corrispondente."""
+    import threading
+    import time
+    from src.database_manager import NOTIFY_OHLC, NOTIFY_PORTFOLIO
+
+    # listen() è bloccante: lo consumiamo in un thread finché non scade il timeout
+    received = []
+    listener = threading.Thread(target=lambda: received.extend(test_db.listen(timeout=2)))
+    listener.start()
+    time.sleep(0.5)
+
+    test_db.upsert_ohlc([("TEST_A", date.today(), 1, 1, 1, 1, 1)])
+    test_db.save_portfolio({"cash": pd.DataFrame([{"cash": 100.0, "currency": "EUR", "updated_at": pd.Timestamp.now()}])})
+    listener.join()
+
+    assert received == [NOTIFY_OHLC, NOTIFY_PORTFOLIO]
+
+def test_upsert_ohlc_skips_unchanged_rows(test_db):
+    """Il refetch di righe identiche non le riscrive; i duplicati nel batch non fanno fallire l'upsert."""
+    d1, d2 = date(2024, 3, 1), date(2024, 3, 4)
+    first = test_db.upsert_ohlc([
+        ("TEST_A", d1, 100, 110, 90, 105, 1000),
+        ("TEST_A", d2, 105, 115, 95, 110, 2000),
+    ])
+    assert (first["inserted"], first["updated"], first["unchanged"]) == (2, 0, 0)
+
+    again = test_db.upsert_ohlc([
+        ("TEST_A", d1, 100, 110, 90, 105, 1000),
+        ("TEST_A", d2, 105, 115, 95, 110, 2000),
+        ("TEST_A", d2, 105, 115, 95, 111, 2500),  # correzione dell'ultima candela
+        ("TEST_B", d2, 50, 55, 45, 52, 500),
+    ])
+    assert (again["inserted"], again["updated"], again["unchanged"]) == (1, 1, 1)
+    assert again["tickers"] == ["TEST_A", "TEST_B"]
+
+    rows = test_db.get_ohlc(["TEST_A"], d2.isoformat(), d2.isoformat())
+    assert float(rows[0]["close"]) == 111.0
+
+def test_copy_ohlc_matches_upsert_semantics(test_db):
+    """Il writer COPY salta le righe invariate come upsert_ohlc."""
+    df = pd.DataFrame({
+        "ticker": ["TEST_A", "TEST_A", "TEST_B"],
+        "date": pd.to_datetime(["2024-03-01", "2024-03-04", "2024-03-04"]),
+        "open": [100.0, 105.0, 50.0], "high": [110.0, 115.0, 55.0],
+        "low": [90.0, 95.0, 45.0], "close": [105.0, 110.0, 52.0],
+        "volume": [1000, 2000, 500],
+    })
+    first = test_db.copy_ohlc(df)
+    assert (first["inserted"], first["updated"], first["unchanged"]) == (3, 0, 0)
+
+    df.loc[2, "close"] = 53.0
+    again = test_db.copy_ohlc(df)
+    assert (again["inserted"], again["updated"], again["unchanged"]) == (0, 1, 2)
+    assert again["tickers"] == ["TEST_B"]
+
+def test_ingest_checkpoints_follow_copy(test_db):
+    """I ticker scritti con copy_ohlc(checkpoint_job=...) risultano completati per il job."""
+    df = pd.DataFrame({
+        "ticker": ["TEST_A", "TEST_A"], "date": pd.to_datetime(["2024-03-01", "2024-03-04"]),
+        "open": [1.0, 1.0], "high": [1.0, 1.0], "low": [1.0, 1.0], "close": [1.0, 1.0], "volume": [1, 1],
+    })
+    # Prima voce di un ticker con altre voci ancora da scaricare: nessun checkpoint
+    test_db.copy_ohlc(df.iloc[:1], checkpoint_job="bootstrap", completed={})
+    assert test_db.get_ingest_checkpoints("bootstrap") == {}
+
+    test_db.copy_ohlc(df, checkpoint_job="bootstrap")
+    test_db.save_ingest_checkpoints("bootstrap", {"TEST_X": {"status": "failed", "rows": 0, "error": "timeout"}})
+
+    checkpoints = test_db.get_ingest_checkpoints("bootstrap")
+    assert checkpoints["TEST_A"]["status"] == "done"
+    assert checkpoints["TEST_A"]["rows"] == 2
+    assert checkpoints["TEST_X"]["error"] == "timeout"
+
+    test_db.clear_ingest_checkpoints("bootstrap")
+    assert test_db.get_ingest_checkpoints("bootstrap") == {}
+
+def test_checked_gaps_are_not_reported_again(test_db):
+    """Un buco già richiesto al provider senza ricevere dati non torna in find_ohlc_gaps."""
+    df = pd.DataFrame({
+        "ticker": ["TEST_A", "TEST_A"], "date": pd.to_datetime(["2024-03-01", "2024-03-12"]),
+        "open": [1.0, 1.0], "high": [1.0, 1.0], "low": [1.0, 1.0], "close": [1.0, 1.0], "volume": [1, 1],
+    })
+    test_db.copy_ohlc(df)
+    gaps = test_db.find_ohlc_gaps(["TEST_A"])
+    assert [(g["start"], g["end"]) for g in gaps] == [(date(2024, 3, 2), date(2024, 3, 12))]
+
+    test_db.mark_ohlc_gaps_checked(gaps)
+    test_db.mark_ohlc_gaps_checked(gaps)  # rieseguire non duplica
+    assert test_db.find_ohlc_gaps(["TEST_A"]) == []
+
+def test_pending_orders_filled_with_portfolio(test_db):
+    """Gli ordini eseguiti passano a FILLED nella transazione del portafoglio, una volta sola."""
+    ids = test_db.add_pending_orders([
+        {"action": "BUY", "ticker": "aapl", "quantity": "10", "price": "150,5", "meta": {"src": "test"}},
+        {"action": "BUY", "ticker": "MSFT", "quantity": 5, "price": 300.0},
+    ])
+    pending = test_db.get_pending_orders()
+    assert ids == [o["id"] for o in pending]
+    assert [(o["ticker"], o["quantity"], o["price"]) for o in pending] == [("AAPL", 10, 150.5), ("MSFT", 5, 300.0)]
+    assert pending[0]["meta"] == {"src": "test"}
+
+    fill = [{"id": pending[0]["id"], "price": 149.0}]
+    test_db.save_portfolio({"filled_orders": fill})
+    test_db.save_portfolio({"filled_orders": fill})  # rerun: nessun effetto
+    assert [o["ticker"] for o in test_db.get_pending_orders()] == ["MSFT"]
+    assert test_db.get_pending_orders(tickers=["AAPL"]) == []
+
+    # L'import dallo Sheet avviene solo su tabella mai usata
+    assert test_db.import_pending_orders([{"ticker": "NVDA", "quantity": 1, "price": 1.0}]) == 0
+
+def test_portfolio_state_as_of_date(test_db):
+    """Lo stato a una data passata si ricostruisce da snapshot + coda di eventi; risalvare non duplica."""
+    from datetime import datetime
+    from src.portfolio_manager import PortfolioManager
+
+    pm = PortfolioManager()
+    pm.update_cash(10000.0)
+    pm.execute_orders([{"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0}])
+    snapshot = pm.get_snapshot()
+    test_db.save_portfolio(snapshot)
+    test_db.save_portfolio(snapshot)
+    checkpoint = datetime.now()
+
+    pm.execute_orders([{"ticker": "AAPL", "action": "SELL", "quantity": 10, "price": 120.0}])
+    test_db.save_portfolio(pm.get_snapshot())
+
+    assert test_db.get_portfolio_state(as_of=checkpoint) == {
+        "cash": 9000.0, "currency": "EUR",
+        "positions": {"AAPL": {"size": 10, "stop_loss": None, "profit_take": None}},
+    }
+    assert test_db.get_portfolio_state() == pm.get_state()
+
+    # Prima del primo snapshot lo stato non è ricostruibile (dati legacy): errore, non uno stato vuoto
+    with pytest.raises(ValueError):
+        test_db.get_portfolio_state(as_of=datetime(2000, 1, 1))
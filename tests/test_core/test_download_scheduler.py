@@ -0,0 +1,77 @@
+from datetime import date
+from src.download_scheduler import DownloadScheduler
+
+START, END = date(2024, 6, 10), date(2024, 6, 14)
+
+
+class FakeProvider:
+    """Provider locale con risposte preconfezionate: `failures[ticker]` = fallimenti prima del successo."""
+
+    def __init__(self, failures=None, missing=(), broken_chunk=None):
+        self.failures = dict(failures or {})
+        self.missing = set(missing)
+        self.broken_chunk = broken_chunk
+        self.calls = []
+
+    def __call__(self, tickers, start, end):
+        self.calls.append(list(tickers))
+        if self.broken_chunk and self.broken_chunk in tickers:
+            self.broken_chunk = None
+            raise ConnectionError("rate limited")
+        rows = []
+        for t in tickers:
+            if t in self.missing:
+                continue
+            if self.failures.get(t, 0) > 0:
+                self.failures[t] -= 1
+                continue
+            rows.append((t, start, 1.0, 1.0, 1.0, 1.0, 100))
+        return rows
+
+
+def run(provider, tickers, **kwargs):
+    delays = []
+    scheduler = DownloadScheduler(provider, sleep=delays.append, **kwargs)
+    chunks = list(scheduler.run([{"start": START, "end": END, "tickers": tickers}]))
+    return scheduler, chunks, delays
+
+
+def test_scheduler_chunks_and_streams():
+    provider = FakeProvider()
+    scheduler, chunks, delays = run(provider, ["A", "B", "C", "D", "E"], chunk_size=2, max_workers=2)
+
+    assert sorted(len(c) for c in chunks) == [1, 2, 2]
+    assert sorted(map(tuple, provider.calls)) == [("A", "B"), ("C", "D"), ("E",)]
+    assert delays == []
+    assert scheduler.failed_tickers() == []
+
+
+def test_scheduler_retries_only_failed_tickers_with_backoff():
+    provider = FakeProvider(failures={"B": 2})
+    scheduler, chunks, delays = run(provider, ["A", "B", "C"], chunk_size=3, max_retries=2, backoff_seconds=1.0)
+
+    assert provider.calls == [["A", "B", "C"], ["B"], ["B"]]
+    assert delays == [1.0, 2.0]
+    assert scheduler.status["B"] == {"rows": 1, "attempts": 3, "error": None}
+
+
+def test_scheduler_reports_permanent_failures():
+    provider = FakeProvider(missing={"DELISTED"}, broken_chunk="C")
+    scheduler, chunks, _ = run(provider, ["A", "B", "C", "DELISTED"], chunk_size=2, max_retries=1)
+
+    assert scheduler.failed_tickers() == ["DELISTED"]
+    assert scheduler.status["C"]["attempts"] == 2
+    assert scheduler.status["DELISTED"]["error"] == "nessun dato ricevuto"
+    assert sum(len(c) for c in chunks) == 3
+
+
+def test_scheduler_bounds_chunks_in_memory():
+    """Con un consumatore lento non partono più di max_pending chunk alla volta."""
+    provider = FakeProvider()
+    scheduler = DownloadScheduler(provider, chunk_size=1, max_workers=2, max_pending=2, sleep=lambda _: None)
+    stream = scheduler.run([{"start": START, "end": END, "tickers": list("ABCDEFGH")}])
+
+    next(stream)
+    assert len(provider.calls) <= 3
+    assert sum(1 for _ in stream) == 7
+    assert len(provider.calls) == 8
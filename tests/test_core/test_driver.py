@@ -1,6 +1,10 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from src.drive_manager import DriveManager
+from src.drive_manager import DriveManager, is_new_sheet_order
+from src.order_mirror import SheetsOrderMirror
+from services.daily_run import sync_sheet_orders
+from config.config import config
+from tests.fake_gspread import FakeGspreadClient
 
 # Mockiamo la catena di autenticazione per non richiedere il file JSON reale
 @patch('src.drive_manager.Credentials.from_service_account_file')
@@ -66,4 +70,141 @@ def test_get_pending_orders_cleaning(mock_auth, mock_creds):
     
     assert valid_order['ticker'] == "AAPL"
     assert valid_order['quantity'] == 10        # Deve essere INT
-    assert valid_order['price'] == 150.50      # Deve essere FLOAT (virgola gestita)
\ No newline at end of file
+    assert valid_order['price'] == 150.50      # Deve essere FLOAT (virgola gestita)
+
+@patch('src.drive_manager.Credentials.from_service_account_file')
+@patch('src.drive_manager.gspread.authorize')
+def test_reads_are_cached(mock_auth, mock_creds):
+    """Handle e letture riusati nello stesso run; Universe invariato servito dalla copia locale."""
+    mock_client = mock_auth.return_value
+    mock_sheet = mock_client.open_by_key.return_value
+    mock_sheet.get_lastUpdateTime.return_value = "2024-06-10T08:00:00.000Z"
+    mock_sheet.sheet1.get_all_values.return_value = [["Ticker"], ["AAPL"], ["MSFT"]]
+    mock_sheet.worksheet.return_value.get_all_records.return_value = [
+        {"ticker": "AAPL", "quantity": "10", "price": "150", "action": "BUY"}
+    ]
+
+    dm = DriveManager()
+    assert dm.get_pending_orders() == dm.get_pending_orders()
+    assert dm.get_universe_tickers() == ["AAPL", "MSFT"]
+    assert mock_client.open_by_key.call_count == 1  # stesso ID per entrambi i fogli nel mock
+    assert mock_sheet.worksheet.call_count == 1
+    assert mock_sheet.worksheet.return_value.get_all_records.call_count == 1
+
+    # Run successivo, Sheet non modificato: nessuna lettura delle celle
+    assert DriveManager().get_universe_tickers() == ["AAPL", "MSFT"]
+    assert mock_sheet.sheet1.get_all_values.call_count == 1
+
+    # Sheet modificato: si rilegge
+    mock_sheet.get_lastUpdateTime.return_value = "2024-06-11T08:00:00.000Z"
+    mock_sheet.sheet1.get_all_values.return_value = [["Ticker"], ["NVDA"]]
+    assert DriveManager().get_universe_tickers() == ["NVDA"]
+
+@patch('src.drive_manager.Credentials.from_service_account_file')
+@patch('src.drive_manager.gspread.authorize')
+def test_save_pending_orders_single_write(mock_auth, mock_creds, tmp_path):
+    """Una sola scrittura per salvataggio; le righe della lista precedente vengono svuotate."""
+    client = FakeGspreadClient(tmp_path / "sheets")
+    mock_auth.return_value = client
+    orders = [
+        {"action": "BUY", "ticker": t, "quantity": 1, "price": 10.0, "meta": {"a": 1}}
+        for t in ("AAPL", "MSFT", "NVDA")
+    ]
+
+    dm = DriveManager()
+    dm.save_pending_orders(orders)
+    assert client.calls["update"] == 1
+    assert client.calls["clear"] == client.calls["append_row"] == client.calls["append_rows"] == 0
+
+    # Istanza nuova (altezza precedente ignota): la lista più corta copre tutta la griglia
+    DriveManager().save_pending_orders(orders[:1])
+    assert client.calls["update"] == 2
+
+    saved = DriveManager().get_pending_orders()
+    assert [o["ticker"] for o in saved] == ["AAPL"]
+    assert saved[0]["meta"] == "{'a': 1}"
+
+    # Più righe della griglia del tab: resize + scrittura
+    many = [dict(orders[0], ticker=f"T{i}") for i in range(120)]
+    dm.save_pending_orders(many)
+    assert len(DriveManager().get_pending_orders()) == 120
+
+def test_sheets_order_mirror_writes_latest_state():
+    """Il mirror scrive in background l'ultimo stato pubblicato; gli errori non si propagano."""
+    drive = MagicMock()
+    mirror = SheetsOrderMirror(lambda: drive)
+    mirror.publish([{"ticker": "AAPL"}])
+    mirror.publish([{"ticker": "MSFT"}])
+    assert mirror.close(timeout=5)
+    assert drive.save_pending_orders.call_args.args[0] == [{"ticker": "MSFT"}]
+
+    broken = SheetsOrderMirror(MagicMock(side_effect=RuntimeError("quota")))
+    broken.publish([])
+    assert broken.close(timeout=5)
+
+@patch('src.drive_manager.Credentials.from_service_account_file')
+@patch('src.drive_manager.gspread.authorize')
+def test_mirror_keeps_orders_added_on_sheet(mock_auth, mock_creds, tmp_path):
+    """Le righe senza id (ordini inseriti a mano) sopravvivono alla copia dal DB finché non vengono importate."""
+    mock_auth.return_value = FakeGspreadClient(tmp_path / "sheets")
+    db_orders = [{"id": 1, "action": "BUY", "ticker": "AAPL", "quantity": 10, "price": 150.0}]
+    DriveManager().save_pending_orders(db_orders)
+
+    # L'utente aggiunge una riga sullo Sheet (senza id)
+    sheet = DriveManager()._get_worksheet(config.REPORT_SHEET_ID, "Orders")
+    sheet.update([["", "BUY", "msft", 5, "300,5"]], "A3:E3")
+
+    # Il DB esegue AAPL: la copia la rimuove ma conserva la riga nuova
+    DriveManager().save_pending_orders([], keep_new_rows=True)
+    rows = DriveManager().get_pending_orders()
+    assert [(r["ticker"], is_new_sheet_order(r)) for r in rows] == [("msft", True)]
+
+    # Dopo l'import la riga torna con l'id del DB, senza duplicati
+    DriveManager().save_pending_orders([{"id": 2, "action": "BUY", "ticker": "MSFT", "quantity": 5, "price": 300.5}],
+                                       keep_new_rows=True)
+    rows = DriveManager().get_pending_orders()
+    assert [(r["ticker"], r["id"]) for r in rows] == [("MSFT", 2)]
+
+class _OrderBook:
+    """pending_orders in memoria (stessa interfaccia di DatabaseManager usata da sync_sheet_orders)."""
+
+    def __init__(self):
+        self.orders = []
+
+    def get_pending_orders(self):
+        return [dict(o) for o in self.orders if o["status"] == "PENDING"]
+
+    def add_pending_orders(self, orders):
+        ids = []
+        for o in orders:
+            ids.append(len(self.orders) + 1)
+            self.orders.append({**o, "ticker": o["ticker"].upper(), "id": ids[-1], "status": "PENDING"})
+        return ids
+
+    def fill(self, order_id):
+        self.orders[order_id - 1]["status"] = "FILLED"
+
+@patch('src.drive_manager.Credentials.from_service_account_file')
+@patch('src.drive_manager.gspread.authorize')
+def test_sheet_order_imported_and_filled_is_not_reimported(mock_auth, mock_creds, tmp_path):
+    """Ordine inserito sullo Sheet, importato ed eseguito nello stesso run: il run successivo non lo reimporta."""
+    mock_auth.return_value = FakeGspreadClient(tmp_path / "sheets")
+    DriveManager().save_pending_orders([])
+    sheet = DriveManager()._get_worksheet(config.REPORT_SHEET_ID, "Orders")
+    sheet.update([["", "BUY", "MSFT", 5, "300,5"]], "A2:E2")
+
+    db = _OrderBook()
+    mirror = SheetsOrderMirror(DriveManager)
+    imported = sync_sheet_orders(db, DriveManager().get_pending_orders())
+    assert [(o["ticker"], o["id"]) for o in imported] == [("MSFT", 1)]
+    mirror.publish(db.get_pending_orders(), imported)
+
+    # Eseguito nello stesso run: la copia successiva (anche fusa con la prima) non lo contiene
+    db.fill(1)
+    mirror.publish(db.get_pending_orders(), imported)
+    assert mirror.close(timeout=5)
+    assert DriveManager().get_pending_orders() == []
+
+    # Run successivo
+    assert sync_sheet_orders(db, DriveManager().get_pending_orders()) == []
+    assert len(db.orders) == 1
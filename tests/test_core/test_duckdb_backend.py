@@ -0,0 +1,119 @@
+import pytest
+import pandas as pd
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock
+from config.config import config
+from src.database_manager import DatabaseManager
+from src.duckdb_backend import connect_duckdb, sync_from_postgres
+
+
+@pytest.fixture
+def research_db(tmp_path, monkeypatch):
+    """DB DuckDB popolato da un finto Postgres (stesso formato dict_row / Decimal)."""
+    path = tmp_path / "research.duckdb"
+    monkeypatch.setattr(config, "RESEARCH_DB_PATH", path)
+
+    yesterday = date.today() - timedelta(days=1)
+    pg = MagicMock()
+    pg.get_ohlc_since.return_value = [
+        {"ticker": "TEST_A", "date": yesterday - timedelta(days=1), "open": Decimal("100"), "high": Decimal("110"),
+         "low": Decimal("90"), "close": Decimal("105"), "volume": 1000},
+        {"ticker": "TEST_A", "date": yesterday, "open": Decimal("105"), "high": Decimal("115"),
+         "low": Decimal("95"), "close": Decimal("110"), "volume": 2000},
+        {"ticker": "TEST_B", "date": yesterday, "open": Decimal("50"), "high": Decimal("55"),
+         "low": Decimal("45"), "close": Decimal("52"), "volume": 500},
+    ]
+    pg.load_portfolio.return_value = {
+        "portfolio": pd.DataFrame([{"ticker": "NVDA", "stop_loss": Decimal("380"), "profit_take": Decimal("450"),
+                                    "size": 5, "price": Decimal("400"), "updated_at": pd.Timestamp.now()}]),
+        "cash": pd.DataFrame([{"cash": Decimal("12345.67"), "currency": "EUR", "updated_at": pd.Timestamp.now()}]),
+        "trades": pd.DataFrame(),
+    }
+    pg.get_equity_history.return_value = pd.DataFrame([
+        {"date": pd.Timestamp(yesterday), "cash": 12345.67, "invested": 2000.0, "equity": 14345.67,
+         "positions": {"NVDA": {"size": 5, "price": 400.0}}},
+    ])
+
+    conn = connect_duckdb(path, read_only=False)
+    assert sync_from_postgres(pg, conn) == 3
+    conn.close()
+    return path
+
+def test_duckdb_backend_reads(research_db):
+    """Le letture del DatabaseManager funzionano sul file embedded."""
+    db = DatabaseManager(backend="duckdb")
+
+    rows = db.get_ohlc(["TEST_A"], (date.today() - timedelta(days=7)).isoformat(), date.today().isoformat())
+    assert len(rows) == 2
+    assert rows[0]["ticker"] == "TEST_A"
+    assert rows[0]["close"] == 105.0
+
+    data_map = db.get_ohlc_all_tickers(days=30)
+    assert set(data_map.keys()) == {"TEST_A", "TEST_B"}
+
+    loaded = db.load_portfolio()
+    assert loaded["portfolio"].iloc[0]["ticker"] == "NVDA"
+    assert float(loaded["cash"].iloc[0]["cash"]) == 12345.67
+    assert loaded["trades"].empty
+
+    # Nessun NOTIFY sul DB di ricerca: listen() termina subito invece di sollevare
+    assert not db.supports_notify
+    assert list(db.listen()) == []
+    db.close()
+
+def test_duckdb_backend_missing_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RESEARCH_DB_PATH", tmp_path / "missing.duckdb")
+    with pytest.raises(FileNotFoundError):
+        DatabaseManager(backend="duckdb")
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="non supportato"):
+        DatabaseManager(backend="oracle")
+
+def test_stream_by_ticker_across_batches(research_db):
+    """Lo streaming ricompone lo storico di ogni ticker anche se spezzato tra più blocchi."""
+    db = DatabaseManager(backend="duckdb")
+
+    batches = list(db.iter_ohlc(batch_size=2))
+    assert [len(b) for b in batches] == [2, 1]
+    assert batches[0]["close"].dtype == float
+
+    streamed = list(db.iter_ohlc_by_ticker(batch_size=1))
+    assert [t for t, _ in streamed] == ["TEST_A", "TEST_B"]
+    assert len(streamed[0][1]) == 2
+
+    only_b = list(db.iter_ohlc_by_ticker(tickers=["TEST_B"]))
+    assert [t for t, _ in only_b] == ["TEST_B"]
+    db.close()
+
+def test_duckdb_summaries(research_db):
+    """Summary pre-aggregati: una riga per ticker e KPI del portafoglio dal DB."""
+    db = DatabaseManager(backend="duckdb")
+
+    summary = db.get_ohlc_summary()
+    assert summary["ticker"].tolist() == ["TEST_A", "TEST_B"]
+    assert summary["count"].tolist() == [2, 1]
+    assert summary.iloc[0]["last_close"] == 110.0
+
+    kpi = db.get_portfolio_summary()
+    assert kpi["positions"] == 1
+    assert kpi["invested"] == 2000.0
+    assert kpi["equity"] == pytest.approx(14345.67)
+
+    history = db.get_equity_history()
+    assert history["equity"].tolist() == [pytest.approx(14345.67)]
+    db.close()
+
+def test_duckdb_high_water_marks_and_gaps(research_db):
+    """High-water mark per ticker (None se assente) e nessun buco su candele consecutive."""
+    db = DatabaseManager(backend="duckdb")
+    yesterday = date.today() - timedelta(days=1)
+
+    hwm = db.get_ohlc_high_water_marks(["TEST_A", "NEW"])
+    assert hwm == {"TEST_A": yesterday, "NEW": None}
+    assert db.find_ohlc_gaps(["TEST_A"]) == []
+    # Soglia 0: anche un giorno di distanza conta come buco
+    gaps = db.find_ohlc_gaps(["TEST_A"], min_gap_days=0)
+    assert [(g["ticker"], g["start"], g["end"]) for g in gaps] == [("TEST_A", yesterday, yesterday)]
+    db.close()
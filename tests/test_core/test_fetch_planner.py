@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+from src.fetch_planner import plan_fetches
+
+TODAY = date(2024, 6, 14)
+
+
+def test_plan_groups_tickers_by_missing_range():
+    """Ticker aggiornati in un download quasi vuoto, ticker nuovi con backfill completo."""
+    hwm = {
+        "AAPL": TODAY - timedelta(days=1),
+        "MSFT": TODAY - timedelta(days=3),   # un weekend indietro: stesso download
+        "NVDA": None,                        # appena aggiunto all'Universe
+    }
+    plan = plan_fetches(["AAPL", "MSFT", "NVDA"], hwm, end_date=TODAY, history_days=365)
+
+    assert plan == [
+        {"start": TODAY - timedelta(days=365), "end": TODAY, "tickers": ["NVDA"]},
+        {"start": TODAY - timedelta(days=3), "end": TODAY, "tickers": ["AAPL", "MSFT"]},
+    ]
+
+
+def test_plan_skips_up_to_date_and_adds_holes():
+    hwm = {"AAPL": TODAY, "MSFT": TODAY - timedelta(days=1)}
+    holes = [
+        {"ticker": "MSFT", "start": date(2024, 2, 1), "end": date(2024, 2, 20)},
+        {"ticker": "AAPL", "start": date(2024, 2, 1), "end": date(2024, 2, 20)},
+    ]
+    plan = plan_fetches(["AAPL", "MSFT"], hwm, end_date=TODAY, overlap_days=0, holes=holes)
+
+    assert plan == [
+        {"start": date(2024, 2, 1), "end": date(2024, 2, 20), "tickers": ["AAPL", "MSFT"]},
+    ]
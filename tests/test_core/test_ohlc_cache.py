@@ -0,0 +1,54 @@
+import pytest
+from datetime import date, timedelta
+from unittest.mock import MagicMock
+from src.ohlc_cache import OhlcCache
+
+
+def make_rows(ticker, days, close=100.0):
+    """Righe nel formato restituito da DatabaseManager (dict_row)."""
+    today = date.today()
+    return [
+        {"ticker": ticker, "date": today - timedelta(days=d), "open": close, "high": close + 1,
+         "low": close - 1, "close": close, "volume": 1000}
+        for d in range(days, 0, -1)
+    ]
+
+@pytest.fixture
+def cache(tmp_path):
+    return OhlcCache(path=tmp_path / "ohlc.arrow", overlap_days=2)
+
+def test_cache_first_sync_and_load(cache):
+    """Primo sync: la cache è vuota, quindi nessun high-water mark e storico completo."""
+    db = MagicMock()
+    db.get_ohlc_since.return_value = make_rows("AAA", 10) + make_rows("BBB", 5)
+
+    assert cache.sync(db) == 15
+    db.get_ohlc_since.assert_called_once_with({}, overlap_days=2)
+
+    data_map = cache.get_ohlc_all_tickers(days=365)
+    assert set(data_map.keys()) == {"AAA", "BBB"}
+    assert len(data_map["AAA"]) == 10
+    assert data_map["AAA"]["close"].dtype == float
+
+def test_cache_incremental_sync_replaces_overlap(cache):
+    """Il secondo sync passa gli high-water mark e sovrascrive la finestra di overlap."""
+    db = MagicMock()
+    db.get_ohlc_since.return_value = make_rows("AAA", 10)
+    cache.sync(db)
+
+    hwm = cache.high_water_marks()
+    assert hwm == {"AAA": date.today() - timedelta(days=1)}
+
+    # Il DB restituisce le ultime 2 candele (overlap) con close rivisto
+    db.get_ohlc_since.return_value = make_rows("AAA", 2, close=200.0)
+    cache.sync(db)
+    db.get_ohlc_since.assert_called_with(hwm, overlap_days=2)
+
+    df = cache.get_ohlc_all_tickers(days=365)["AAA"]
+    assert len(df) == 10  # Nessun duplicato
+    assert df["close"].tolist()[-2:] == [200.0, 200.0]
+    assert df["close"].tolist()[0] == 100.0
+
+def test_cache_missing_file(cache):
+    assert cache.get_ohlc_all_tickers() == {}
+    assert cache.high_water_marks() == {}
@@ -1,5 +1,11 @@
 import pytest
-from src.portfolio_manager import PortfolioManager
+import pandas as pd
+from src.portfolio_manager import PortfolioManager, FeeModel, ORDER_FILLED, ORDER_REJECTED
+from src.portfolio_events import replay
+from src.database_manager import (
+    portfolio_save_statements, trades_to_params,
+    SQL_UPSERT_PORTFOLIO, SQL_INSERT_TRADES, SQL_INSERT_PORTFOLIO_EVENT, SQL_NOTIFY, SQL_DELETE_CLOSED_POSITIONS,
+)
 
 @pytest.fixture
 def pm():
@@ -58,4 +64,141 @@ def test_portfolio_mark_to_market(pm):
     
     # Equity deve salire
     # Cash (9000) + Asset (10 * 120 = 1200) = 10200
-    assert pm.get_total_equity() == 10200.0
\ No newline at end of file
+    assert pm.get_total_equity() == 10200.0
+
+def test_portfolio_snapshot_only_new_trades(pm):
+    """Lo snapshot deve contenere solo i trade successivi al caricamento dal DB."""
+    history = pd.DataFrame([
+        {"id": 1, "ticker": "MSFT", "size": 5, "price": 300.0, "action": "BUY", "date": pd.Timestamp("2024-01-02")},
+        {"id": 2, "ticker": "MSFT", "size": 5, "price": 320.0, "action": "SELL", "date": pd.Timestamp("2024-02-02")},
+    ])
+    pm.load_from_db({"portfolio": pd.DataFrame(), "cash": pd.DataFrame(), "trades": history})
+
+    pm.execute_order({"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0})
+
+    new_trades = pm.get_snapshot()["trades"]
+    assert len(new_trades) == 1
+    assert new_trades.iloc[0]["ticker"] == "AAPL"
+    # Lo storico in memoria resta completo
+    assert len(pm.df_trades) == 3
+
+def test_portfolio_equity_record(pm):
+    """La riga di storico equity valorizza cassa e posizioni ai prezzi correnti."""
+    pm.execute_order({"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0})
+    pm.update_market_prices({"AAPL": 120.0})
+
+    record = pm.get_equity_record()
+    assert record["cash"] == 9000.0
+    assert record["invested"] == 1200.0
+    assert record["equity"] == 10200.0
+    assert record["positions"] == {"AAPL": {"size": 10, "price": 120.0}}
+
+def test_portfolio_positions_are_keyed_records(pm):
+    """Posizioni come record per ticker; i DataFrame sono solo viste materializzate."""
+    pm.execute_order({"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0, "stop_loss": 90.0})
+    pm.execute_order({"ticker": "AAPL", "action": "SELL", "quantity": 4, "price": 110.0})
+
+    pos = pm.positions["AAPL"]
+    assert not hasattr(pos, "__dict__")
+    assert (pos.size, pos.price, pos.stop_loss) == (6, 110.0, 90.0)
+    assert pm.get_position_sizes() == {"AAPL": 6}
+
+    # Le viste non alterano lo stato interno
+    view = pm.df_portfolio
+    view.loc[0, "size"] = 999
+    assert pm.positions["AAPL"].size == 6
+    assert pm.get_positions_summary()[["ticker", "size"]].values.tolist() == [["AAPL", 6]]
+    assert pm.get_trades_history(limit=1).iloc[0]["action"] == "SELL"
+
+def test_execute_orders_batch_with_fees(pm):
+    """Batch: commissioni applicate, ordini non eseguibili rifiutati con motivo, stato aggiornato una volta."""
+    fee_model = FeeModel.from_config({"fixed_euro": 1.0, "percentage": 0.01})
+    results = pm.execute_orders([
+        {"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0, "stop_loss": 90.0},
+        {"ticker": "MSFT", "action": "SELL", "quantity": 5, "price": 300.0},   # nessuna posizione
+        {"ticker": "NVDA", "action": "BUY", "quantity": 100, "price": 100.0},  # cassa insufficiente
+        {"ticker": "AAPL", "action": "SELL", "quantity": 4, "price": 110.0},
+    ], fee_model)
+
+    assert [r["status"] for r in results] == [ORDER_FILLED, ORDER_REJECTED, ORDER_REJECTED, ORDER_FILLED]
+    assert results[1]["reason"] == "nessuna posizione da vendere"
+    assert results[2]["reason"] == "cassa insufficiente"
+    assert results[0]["commission"] == pytest.approx(11.0)
+    assert results[3]["commission"] == pytest.approx(5.4)
+
+    # 10000 - 1000 - 11 + 440 - 5.4
+    assert pm.cash == pytest.approx(9423.6)
+    assert pm.get_position_sizes() == {"AAPL": 6}
+    assert pm.positions["AAPL"].stop_loss == 90.0
+    assert pm.get_new_trades()["action"].tolist() == ["BUY", "SELL"]
+
+def test_execute_orders_sell_beyond_position_closes_it(pm):
+    """Una SELL oltre la size chiude la posizione: quantità e controvalore ridotti alla size."""
+    pm.execute_orders([{"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0}])
+    results = pm.execute_orders([{"ticker": "AAPL", "action": "SELL", "quantity": 15, "price": 110.0}])
+
+    assert results[0]["status"] == ORDER_FILLED
+    assert results[0]["quantity"] == 10
+    assert "AAPL" not in pm.positions
+    assert pm.cash == pytest.approx(10100.0)
+
+def test_execute_orders_without_cash_check(pm):
+    """check_cash=False (ordini già eseguiti dal broker): la BUY si registra anche oltre la cassa."""
+    order = {"ticker": "NVDA", "action": "BUY", "quantity": 200, "price": 100.0}
+    assert pm.execute_orders([order])[0]["reason"] == "cassa insufficiente"
+
+    result = pm.execute_orders([order], check_cash=False)[0]
+    assert result["status"] == ORDER_FILLED
+    assert pm.cash == pytest.approx(-10000.0)
+    assert pm.get_position_sizes() == {"NVDA": 200}
+
+def test_portfolio_events_replay_to_state(pm):
+    """Il replay degli eventi (da zero o da uno snapshot intermedio) ricostruisce lo stato corrente."""
+    fee_model = FeeModel(fixed=1.0)
+    pm.execute_orders([{"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0, "stop_loss": 90.0}], fee_model)
+    middle = pm.get_state()
+    n_middle = len(pm.get_new_events())
+    pm.update_position("AAPL", 10, 105.0, stop_loss=95.0)  # stop alzato a mano
+    pm.execute_orders([{"ticker": "AAPL", "action": "SELL", "quantity": 4, "price": 110.0},
+                       {"ticker": "MSFT", "action": "BUY", "quantity": 2, "price": 300.0}], fee_model)
+
+    events = pm.get_new_events()
+    assert [e["kind"] for e in events] == ["CASH", "FILL", "POSITION", "FILL", "FILL"]
+    assert len({e["uid"] for e in events}) == len(events)
+    assert replay(None, events) == pm.get_state()
+    assert replay(middle, events[n_middle:]) == pm.get_state()
+    assert pm.get_state()["positions"]["AAPL"] == {"size": 6, "stop_loss": 95.0, "profit_take": None}
+
+def test_snapshot_to_save_statements(pm):
+    """Lo snapshot diventa la stessa lista di statement per il DB sincrono e asincrono."""
+    pm.execute_orders([{"ticker": "AAPL", "action": "BUY", "quantity": 10, "price": 100.0}])
+
+    statements = portfolio_save_statements(pm.get_snapshot())
+    sqls = [sql for sql, _, _ in statements]
+    assert sqls[0] == SQL_UPSERT_PORTFOLIO and statements[0][2]
+    assert SQL_INSERT_TRADES in sqls and SQL_INSERT_PORTFOLIO_EVENT in sqls
+    assert sqls[-1] == SQL_NOTIFY
+
+    # Snapshot vuoto: solo la notifica
+    assert [sql for sql, _, _ in portfolio_save_statements({})] == [SQL_NOTIFY]
+
+def test_identical_fills_keep_distinct_trade_keys(pm):
+    """Due fill identici nello stesso giorno restano due trade (chiavi diverse sul DB)."""
+    fill = {"ticker": "AAPL", "action": "BUY", "quantity": 5, "price": 100.0}
+    pm.execute_orders([fill, fill])
+
+    keys = trades_to_params(pm.get_new_trades())[-1]
+    assert len(keys) == 2 and len(set(keys)) == 2 and all(keys)
+
+def test_empty_snapshot_deletes_positions_only_when_flat():
+    """Un PortfolioManager mai caricato non svuota la tabella portfolio; uno caricato e chiuso sì."""
+    def deletes(snapshot):
+        return any(sql == SQL_DELETE_CLOSED_POSITIONS for sql, _, _ in portfolio_save_statements(snapshot))
+
+    assert not deletes(PortfolioManager().get_snapshot())
+
+    loaded = PortfolioManager()
+    loaded.load_from_db({"portfolio": pd.DataFrame([{"ticker": "AAPL", "size": 5, "price": 100.0}]),
+                         "cash": pd.DataFrame([{"cash": 0.0, "currency": "EUR"}])})
+    loaded.execute_orders([{"ticker": "AAPL", "action": "SELL", "quantity": 5, "price": 110.0}])
+    assert deletes(loaded.get_snapshot())
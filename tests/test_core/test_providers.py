@@ -0,0 +1,54 @@
+import pytest
+import pandas as pd
+from datetime import date
+from src.providers import get_provider, LocalFilesProvider, YahooProvider
+from config.config import config
+from src.fetch_planner import plan_fetches
+
+
+@pytest.fixture
+def market_dir(tmp_path):
+    """Cartella di dati registrati: AAPL in CSV (colonne stile Yahoo), MSFT in parquet via record()."""
+    pd.DataFrame({
+        "Date": ["2024-06-10", "2024-06-11", "2024-06-12"],
+        "Open": [100.0, 101.0, 102.0], "High": [105.0, 106.0, 107.0],
+        "Low": [95.0, 96.0, 97.0], "Close": [102.0, 103.0, 104.0], "Volume": [1000, 1100, 1200],
+    }).to_csv(tmp_path / "AAPL.csv", index=False)
+
+    LocalFilesProvider(root=tmp_path).record([
+        ("MSFT", date(2024, 6, 11), 300.0, 310.0, 290.0, 305.0, 500),
+        ("MSFT", date(2024, 6, 12), 305.0, 315.0, 295.0, 310.0, 600),
+    ])
+    return tmp_path
+
+
+def test_get_provider():
+    assert isinstance(get_provider("yahoo"), YahooProvider)
+    with pytest.raises(ValueError, match="non trovato"):
+        get_provider("bloomberg")
+
+
+def test_local_provider_range(market_dir):
+    """Stesso formato di Yahoo, finestra [start, end) con end esclusa."""
+    provider = get_provider("local", root=market_dir)
+    rows = provider.fetch_range(["AAPL", "MSFT"], date(2024, 6, 11), date(2024, 6, 12))
+
+    assert rows == [
+        ("AAPL", date(2024, 6, 11), 101.0, 106.0, 96.0, 103.0, 1100),
+        ("MSFT", date(2024, 6, 11), 300.0, 310.0, 290.0, 305.0, 500),
+    ]
+
+
+def test_local_provider_replays_a_plan(market_dir, monkeypatch):
+    """Il piano di fetch gira offline; i ticker senza file risultano falliti."""
+    monkeypatch.setattr(config, "FETCH_MAX_RETRIES", 0)
+    provider = LocalFilesProvider(root=market_dir)
+    plan = plan_fetches(["AAPL", "MSFT", "NVDA"], {"AAPL": date(2024, 6, 10)},
+                        end_date=date(2024, 6, 13), history_days=30)
+
+    rows = provider.fetch_plan(plan)
+    assert sorted({(r[0], r[1]) for r in rows}) == [
+        ("AAPL", date(2024, 6, 10)), ("AAPL", date(2024, 6, 11)), ("AAPL", date(2024, 6, 12)),
+        ("MSFT", date(2024, 6, 11)), ("MSFT", date(2024, 6, 12)),
+    ]
+    assert provider.failed_tickers() == ["NVDA"]
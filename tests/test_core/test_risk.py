@@ -1,6 +1,6 @@
 import pytest
 import pandas as pd
-from src.risk_manager import RiskManager
+from src.risk_manager import RiskManager, intraday_exits, position_exit_orders
 
 def test_risk_buy_logic(market_uptrend):
     """Verifica calcolo Size e Stop Loss per un ordine BUY."""
@@ -80,4 +80,105 @@ def test_risk_sell_logic():
     assert len(orders) == 1
     assert orders[0]['action'] == "SELL"
     assert orders[0]['quantity'] == 50 # Vende tutto
-    
\ No newline at end of file
+    
+def test_risk_vectorized_matches_sequential_sizing():
+    """Sizing vettoriale = loop sequenziale di riferimento (cassa consumata nell'ordine dei segnali)."""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    n = 500
+    signals_df = pd.DataFrame({
+        "ticker": [f"T{i}" for i in range(n)],
+        "signal": "BUY",
+        "price": rng.uniform(5, 500, n).round(2),
+        "atr": rng.uniform(-1, 20, n).round(2),
+        "meta": [{}] * n,
+    })
+    rm = RiskManager(risk_per_trade=0.01, stop_atr_multiplier=2.0)
+    orders = rm.evaluate(signals_df, 100000, 60000, {"T3": 10})
+
+    # Riferimento: la vecchia logica riga per riga
+    expected, cash = [], 60000.0
+    for row in signals_df.itertuples():
+        if row.ticker == "T3" or not row.atr > 0 or row.price - 2 * row.atr <= 0:
+            continue
+        shares = int(np.floor(1000 / (2 * row.atr)))
+        if shares * row.price > cash:
+            shares = int(np.floor(cash / row.price))
+        if shares < 1:
+            continue
+        expected.append((row.ticker, shares))
+        cash -= shares * row.price
+
+    assert [(o["ticker"], o["quantity"]) for o in orders] == expected
+
+def test_risk_sell_frees_cash_for_buys():
+    """La cassa delle vendite finanzia gli acquisti; il dizionario posizioni del chiamante resta intatto."""
+    rm = RiskManager(risk_per_trade=0.02, stop_atr_multiplier=2.0)
+    signals_df = pd.DataFrame([
+        {"ticker": "OLD", "signal": "SELL", "price": 100.0, "atr": 2.0, "meta": "exit"},
+        {"ticker": "NEW", "signal": "BUY", "price": 100.0, "atr": 5.0, "meta": {}},
+    ])
+    positions = {"OLD": 10}
+
+    orders = rm.evaluate(signals_df, total_equity=10000, available_cash=500, current_positions=positions)
+
+    assert [(o["action"], o["ticker"], o["quantity"]) for o in orders] == [("SELL", "OLD", 10), ("BUY", "NEW", 15)]
+    assert orders[0]["reason"] == "exit"
+    assert positions == {"OLD": 10}
+
+def test_intraday_exits_gap_and_priority():
+    """Gap sotto lo stop -> uscita all'Open; stop prioritario sul target; livelli NaN ignorati."""
+    nan = float("nan")
+    mask, prices, reasons = intraday_exits(
+        stop_loss=[95.0, 95.0, nan, 95.0, 95.0],
+        take_profit=[120.0, 120.0, 110.0, nan, 105.0],
+        open_=[90.0, 100.0, 112.0, 100.0, 100.0],
+        high=[92.0, 101.0, 115.0, 130.0, 106.0],
+        low=[88.0, 94.0, 111.0, 99.0, 94.0],
+    )
+
+    assert mask.tolist() == [True, True, True, False, True]
+    assert prices[[0, 1, 2, 4]].tolist() == [90.0, 95.0, 112.0, 95.0]
+    assert [reasons[i] for i in (0, 1, 2, 4)] == ["STOP_LOSS_GAP", "STOP_LOSS", "TAKE_PROFIT", "STOP_LOSS"]
+
+def test_position_exit_orders_skips_missing_bars():
+    bars = pd.DataFrame({"open": [100.0], "high": [101.0], "low": [90.0]}, index=["A"])
+    orders = position_exit_orders(["A", "B"], [7, 3], [95.0, None], [None, 50.0], bars)
+
+    assert orders == [{"ticker": "A", "action": "SELL", "reason": "STOP_LOSS", "quantity": 7, "price": 95.0}]
+
+def test_position_exit_orders_skips_invalid_quantities():
+    bars = pd.DataFrame({"open": [100.0] * 3, "high": [101.0] * 3, "low": [90.0] * 3}, index=["A", "B", "C"])
+    orders = position_exit_orders(["A", "B", "C"], [None, 0, 4], [95.0] * 3, [None] * 3, bars)
+
+    assert [(o["ticker"], o["quantity"]) for o in orders] == [("C", 4)]
+
+def test_risk_sizing_leaves_room_for_fees():
+    """Con le commissioni la size si riduce quanto basta: l'esecuzione non rifiuta l'ultimo ordine."""
+    from src.portfolio_manager import PortfolioManager, FeeModel, ORDER_FILLED
+    fee_model = FeeModel(fixed=2.0, percentage=0.001)
+    rm = RiskManager(risk_per_trade=0.05, stop_atr_multiplier=1.0)
+    signals_df = pd.DataFrame([
+        {"ticker": "A", "signal": "BUY", "price": 100.0, "atr": 1.0, "meta": {}},
+        {"ticker": "B", "signal": "BUY", "price": 50.0, "atr": 1.0, "meta": {}},
+    ])
+
+    pm = PortfolioManager()
+    pm.update_cash(1000.0)
+    orders = rm.evaluate(signals_df, 10000, pm.cash, {}, fee_model=fee_model)
+
+    assert [(o["ticker"], o["quantity"]) for o in orders] == [("A", 9), ("B", 1)]
+    assert all(r["status"] == ORDER_FILLED for r in pm.execute_orders(orders, fee_model))
+    assert pm.cash >= 0
+
+def test_fit_to_cash_stops_when_cash_runs_out():
+    """A cassa finita gli ordini restanti si azzerano in blocco; il risultato resta quello sequenziale."""
+    import numpy as np
+    n = 10_000
+    shares = np.full(n, 10, dtype=np.int64)
+    prices = np.full(n, 100.0)
+    fitted = RiskManager._fit_to_cash(shares, prices, 2550.0)
+
+    assert fitted[:2].tolist() == [10, 10] and fitted[2] == 5
+    assert not fitted[3:].any()
+    assert shares.tolist() == [10] * n  # input non modificato
@@ -1,9 +1,13 @@
+import os
 import pytest
+import numpy as np
 import pandas as pd
+from datetime import date, timedelta
 from unittest.mock import patch, MagicMock
-from src.yfinance_manager import YFinanceManager
+from src.providers import YahooProvider
+from src.providers.download_cache import DownloadCache
 
-@patch('src.yfinance_manager.yf.download')
+@patch('src.providers.yahoo.yf.download')
 def test_fetch_ohlc_success(mock_download):
     """
     Testa che i dati grezzi di yfinance vengano normalizzati correttamente.
@@ -23,7 +27,7 @@ def test_fetch_ohlc_success(mock_download):
     mock_download.return_value = mock_df
 
     # 2. ESECUZIONE
-    yf = YFinanceManager()
+    yf = YahooProvider()
     result = yf.fetch_ohlc(["AAPL"], days=5)
 
     # 3. VERIFICA
@@ -35,12 +39,70 @@ def test_fetch_ohlc_success(mock_download):
     assert row[3] == 105.0 # High
     assert row[6] == 1000  # Volume
 
-@patch('src.yfinance_manager.yf.download')
+@patch('src.providers.yahoo.yf.download')
 def test_fetch_ohlc_empty(mock_download):
     """Testa la gestione di nessun dato."""
     mock_download.return_value = pd.DataFrame()
     
-    yf = YFinanceManager()
+    yf = YahooProvider()
     result = yf.fetch_ohlc(["AAPL"])
     
-    assert result == []
\ No newline at end of file
+    assert result == []
+
+def test_normalize_frame_multi_ticker():
+    """Reshape colonnare: righe per ticker/data, candele mancanti scartate, volume ripulito."""
+    idx = pd.date_range("2024-01-01", periods=3, name="Date")
+    cols = pd.MultiIndex.from_product([["AAPL", "MSFT"], ["Open", "High", "Low", "Close", "Volume"]])
+    data = pd.DataFrame(np.arange(30, dtype=float).reshape(3, 10), index=idx, columns=cols)
+    data.loc[idx[1], ("MSFT", "Close")] = np.nan
+    data.loc[idx[0], ("AAPL", "Volume")] = np.inf
+
+    df = YahooProvider()._normalize_frame(data, ["AAPL", "MSFT"])
+
+    assert list(zip(df["ticker"], df["date"].dt.day)) == [
+        ("AAPL", 1), ("AAPL", 2), ("AAPL", 3), ("MSFT", 1), ("MSFT", 3)
+    ]
+    assert df["volume"].dtype == "int64"
+    assert df.iloc[0]["volume"] == 0
+    assert df.iloc[3]["close"] == 8.0
+
+@patch('src.providers.yahoo.yf.download')
+def test_download_cache_serves_reruns(mock_download, tmp_path):
+    """Stesso download ripetuto: servito dal disco. Storico consolidato permanente, recente con TTL."""
+    mock_df = pd.DataFrame(
+        {'Open': [100.0], 'High': [105.0], 'Low': [95.0], 'Close': [102.0], 'Volume': [1000]},
+        index=pd.DatetimeIndex([pd.Timestamp("2024-01-02")], name="Date"),
+    )
+    mock_download.return_value = mock_df
+    yf = YahooProvider(cache=DownloadCache(root=tmp_path, ttl_seconds=60))
+
+    # Storico consolidato: una sola chiamata di rete, anche con ticker in ordine diverso
+    first = yf.download(["AAPL"], date(2024, 1, 1), date(2024, 1, 5))
+    again = yf.download(["AAPL", "AAPL"], date(2024, 1, 1), date(2024, 1, 5))
+    assert first == again and len(first) == 1
+    assert mock_download.call_count == 1
+
+    # Intervallo recente: dopo il TTL si riscarica
+    end = date.today()
+    yf.download(["AAPL"], end - timedelta(days=3), end)
+    for path in tmp_path.rglob("*.pkl"):
+        os.utime(path, (0, 0))
+    yf.download(["AAPL"], end - timedelta(days=3), end)
+    assert mock_download.call_count == 3
+
+def test_download_cache_evicts_old_entries(tmp_path):
+    """Anche lo storico consolidato scade dopo max_age_days e viene eliminato dal disco."""
+    frame = pd.DataFrame({"close": [1.0]})
+    cache = DownloadCache(root=tmp_path, max_age_days=30)
+    old_key = DownloadCache.key("yahoo", ["AAPL"], date(2024, 1, 1), date(2024, 1, 5))
+    cache.put(old_key, frame)
+    assert cache.get(old_key, date(2024, 1, 5)) is not None
+
+    for path in tmp_path.rglob("*.pkl"):
+        os.utime(path, (0, 0))
+    assert cache.get(old_key, date(2024, 1, 5)) is None
+
+    # Prima scrittura di una nuova istanza: le voci scadute spariscono
+    fresh = DownloadCache(root=tmp_path, max_age_days=30)
+    fresh.put(DownloadCache.key("yahoo", ["MSFT"], date(2024, 1, 1), date(2024, 1, 5)), frame)
+    assert len(list(tmp_path.rglob("*.pkl"))) == 1
@@ -35,4 +35,11 @@ def test_ema_sideways(strategy, market_sideways):
     validate_strategy_output(results)
     
     last_signal = results.iloc[-1]['signal']
-    assert last_signal in ["BUY", "SELL", "HOLD"]
\ No newline at end of file
+    assert last_signal in ["BUY", "SELL", "HOLD"]
+def test_ema_accepts_ticker_stream(strategy, market_uptrend):
+    """Stream di coppie (ticker, DataFrame), come da iter_ohlc_by_ticker: stesso output del dizionario"""
+    expected = strategy.compute(market_uptrend)
+    results = strategy.compute(iter(market_uptrend.items()))
+
+    validate_strategy_output(results)
+    assert results.drop(columns='meta').equals(expected.drop(columns='meta'))